@@ -0,0 +1,150 @@
+# semantic cache of the agent's answers
+# a new question is embedded and compared with the questions answered before; if one is similar
+# enough, and the pages its answer was drawn from have not been re-crawled or removed since, its
+# answer is shown straight away instead of running the agent again
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from storage import EMBEDDING_DIMENSIONS, ChunkStore
+
+# Candidates checked against the store per lookup, most similar first
+MAX_CANDIDATES = 3
+
+
+@dataclass
+class CachedAnswer:
+    id: int
+    question: str
+    answer: str
+    source_versions: Dict[str, str]
+    similarity: float
+
+
+class SemanticAnswerCache:
+    """
+    Answers by question embedding, in SQLite, searched in an in-memory matrix.
+
+    An entry records the version (ChunkStore.page_versions) of every page its answer used. A
+    hit is only served if those pages are unchanged, otherwise the entry is dropped. Entries
+    also expire after ttl seconds, since pages crawled later may answer the question better.
+    Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, path: str = "answer_cache.sqlite", threshold: float = 0.92,
+                 ttl: float = 7 * 24 * 3600, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.dimensions = dimensions
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists answers (
+                id integer primary key,
+                question text not null,
+                answer text not null,
+                source_versions text not null,
+                embedding blob not null,
+                created_at real not null
+            )
+        """)
+        self.conn.execute("delete from answers where created_at < ?", (time.time() - ttl,))
+        self.conn.commit()
+
+        rows = self.conn.execute("select id, embedding, created_at from answers order by id").fetchall()
+        self._ids: List[int] = [row[0] for row in rows]
+        self._created: List[float] = [row[2] for row in rows]
+        self._matrix = np.zeros((len(rows), dimensions), dtype=np.float32)
+        for i, row in enumerate(rows):
+            self._matrix[i] = np.frombuffer(row[1], dtype=np.float32)
+
+    def _normalized(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _candidates(self, embedding: List[float]) -> List[tuple]:
+        """(id, similarity) of unexpired entries above the threshold, most similar first."""
+        with self._lock:
+            if not self._ids:
+                return []
+            scores = self._matrix @ self._normalized(embedding)
+            order = np.argsort(-scores)[:MAX_CANDIDATES]
+            oldest = time.time() - self.ttl
+            return [(self._ids[i], float(scores[i])) for i in order
+                    if scores[i] >= self.threshold and self._created[i] >= oldest]
+
+    def lookup(self, embedding: List[float], store: ChunkStore) -> Optional[CachedAnswer]:
+        """
+        The cached answer to the most similar earlier question, if it is still valid.
+
+        Args:
+            embedding: Embedding of the new question
+            store: Chunk store the answers were drawn from, to check their pages are unchanged
+
+        Returns:
+            The cached answer, or None on a miss.
+        """
+        for answer_id, similarity in self._candidates(embedding):
+            with self._lock:
+                row = self.conn.execute(
+                    "select question, answer, source_versions from answers where id = ?", (answer_id,)
+                ).fetchone()
+            if row is None:
+                continue
+            source_versions = json.loads(row[2])
+            if store.page_versions(list(source_versions)) != source_versions:
+                # A page the answer was drawn from was re-crawled or removed
+                self.remove(answer_id)
+                self.invalidated += 1
+                continue
+            self.hits += 1
+            return CachedAnswer(answer_id, row[0], row[1], source_versions, similarity)
+        self.misses += 1
+        return None
+
+    def add(self, question: str, embedding: List[float], answer: str, source_versions: Dict[str, str]):
+        """Cache an answer with the versions of the pages it was drawn from."""
+        vector = self._normalized(embedding)
+        created_at = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "insert into answers (question, answer, source_versions, embedding, created_at) "
+                "values (?, ?, ?, ?, ?)",
+                (question, answer, json.dumps(source_versions), vector.tobytes(), created_at)
+            )
+            self.conn.commit()
+            self._ids.append(cursor.lastrowid)
+            self._created.append(created_at)
+            self._matrix = np.vstack([self._matrix, vector[None, :]])
+
+    def remove(self, answer_id: int):
+        with self._lock:
+            self.conn.execute("delete from answers where id = ?", (answer_id,))
+            self.conn.commit()
+            if answer_id in self._ids:
+                i = self._ids.index(answer_id)
+                del self._ids[i]
+                del self._created[i]
+                self._matrix = np.delete(self._matrix, i, axis=0)
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = f" ({self.hits / lookups:.0%} hit rate)" if lookups else ""
+        return (f"Answer cache: {self.hits} hits, {self.misses} misses{rate}, "
+                f"{self.invalidated} invalidated, {len(self._ids)} answers")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,99 @@
+# benchmark of the character-budget chunker against the token-aware chunker
+# run from the repository root: python -m benchmarks.bench_chunking [markdown files...]
+# without arguments a synthetic article with headings, paragraphs and code fences is used
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import List
+
+from chunking import EMBEDDING_ENCODING, chunk_text, get_encoding, iter_token_chunks
+
+WORDS = ("rimon school torah learning community student parent teacher lesson class "
+         "program event campus holiday prayer study history values leadership").split()
+
+
+class EncodingUnavailable(Exception):
+    """tiktoken's BPE file is neither cached nor downloadable (a sandbox without network)."""
+
+
+def load_encoding():
+    """The embedding tokenizer, or EncodingUnavailable saying how to make it available offline."""
+    try:
+        return get_encoding()
+    except ImportError:
+        raise
+    except Exception as e:
+        raise EncodingUnavailable(
+            f"tiktoken could not load {EMBEDDING_ENCODING} ({type(e).__name__}); it is downloaded on "
+            f"first use, so run once with network access or point TIKTOKEN_CACHE_DIR at a cache that has it"
+        ) from e
+
+
+def synthetic_markdown(sections: int = 200, seed: int = 0) -> str:
+    """Markdown article with a mix of headings, paragraphs, lists and code fences."""
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25))).capitalize() + "."
+
+    parts: List[str] = ["# Synthetic article"]
+    for section in range(sections):
+        parts.append(f"## Section {section}")
+        for _ in range(rng.randint(1, 5)):
+            parts.append(" ".join(sentence() for _ in range(rng.randint(2, 8))))
+        if rng.random() < 0.3:
+            parts.append("\n".join(f"- {sentence()}" for _ in range(rng.randint(2, 6))))
+        if rng.random() < 0.2:
+            code = "\n".join(f"value_{i} = {rng.randint(0, 999)}" for i in range(rng.randint(3, 30)))
+            parts.append(f"```python\n{code}\n```")
+    return "\n\n".join(parts)
+
+
+def report(name: str, chunks: List[str], seconds: float, encoding):
+    counts = [len(encoding.encode(chunk)) for chunk in chunks]
+    spread = statistics.pstdev(counts) if counts else 0.0
+    print(f"{name:<18} {len(chunks):>7} {statistics.mean(counts) if counts else 0:>10.0f} "
+          f"{spread:>9.0f} {max(counts, default=0):>9} {seconds * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunk_text and iter_token_chunks")
+    parser.add_argument("files", nargs="*", help="Markdown files to chunk (default: synthetic article)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="chunk_text size in characters")
+    parser.add_argument("--max-tokens", type=int, default=1200)
+    parser.add_argument("--overlap-tokens", type=int, default=120)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per chunker; the fastest is reported")
+    args = parser.parse_args()
+
+    texts = []
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    if not texts:
+        texts = [synthetic_markdown()]
+
+    try:
+        encoding = load_encoding()
+    except EncodingUnavailable as e:
+        sys.exit(f"Cannot count tokens: {e}")
+    print(f"{sum(len(text) for text in texts)} characters in {len(texts)} document(s)")
+    print(f"{'chunker':<18} {'chunks':>7} {'mean tok':>10} {'stdev':>9} {'max tok':>9} {'ms':>10}")
+
+    chunkers = {
+        "chunk_text": lambda text: chunk_text(text, args.chunk_size),
+        "iter_token_chunks": lambda text: list(iter_token_chunks(text, args.max_tokens, args.overlap_tokens)),
+    }
+    for name, chunker in chunkers.items():
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            chunks = [chunk for text in texts for chunk in chunker(text)]
+            best = min(best, time.perf_counter() - start)
+        report(name, chunks, best, encoding)
+
+
+if __name__ == "__main__":
+    main()
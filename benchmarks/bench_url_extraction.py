@@ -0,0 +1,90 @@
+# benchmark of url_extraction.extract_all_urls against the previous multi-pass implementation
+# run from the repository root: python -m benchmarks.bench_url_extraction [apify_export.json]
+# without an export, synthetic posts are used; both implementations must give identical output
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from benchmarks.run_benchmarks import synthetic_posts
+from url_extraction import (clean_url, extract_all_urls, extract_image_info, find_urls_in_text,
+                            find_value_in_dict, get_post_date, get_profiles)
+
+
+def multi_pass_extract_all_urls(item: Dict[str, Any]):
+    """The previous extract_all_urls: one walk of the item per key, kept here as the reference."""
+    facebook_urls = []
+    external_urls = []
+    profiles = get_profiles(item)
+    images = extract_image_info(item)
+    post_date = get_post_date(item)
+
+    all_urls = []
+    for key in ['url', 'link', 'uri', 'href', 'profileUrl']:
+        all_urls.extend(find_value_in_dict(item, key))
+    for text in find_value_in_dict(item, 'text'):
+        all_urls.extend(find_urls_in_text(text))
+
+    metadata = {
+        'date': post_date,
+        'title': find_value_in_dict(item, 'title')[0] if find_value_in_dict(item, 'title') else None,
+        'description': find_value_in_dict(item, 'previewDescription')[0]
+        if find_value_in_dict(item, 'previewDescription') else None
+    }
+    metadata.update(profiles)
+    if images:
+        metadata['images'] = images
+
+    seen_urls = set()
+    for url in all_urls:
+        if url and isinstance(url, str) and url.startswith('http'):
+            cleaned_url = clean_url(url)
+            if cleaned_url not in seen_urls:
+                seen_urls.add(cleaned_url)
+                url_data = {'url': cleaned_url, **metadata}
+                if 'facebook.com' in cleaned_url:
+                    facebook_urls.append(url_data)
+                else:
+                    external_urls.append(url_data)
+    return facebook_urls, external_urls
+
+
+def time_extraction(extract, items: List[Dict[str, Any]], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            extract(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare single-pass and multi-pass URL extraction")
+    parser.add_argument("export", nargs="?", help="Apify JSON export (default: synthetic posts)")
+    parser.add_argument("--posts", type=int, default=5000, help="Number of synthetic posts")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per implementation; the fastest is reported")
+    args = parser.parse_args()
+
+    if args.export:
+        with open(args.export, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        items = items if isinstance(items, list) else [items]
+    else:
+        items = synthetic_posts(args.posts)
+
+    for item in items:
+        if extract_all_urls(item) != multi_pass_extract_all_urls(item):
+            raise SystemExit(f"Output differs for item: {json.dumps(item)[:200]}")
+
+    multi_pass = time_extraction(multi_pass_extract_all_urls, items, args.repeat)
+    single_pass = time_extraction(extract_all_urls, items, args.repeat)
+    print(f"{len(items)} items, identical output")
+    print(f"multi-pass:  {multi_pass * 1000:8.1f} ms ({len(items) / multi_pass:,.0f} items/s)")
+    print(f"single-pass: {single_pass * 1000:8.1f} ms ({len(items) / single_pass:,.0f} items/s)")
+    print(f"speedup:     {multi_pass / single_pass:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
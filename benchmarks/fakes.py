@@ -0,0 +1,302 @@
+# local stand-ins for the services the pipeline and the agent talk to
+# FakeOpenAIServer answers the embeddings and chat completions endpoints with deterministic
+# results, MemoryStore replaces the Supabase table and match RPC, and StaticPageServer serves
+# synthetic articles; each can add latency so benchmarks see realistic waiting
+
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from storage import EMBEDDING_DIMENSIONS, MATCH_COLUMNS, ChunkStore, page_versions
+
+
+def fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """Deterministic unit vector for a text, so identical texts get identical embeddings."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class _BackgroundServer:
+    """ThreadingHTTPServer running in a daemon thread on a free local port."""
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self):
+        handler = type("Handler", (self.handler_class,), {"server_state": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _OpenAIHandler(_QuietHandler):
+    def do_POST(self):
+        state: FakeOpenAIServer = self.server_state
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        wait = state.admit()
+        if wait is not None:
+            state.count("throttled")
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                           {"retry-after-ms": str(int(wait * 1000))})
+            return
+
+        if self.path.endswith("/embeddings"):
+            time.sleep(state.embedding_latency)
+            state.count("embeddings")
+            self.send_json(200, state.embeddings_response(body))
+        elif self.path.endswith("/chat/completions"):
+            time.sleep(state.chat_latency)
+            state.count("chat")
+            self.send_json(200, state.chat_response(body))
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+
+class FakeOpenAIServer(_BackgroundServer):
+    """
+    Embeddings and chat completions endpoints of the OpenAI API, served locally.
+
+    Embeddings are deterministic per input text. Chat answers are JSON objects with every
+    key the ingest prompts ask for. Requests beyond requests_per_second get a 429 with a
+    retry-after-ms header, like the real API.
+
+    Use with AsyncOpenAI(base_url=server.url + "/v1", api_key="fake").
+    """
+
+    handler_class = _OpenAIHandler
+
+    def __init__(self, embedding_latency: float = 0.05, chat_latency: float = 0.3,
+                 requests_per_second: Optional[float] = None):
+        super().__init__()
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.requests_per_second = requests_per_second
+        self.requests: Dict[str, int] = {"embeddings": 0, "chat": 0, "throttled": 0}
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def count(self, kind: str):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def admit(self) -> Optional[float]:
+        """None if the request may proceed, else the seconds until the next free slot."""
+        if not self.requests_per_second:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if self._next_slot > now:
+                return self._next_slot - now
+            self._next_slot = max(self._next_slot, now) + 1 / self.requests_per_second
+            return None
+
+    def embeddings_response(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(text)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(text) // 4 + 1 for text in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def chat_response(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = "\n".join(message.get("content") or "" for message in body.get("messages", []))
+        chunk_count = len(re.findall(r"^Chunk \d+:", prompt, re.MULTILINE))
+        heading = re.search(r"^#+\s*(.+)$", prompt, re.MULTILINE)
+        title = heading.group(1).strip() if heading else "Untitled"
+        answer = {
+            "title": title,
+            "author": "Fake Author",
+            "published_date": "2024-01-01",
+            "summary": f"Summary of {title}.",
+            "chunks": [{"index": i, "title": f"Part {i}", "summary": f"Summary of part {i}."}
+                       for i in range(chunk_count)],
+        }
+        tokens = len(prompt) // 4 + 1
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(answer)}}],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": 50, "total_tokens": tokens + 50},
+        }
+
+
+class _PageHandler(_QuietHandler):
+    def do_GET(self):
+        state: StaticPageServer = self.server_state
+        match = re.fullmatch(r"/articles/(\d+)", self.path)
+        if not match or int(match.group(1)) >= len(state.pages):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        time.sleep(state.latency)
+        payload = state.pages[int(match.group(1))].encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class StaticPageServer(_BackgroundServer):
+    """Serves server-rendered article pages at /articles/<n>."""
+
+    handler_class = _PageHandler
+
+    def __init__(self, pages: List[str], latency: float = 0.05):
+        super().__init__()
+        self.pages = pages
+        self.latency = latency
+
+    def urls(self) -> List[str]:
+        return [f"{self.url}/articles/{i}" for i in range(len(self.pages))]
+
+
+class MemoryStore(ChunkStore):
+    """
+    In-memory stand-in for the Supabase table and match RPC.
+
+    Every call sleeps for latency seconds first, to stand in for the network round trip
+    to the database.
+    """
+
+    name = "memory"
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.rows: Dict[tuple, Dict[str, Any]] = {}
+        self._next_id = 1
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def upsert_chunks(self, rows: List[Dict[str, Any]]):
+        time.sleep(self.latency)
+        with self._lock:
+            for row in rows:
+                key = (row["url"], row["chunk_number"])
+                existing = self.rows.get(key)
+                stored = dict(row, id=existing["id"] if existing else self._next_id)
+                stored["embedding"] = np.asarray(row["embedding"], dtype=np.float32)
+                if existing is None:
+                    self._next_id += 1
+                self.rows[key] = stored
+            self.version += 1
+
+    def delete_chunks(self, url: str, from_chunk: int = 0):
+        time.sleep(self.latency)
+        with self._lock:
+            for key in [key for key in self.rows if key[0] == url and key[1] >= from_chunk]:
+                del self.rows[key]
+            self.version += 1
+
+    def update_metadata(self, url: str, updates: Dict[str, Any]):
+        time.sleep(self.latency)
+        with self._lock:
+            for key, row in self.rows.items():
+                if key[0] == url:
+                    row["metadata"] = {**(row.get("metadata") or {}), **updates}
+            self.version += 1
+
+    def match_chunks(self, query_embedding: List[float], match_count: int = 5,
+                     filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        with self._lock:
+            rows = [row for row in self.rows.values()
+                    if all((row.get("metadata") or {}).get(k) == v for k, v in (filter or {}).items())]
+        if not rows:
+            return []
+        matrix = np.stack([row["embedding"] for row in rows])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        top = np.argsort(-scores)[:match_count]
+        return [dict({column: rows[i].get(column) for column in MATCH_COLUMNS}, similarity=float(scores[i]))
+                for i in top]
+
+    def list_urls(self) -> List[str]:
+        time.sleep(self.latency)
+        with self._lock:
+            return sorted(set(key[0] for key in self.rows))
+
+    def list_documents(self, limit: Optional[int] = None, offset: int = 0,
+                       search: Optional[str] = None) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        documents: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for key, row in sorted(self.rows.items()):
+                metadata = row.get("metadata") or {}
+                document = documents.setdefault(key[0], {
+                    "url": key[0], "title": row["title"], "author": metadata.get("author"),
+                    "published_date": metadata.get("published_date"), "chunk_count": 0, "crawled_at": None,
+                })
+                document["chunk_count"] += 1
+                document["crawled_at"] = max(document["crawled_at"] or "", metadata.get("crawled_at") or "") or None
+        needle = (search or "").casefold()
+        matches = [document for document in documents.values()
+                   if any(needle in (document[column] or "").casefold() for column in ("url", "title", "author"))]
+        return matches[offset:] if limit is None else matches[offset:offset + limit]
+
+    def catalog_version(self) -> str:
+        time.sleep(self.latency)
+        return str(self.version)
+
+    def get_page_chunks(self, url: str, from_chunk: int = 0,
+                        to_chunk: Optional[int] = None) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        with self._lock:
+            rows = sorted((row for key, row in self.rows.items() if key[0] == url and key[1] >= from_chunk
+                           and (to_chunk is None or key[1] <= to_chunk)),
+                          key=lambda row: row["chunk_number"])
+        return [{column: row[column] for column in ("title", "content", "chunk_number", "url")} for row in rows]
+
+    def page_versions(self, urls: List[str]) -> Dict[str, str]:
+        time.sleep(self.latency)
+        wanted = set(urls)
+        with self._lock:
+            rows = [{"url": row["url"], "chunk_number": row["chunk_number"],
+                     "crawled_at": (row.get("metadata") or {}).get("crawled_at")}
+                    for key, row in self.rows.items() if key[0] in wanted]
+        return page_versions(rows)
@@ -0,0 +1,292 @@
+# offline benchmark suite for the ingest pipeline and the agent tools
+# run from the repository root: python -m benchmarks.run_benchmarks [--output results.json] [--baseline old.json]
+# OpenAI, Supabase and the crawled sites are replaced by the local fakes in benchmarks/fakes.py,
+# so no API keys or network access are needed; a benchmark whose dependencies are not installed
+# (or, for token counting, tiktoken's encoding is not cached) is reported as skipped
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+import types
+from typing import Any, Callable, Dict, List
+
+from benchmarks.bench_chunking import EncodingUnavailable, load_encoding, synthetic_markdown
+from benchmarks.fakes import FakeOpenAIServer, MemoryStore, StaticPageServer
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+class BenchmarkSkipped(Exception):
+    """A benchmark that cannot run in this environment; the message says why."""
+
+
+def best_of(func: Callable[[], Any], repeat: int) -> float:
+    """Fastest of repeat runs of func, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def markdown_to_html(markdown: str) -> str:
+    """Server-rendered article page for the static page server."""
+    blocks = []
+    for block in markdown.split("\n\n"):
+        heading = re.match(r"^(#+)\s+(.*)$", block)
+        if heading:
+            level = len(heading.group(1))
+            blocks.append(f"<h{level}>{heading.group(2)}</h{level}>")
+        elif block.startswith("```"):
+            blocks.append(f"<pre><code>{block.strip('`').strip()}</code></pre>")
+        else:
+            blocks.append(f"<p>{block}</p>")
+    return f"<html><head><title>Article</title></head><body><article>{''.join(blocks)}</article></body></html>"
+
+
+def html_to_markdown(html: str) -> str:
+    """Inverse of markdown_to_html, standing in for crawl4ai's browser-dependent conversion."""
+    article = re.search(r"<article>(.*)</article>", html, re.DOTALL).group(1)
+    article = re.sub(r"<h(\d)>(.*?)</h\1>", lambda m: "#" * int(m.group(1)) + " " + m.group(2) + "\n\n", article)
+    article = re.sub(r"<pre><code>(.*?)</code></pre>", r"```\n\1\n```\n\n", article, flags=re.DOTALL)
+    article = re.sub(r"</p>", "\n\n", article)
+    return TAG_PATTERN.sub("", article).strip()
+
+
+def synthetic_posts(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Facebook group posts shaped like the Apify export that url_extraction reads."""
+    rng = random.Random(seed)
+    sites = ["https://www.example-news.com", "https://jewishjournal.example.org", "https://www.facebook.com"]
+    posts = []
+    for i in range(count):
+        site = rng.choice(sites)
+        post = {
+            "url": f"https://www.facebook.com/groups/1/posts/{i}",
+            "time": f"2024-01-{i % 28 + 1:02d}T10:00:00.000Z",
+            "user": {"name": f"User {i % 50}", "profileUrl": f"https://www.facebook.com/user/{i % 50}"},
+            "text": f"Worth reading {site}/story/{i}?utm_source=fb and comments",
+            "link": f"{site}/story/{i}?fbclid=abc{i}",
+            "title": f"Story {i}",
+            "previewDescription": "A story about the community",
+            "media": [{"__typename": "Photo", "url": f"https://www.facebook.com/photo.php?fbid={i}",
+                       "photo_image": {"uri": f"https://scontent.fbcdn.net/{i}.jpg", "width": 720, "height": 480},
+                       "ocrText": "image text"}],
+            "comments": [{"text": f"See also {site}/story/{i + 1}", "profileUrl": f"https://www.facebook.com/user/{j}"}
+                         for j in range(rng.randint(0, 5))],
+        }
+        if rng.random() < 0.3:
+            post["sharedPost"] = {"url": f"{site}/shared/{i}", "time": post["time"],
+                                  "pageName": {"name": "Example News"}, "media": post["media"]}
+        posts.append(post)
+    return posts
+
+
+def bench_chunk_text(args) -> Dict[str, Any]:
+    from chunking import chunk_text
+
+    documents = [synthetic_markdown(sections=100, seed=seed) for seed in range(20)]
+    characters = sum(len(document) for document in documents)
+    seconds = best_of(lambda: [chunk_text(document) for document in documents], args.repeat)
+    return {"seconds": seconds, "documents": len(documents), "mb_per_second": characters / seconds / 1e6}
+
+
+def bench_extract_all_urls(args) -> Dict[str, Any]:
+    from url_extraction import extract_all_urls
+
+    posts = synthetic_posts(2000)
+    seconds = best_of(lambda: [extract_all_urls(post) for post in posts], args.repeat)
+    return {"seconds": seconds, "posts": len(posts), "posts_per_second": len(posts) / seconds}
+
+
+async def _ingest(crawl, store: MemoryStore, urls: List[str]) -> Dict[str, Any]:
+    from ingest_pipeline import Stage, run_pipeline
+    from static_fetch import create_http_client, fetch_static
+
+    http_client = create_http_client(max_connections=10)
+
+    async def fetch(url: str):
+        page = await fetch_static(http_client, url)
+        return crawl.DocumentJob(url=url, markdown=html_to_markdown(page.html))
+
+    stages = [
+        Stage("fetch", fetch, concurrency=5),
+        Stage("chunk", crawl.chunk_document, concurrency=crawl.STAGE_CONCURRENCY["chunk"]),
+        Stage("summarize", functools.partial(crawl.summarize_document, mode="document"),
+              concurrency=crawl.STAGE_CONCURRENCY["summarize"]),
+        Stage("embed", crawl.embed_document, concurrency=crawl.STAGE_CONCURRENCY["embed"]),
+        Stage("store", crawl.store_document, concurrency=crawl.STAGE_CONCURRENCY["store"]),
+    ]
+    start = time.perf_counter()
+    try:
+        await run_pipeline(urls, stages, metrics=crawl.ingest_metrics)
+        await crawl.chunk_writer.flush()
+    finally:
+        await http_client.aclose()
+    seconds = time.perf_counter() - start
+
+    # Throughput of a run that dropped pages would look better than it is
+    failed = sum(stage.failed + stage.dropped for stage in stages)
+    if failed:
+        raise RuntimeError(f"{failed} pages failed to ingest (see the errors above)")
+    return {"seconds": seconds, "pages": len(urls), "chunks": len(store.rows),
+            "pages_per_second": len(urls) / seconds, "chunks_per_second": len(store.rows) / seconds}
+
+
+def bench_ingest(args, openai_server: FakeOpenAIServer, store: MemoryStore) -> Dict[str, Any]:
+    """Fetch, chunk, summarize, embed and store synthetic articles against the fakes."""
+    import crawl_rimon_docs as crawl
+    from bulk_writer import BulkUpsertWriter
+
+    # Chunking counts embedding tokens
+    try:
+        load_encoding()
+    except EncodingUnavailable as e:
+        raise BenchmarkSkipped(str(e)) from e
+
+    # The crawler's module-level store and writer are pointed at the in-memory table
+    crawl.chunk_store = store
+    crawl.chunk_writer = BulkUpsertWriter(store, metrics=crawl.ingest_metrics)
+
+    pages = [markdown_to_html(synthetic_markdown(sections=12, seed=seed)) for seed in range(args.pages)]
+    with StaticPageServer(pages, latency=args.page_latency) as page_server:
+        before = dict(openai_server.requests)
+        result = asyncio.run(_ingest(crawl, store, page_server.urls()))
+    result.update({f"openai_{kind}_requests": openai_server.requests[kind] - before[kind]
+                   for kind in openai_server.requests})
+    return result
+
+
+def bench_agent_tools(args, store: MemoryStore) -> Dict[str, Any]:
+    """Latency of the agent's tools against the fake OpenAI server and the in-memory table."""
+    from openai import AsyncOpenAI
+    from rimon_ai_expert import (PydanticAIDeps, document_catalog, get_page_content, list_documentation_pages,
+                                 page_cache, query_embedding_cache, retrieve_relevant_documentation)
+
+    if not store.rows:
+        raise BenchmarkSkipped("needs the store filled by the ingest benchmark, which did not run")
+    url = store.list_urls()[0]
+
+    async def run() -> Dict[str, List[float]]:
+        ctx = types.SimpleNamespace(deps=PydanticAIDeps(store=store, openai_client=AsyncOpenAI()))
+        tools = {
+            "retrieve_relevant_documentation": lambda: retrieve_relevant_documentation(ctx, "community history"),
+            "list_documentation_pages": lambda: list_documentation_pages(ctx),
+            "get_page_content": lambda: get_page_content(ctx, url),
+            "get_page_content_window": lambda: get_page_content(ctx, url, around_chunk=1),
+        }
+        timings = {name: [] for name in tools}
+        for _ in range(args.tool_calls):
+            for name, call in tools.items():
+                start = time.perf_counter()
+                await call()
+                timings[name].append(time.perf_counter() - start)
+        return timings
+
+    query_embedding_cache.clear()
+    document_catalog.clear()
+    page_cache.clear()
+    timings = asyncio.run(run())
+    result: Dict[str, Any] = {"seconds": sum(statistics.mean(values) for values in timings.values())}
+    result["query_embedding_cache_hit_rate"] = query_embedding_cache.hit_rate
+    result["document_catalog_reloads"] = document_catalog.reloads
+    result["page_cache_hit_rate"] = page_cache.hit_rate
+    for name, values in timings.items():
+        result[f"{name}_p50_ms"] = percentile(values, 0.5) * 1000
+        result[f"{name}_p95_ms"] = percentile(values, 0.95) * 1000
+    return result
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Benchmarks that got slower than baseline by more than tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name, {}).get("seconds")
+        after = result.get("seconds")
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"{name}: {after:.4f}s vs {before:.4f}s baseline (+{after / before - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks")
+    parser.add_argument("--only", nargs="*", help="Benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each micro-benchmark; the fastest counts")
+    parser.add_argument("--pages", type=int, default=40, help="Articles ingested by the ingest benchmark")
+    parser.add_argument("--tool-calls", type=int, default=20, help="Calls of each agent tool")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Fake embeddings latency (s)")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Fake chat completions latency (s)")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Fake OpenAI requests per second")
+    parser.add_argument("--store-latency", type=float, default=0.02, help="Fake database round trip (s)")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Fake page server latency (s)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline before a benchmark counts as a regression")
+    args = parser.parse_args()
+
+    # Per-request client logs would drown the results
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix="rimon-bench-")
+    store = MemoryStore(latency=args.store_latency)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    with FakeOpenAIServer(args.embedding_latency, args.chat_latency, args.rate_limit) as openai_server:
+        # Everything the crawler and the agent read from the environment points at the fakes
+        os.environ.update({
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": openai_server.url + "/v1",
+            "STORAGE_BACKEND": "local",
+            "LOCAL_STORE_PATH": os.path.join(workdir, "rimon_pages.sqlite"),
+            "INGEST_CACHE_PATH": os.path.join(workdir, "ingest_cache.sqlite"),
+        })
+        benchmarks = {
+            "chunk_text": lambda: bench_chunk_text(args),
+            "extract_all_urls": lambda: bench_extract_all_urls(args),
+            "ingest": lambda: bench_ingest(args, openai_server, store),
+            "agent_tools": lambda: bench_agent_tools(args, store),
+        }
+        for name, benchmark in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"Running {name}...")
+            try:
+                results[name] = benchmark()
+            except ImportError as e:
+                results[name] = {"skipped": f"missing dependency: {e}"}
+            except BenchmarkSkipped as e:
+                results[name] = {"skipped": str(e)}
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"  {json.dumps(results[name], default=str)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
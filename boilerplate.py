@@ -0,0 +1,219 @@
+# boilerplate and paywall-stub stripping for crawled pages
+# navigation menus, cookie banners, newsletter prompts and related-article lists repeat across
+# the pages of a site; blocks seen on many pages of the same host are learned as that host's
+# template and removed before chunking, and pages left with only a paywall stub are flagged
+
+import hashlib
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import List, Set
+
+from chunking import iter_blocks
+from crawl_scheduler import host_of
+
+# Short blocks matching these are dropped on any site, before any template is learned
+BOILERPLATE_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"\b(we|this (site|website)) uses? cookies\b",
+        r"\baccept (all )?cookies\b",
+        r"\bsign up for (our|the) newsletter\b",
+        r"\bsubscribe to (our|the) newsletter\b",
+        r"^#*\s*(related (articles|posts|stories)|read more|more stories|you may also like|share this( article)?)\s*:?$",
+        r"^advertisement$",
+        r"^skip to (main )?content$",
+    )
+]
+BOILERPLATE_MAX_CHARS = 300
+
+# Phrases of subscription walls; a page that shows one and has little other text is a stub
+PAYWALL_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"\bsubscribe (now )?to (continue|keep) reading\b",
+        r"\b(already a subscriber|already have an account)\b",
+        r"\b(sign|log) in to (continue|read)\b",
+        r"\bthis (article|content|story) is (only available|reserved) (to|for) (subscribers|members)\b",
+        r"\bto continue reading\b",
+        r"\byou have reached your (free )?article limit\b",
+    )
+]
+PAYWALL_MAX_WORDS = 150
+
+MARKDOWN_LINK_PATTERN = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@dataclass
+class CleanedPage:
+    markdown: str
+    removed_blocks: int
+    removed_chars: int
+    paywalled: bool
+
+
+def block_hash(block: str) -> str:
+    """Hash of a block that ignores case and whitespace differences."""
+    normalized = WHITESPACE_PATTERN.sub(" ", block.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def is_link_list(block: str, min_links: int = 3, min_link_share: float = 0.7) -> bool:
+    """True for blocks that are mostly links, such as menus and related-article lists."""
+    links = MARKDOWN_LINK_PATTERN.findall(block)
+    if len(links) < min_links:
+        return False
+    text = MARKDOWN_LINK_PATTERN.sub("", block)
+    text = re.sub(r"[\s*\-|•·>#]+", "", text)
+    link_text = sum(len(link) for link in links)
+    return link_text / max(1, link_text + len(text)) >= min_link_share
+
+
+def is_generic_boilerplate(block: str) -> bool:
+    """True for short blocks that are boilerplate on any site."""
+    if len(block) > BOILERPLATE_MAX_CHARS:
+        return is_link_list(block)
+    text = block.strip()
+    return is_link_list(text) or any(pattern.search(text) for pattern in BOILERPLATE_PATTERNS)
+
+
+def is_paywall_stub(original: str, cleaned: str) -> bool:
+    """True if the page shows a subscription wall and has almost no text beyond it."""
+    if not any(pattern.search(original) for pattern in PAYWALL_PATTERNS):
+        return False
+    return len(MARKDOWN_LINK_PATTERN.sub(r"\1", cleaned).split()) <= PAYWALL_MAX_WORDS
+
+
+class BoilerplateStripper:
+    """
+    Learns each host's repeated blocks from its crawled pages and strips them.
+
+    A block counts as the host's template once it has appeared on at least min_pages
+    of its pages and on at least min_fraction of all pages seen from that host. Counts
+    are kept in SQLite and grow across runs; each URL is counted only once.
+
+    The first pages of a host are cleaned before its template can be learned, so they keep
+    their boilerplate. They are flagged, and early_urls lists them once their host has
+    enough pages, to be crawled again (crawl_rimon_docs.py --reclean).
+    """
+
+    def __init__(self, path: str = "boilerplate.sqlite", min_pages: int = 5, min_fraction: float = 0.3):
+        self.path = path
+        self.min_pages = min_pages
+        self.min_fraction = min_fraction
+        self.pages = 0
+        self.removed_blocks = 0
+        self.removed_chars = 0
+        self.paywalled = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists boilerplate_pages (
+                url text primary key,
+                host text not null,
+                early integer not null default 0
+            )
+        """)
+        # Databases created before pages were flagged
+        columns = [row[1] for row in self.conn.execute("pragma table_info(boilerplate_pages)")]
+        if "early" not in columns:
+            self.conn.execute("alter table boilerplate_pages add column early integer not null default 0")
+        self.conn.execute("""
+            create table if not exists boilerplate_blocks (
+                host text not null,
+                block_hash text not null,
+                page_count integer not null,
+                primary key (host, block_hash)
+            )
+        """)
+        self.conn.commit()
+
+    def _learn(self, url: str, host: str, hashes: Set[str]):
+        """Count the page's distinct blocks towards its host's template, once per URL."""
+        cursor = self.conn.execute(
+            "insert or ignore into boilerplate_pages (url, host) values (?, ?)", (url, host)
+        )
+        if cursor.rowcount:
+            self.conn.executemany(
+                "insert into boilerplate_blocks (host, block_hash, page_count) values (?, ?, 1) "
+                "on conflict (host, block_hash) do update set page_count = page_count + 1",
+                [(host, block) for block in hashes]
+            )
+        self.conn.commit()
+
+    def _host_pages(self, host: str) -> int:
+        return self.conn.execute("select count(*) from boilerplate_pages where host = ?", (host,)).fetchone()[0]
+
+    def _template(self, host: str, hashes: Set[str], host_pages: int) -> Set[str]:
+        """The subset of hashes that belong to the host's template."""
+        min_count = max(self.min_pages, self.min_fraction * host_pages)
+        template = set()
+        hashes = list(hashes)
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = self.conn.execute(
+                f"select block_hash from boilerplate_blocks where host = ? and page_count >= ? "
+                f"and block_hash in ({','.join('?' * len(batch))})",
+                [host, min_count, *batch]
+            ).fetchall()
+            template.update(row[0] for row in rows)
+        return template
+
+    def clean(self, url: str, markdown: str) -> CleanedPage:
+        """
+        Strip boilerplate from a crawled page and check whether it is only a paywall stub.
+
+        Args:
+            url: The page URL, whose host selects the template
+            markdown: The crawled page content
+
+        Returns:
+            CleanedPage: The remaining markdown, what was removed, and the paywall flag
+        """
+        blocks = [block for block, _ in iter_blocks(markdown)]
+        hashes = [block_hash(block) for block in blocks]
+        host = host_of(url)
+        self._learn(url, host, set(hashes))
+        host_pages = self._host_pages(host)
+        template = self._template(host, set(hashes), host_pages)
+        # Too few pages of the host yet for any block to count as its template
+        self.conn.execute("update boilerplate_pages set early = ? where url = ?",
+                          (host_pages < self.min_pages, url))
+        self.conn.commit()
+
+        kept: List[str] = []
+        removed_blocks = removed_chars = 0
+        for block, block_key in zip(blocks, hashes):
+            if block_key in template or is_generic_boilerplate(block):
+                removed_blocks += 1
+                removed_chars += len(block)
+            else:
+                kept.append(block)
+
+        cleaned = "\n\n".join(kept)
+        paywalled = is_paywall_stub(markdown, cleaned)
+        self.pages += 1
+        self.removed_blocks += removed_blocks
+        self.removed_chars += removed_chars
+        self.paywalled += paywalled
+        return CleanedPage(cleaned, removed_blocks, removed_chars, paywalled)
+
+    def early_urls(self) -> List[str]:
+        """Pages cleaned before their host's template could be learned, of hosts that now have enough pages."""
+        rows = self.conn.execute(
+            """
+            select url from boilerplate_pages
+            where early and host in (select host from boilerplate_pages group by host having count(*) >= ?)
+            order by rowid
+            """,
+            (self.min_pages,)
+        )
+        return [row[0] for row in rows]
+
+    def summary(self) -> str:
+        return (f"Boilerplate: {self.removed_blocks} blocks ({self.removed_chars} chars) removed "
+                f"from {self.pages} pages, {self.paywalled} paywall stubs")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,132 @@
+# buffered bulk writer for the chunk store
+# rows from all in-flight documents are collected and sent as multi-row upserts on the
+# store's unique key, so re-ingesting a page overwrites its rows instead of failing
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ingest_metrics import IngestMetrics
+from storage import ChunkStore
+
+
+@dataclass
+class BatchResult:
+    rows: int
+    bytes: int
+    seconds: float
+    error: Optional[str] = None
+
+
+class _PendingWrite:
+    """Tracks the rows of one write() call, which may be split across batches."""
+
+    def __init__(self, future: asyncio.Future, row_count: int):
+        self.future = future
+        self.remaining = row_count
+        self.ok = True
+
+    def row_done(self, ok: bool):
+        self.ok = self.ok and ok
+        self.remaining -= 1
+        if self.remaining == 0 and not self.future.done():
+            self.future.set_result(self.ok)
+
+
+class BulkUpsertWriter:
+    """
+    Collect rows from concurrent writers and upsert them in batches.
+
+    A batch is sent when it holds max_rows rows or max_bytes of JSON, or max_wait seconds
+    after its first row was queued. write() returns once all of its rows have been sent.
+    """
+
+    def __init__(self, store: ChunkStore, key_columns: Tuple[str, ...] = ("url", "chunk_number"),
+                 max_rows: int = 200, max_bytes: int = 4 * 1024 * 1024, max_wait: float = 0.5,
+                 metrics: Optional[IngestMetrics] = None):
+        self.store = store
+        self.metrics = metrics
+        self.key_columns = key_columns
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.results: List[BatchResult] = []
+        self._pending: List[Tuple[Dict[str, Any], int, _PendingWrite]] = []
+        self._pending_bytes = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = set()
+
+    async def write(self, rows: List[Dict[str, Any]]) -> bool:
+        """Queue rows for upsert and wait until they are written. Returns False if any batch failed."""
+        if not rows:
+            return True
+
+        loop = asyncio.get_running_loop()
+        pending_write = _PendingWrite(loop.create_future(), len(rows))
+        for row in rows:
+            size = len(json.dumps(row, default=str))
+            self._pending.append((row, size, pending_write))
+            self._pending_bytes += size
+            if len(self._pending) >= self.max_rows or self._pending_bytes >= self.max_bytes:
+                self._send_pending()
+
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._send_pending)
+
+        return await pending_write.future
+
+    async def flush(self):
+        """Send whatever is queued and wait for all in-flight batches to finish."""
+        self._send_pending()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def summary(self) -> str:
+        rows = sum(r.rows for r in self.results if r.error is None)
+        failed = sum(1 for r in self.results if r.error is not None)
+        return f"Upserted {rows} rows to {self.store.name} in {len(self.results)} batches ({failed} failed)"
+
+    def _send_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self._pending_bytes = 0
+        task = asyncio.ensure_future(self._send_batch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send_batch(self, batch: List[Tuple[Dict[str, Any], int, _PendingWrite]]):
+        # Postgres rejects an upsert that touches the same key twice, so keep the last row per key
+        rows_by_key = {}
+        for row, _, _ in batch:
+            rows_by_key[tuple(row[column] for column in self.key_columns)] = row
+        rows = list(rows_by_key.values())
+        batch_bytes = sum(size for _, size, _ in batch)
+
+        start = time.perf_counter()
+        error = None
+        try:
+            await asyncio.to_thread(self.store.upsert_chunks, rows)
+        except Exception as e:
+            error = str(e)
+
+        result = BatchResult(rows=len(rows), bytes=batch_bytes, seconds=time.perf_counter() - start, error=error)
+        self.results.append(result)
+        if self.metrics is not None:
+            outcome = "failed" if error else "ok"
+            self.metrics.observe("store_batch_seconds", result.seconds, outcome=outcome)
+            self.metrics.inc("store_rows_total", result.rows, outcome=outcome)
+            self.metrics.inc("store_bytes_total", result.bytes, outcome=outcome)
+        if error:
+            print(f"Error upserting batch of {result.rows} rows: {error}")
+        else:
+            print(f"Upserted batch of {result.rows} rows ({result.bytes / 1024:.0f} KB) in {result.seconds:.2f}s")
+
+        for _, _, pending_write in batch:
+            pending_write.row_done(error is None)
@@ -0,0 +1,239 @@
+# splitting crawled markdown into chunks for embedding
+# chunk_text is the original character-budget splitter; iter_token_chunks measures chunks in
+# embedding-model tokens, overlaps neighbouring chunks and keeps headings and code fences intact
+
+import re
+from typing import Iterator, List, Tuple
+
+# Tokenizer of text-embedding-3-small
+EMBEDDING_ENCODING = "cl100k_base"
+
+# Tokens reserved per block join on top of the separator: BPE counts are not additive, so near
+# the limit a chunk's tokens are counted exactly
+JOIN_SLACK_TOKENS = 2
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
+_encodings = {}
+
+
+def get_encoding(name: str = EMBEDDING_ENCODING):
+    """Load a tiktoken encoding once per process."""
+    if name not in _encodings:
+        import tiktoken
+        _encodings[name] = tiktoken.get_encoding(name)
+    return _encodings[name]
+
+
+def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
+    """Split text into chunks, respecting code blocks and paragraphs."""
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        # Calculate end position
+        end = start + chunk_size
+
+        # If we're at the end of the text, just take what's left
+        if end >= text_length:
+            chunks.append(text[start:].strip())
+            break
+
+        # Try to find a code block boundary first (```)
+        chunk = text[start:end]
+        code_block = chunk.rfind('```')
+        if code_block != -1 and code_block > chunk_size * 0.3:
+            end = start + code_block
+
+        # If no code block, try to break at a paragraph
+        elif '\n\n' in chunk:
+            # Find the last paragraph break
+            last_break = chunk.rfind('\n\n')
+            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
+                end = start + last_break
+
+        # If no paragraph break, try to break at a sentence
+        elif '. ' in chunk:
+            # Find the last sentence break
+            last_period = chunk.rfind('. ')
+            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
+                end = start + last_period + 1
+
+        # Extract chunk and clean it up
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        # Move start position for next chunk
+        start = max(start + 1, end)
+
+    return chunks
+
+
+def iter_blocks(text: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Yield the markdown blocks of text as (block, starts_section) pairs.
+
+    Blocks are paragraphs separated by blank lines, headings, and whole fenced code blocks
+    (blank lines inside a fence don't split it). starts_section is True for headings.
+    """
+    lines: List[str] = []
+    fence = None
+
+    for line in text.splitlines():
+        fence_match = FENCE_PATTERN.match(line)
+        if fence is not None:
+            lines.append(line)
+            if fence_match and fence_match.group(1) == fence:
+                yield "\n".join(lines), False
+                lines, fence = [], None
+        elif fence_match:
+            if lines:
+                yield "\n".join(lines), False
+            lines, fence = [line], fence_match.group(1)
+        elif HEADING_PATTERN.match(line):
+            if lines:
+                yield "\n".join(lines), False
+            yield line, True
+            lines = []
+        elif not line.strip():
+            if lines:
+                yield "\n".join(lines), False
+            lines = []
+        else:
+            lines.append(line)
+
+    if lines:
+        yield "\n".join(lines), False
+
+
+def _split_oversized(block: str, max_tokens: int, encoding) -> Iterator[Tuple[str, int]]:
+    """Split a block longer than max_tokens at line boundaries, or at token boundaries as a last resort."""
+    lines = block.split("\n")
+    is_fence = len(lines) > 1 and FENCE_PATTERN.match(lines[0]) and FENCE_PATTERN.match(lines[-1])
+    if is_fence:
+        wrap_tokens = len(encoding.encode(lines[0])) + len(encoding.encode(lines[-1])) + 2
+        # Fence lines too long to repeat around every piece are split like any other line
+        is_fence = wrap_tokens <= max_tokens // 4
+    if is_fence:
+        # Re-open and close the fence around every piece so each stays valid markdown
+        opening, closing = lines[0], lines[-1]
+        lines = lines[1:-1]
+    else:
+        opening = closing = None
+        wrap_tokens = 0
+
+    def emit(piece_lines: List[str]) -> Tuple[str, int]:
+        piece = "\n".join(piece_lines)
+        if is_fence:
+            piece = f"{opening}\n{piece}\n{closing}"
+        return piece, len(encoding.encode(piece))
+
+    budget = max(1, max_tokens - wrap_tokens)
+    current: List[str] = []
+    current_tokens = 0
+    for line in lines:
+        line_tokens = len(encoding.encode(line)) + 1
+        if line_tokens > budget:
+            if current:
+                yield emit(current)
+                current, current_tokens = [], 0
+            tokens = encoding.encode(line)
+            for start in range(0, len(tokens), budget):
+                yield emit([encoding.decode(tokens[start:start + budget])])
+            continue
+        if current and current_tokens + line_tokens > budget:
+            yield emit(current)
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+
+    if current:
+        yield emit(current)
+
+
+def iter_token_chunks(text: str, max_tokens: int = 1200, overlap_tokens: int = 120,
+                      encoding_name: str = EMBEDDING_ENCODING) -> Iterator[str]:
+    """
+    Split markdown into chunks of at most max_tokens embedding-model tokens.
+
+    Chunks are built from whole blocks (see iter_blocks), so code fences are only split
+    when a single fence is longer than max_tokens. A heading starts a new chunk once the
+    current one is half full, unless it follows another heading (a run of headings is
+    packed like paragraphs). Each chunk after the first starts with up to overlap_tokens
+    of trailing blocks from the previous chunk, except at a heading boundary. Near the
+    limit the joined chunk is counted exactly, since BPE counts are not additive.
+
+    Args:
+        text: The markdown to split
+        max_tokens: Maximum tokens per chunk
+        overlap_tokens: Tokens repeated from the end of the previous chunk
+        encoding_name: tiktoken encoding used to count tokens
+
+    Yields:
+        str: Chunks in document order
+    """
+    encoding = get_encoding(encoding_name)
+    separator_tokens = 1  # the blank line joining two blocks
+
+    # Oversized blocks are split with some room to spare, so a heading can stay attached to them
+    split_tokens = max(1, max_tokens - max_tokens // 10)
+
+    # (block, tokens, is_heading) of the chunk being built
+    blocks: List[Tuple[str, int, bool]] = []
+    tokens = 0
+
+    def total(block_list: List[Tuple[str, int, bool]]) -> int:
+        return sum(block_tokens + separator_tokens for _, block_tokens, _ in block_list)
+
+    def overlap_tail() -> List[Tuple[str, int, bool]]:
+        tail: List[Tuple[str, int, bool]] = []
+        for block in reversed(blocks):
+            if total(tail) + block[1] > overlap_tokens:
+                break
+            tail.insert(0, block)
+        return tail
+
+    def fits(block_list: List[Tuple[str, int, bool]], piece: str, piece_tokens: int) -> bool:
+        """Whether piece can be appended to block_list without the joined chunk exceeding max_tokens."""
+        estimate = total(block_list) + piece_tokens
+        if estimate > max_tokens:
+            return False
+        if estimate + JOIN_SLACK_TOKENS * len(block_list) <= max_tokens:
+            return True
+        joined = "\n\n".join([block for block, _, _ in block_list] + [piece])
+        return len(encoding.encode(joined)) <= max_tokens
+
+    for block, starts_section in iter_blocks(text):
+        block_tokens = len(encoding.encode(block))
+        pieces = [(block, block_tokens)] if block_tokens <= max_tokens else \
+            list(_split_oversized(block, split_tokens, encoding))
+
+        for piece, piece_tokens in pieces:
+            # Headings following a heading (lists of related articles) are content, not sections
+            in_heading_run = bool(blocks) and blocks[-1][2]
+            at_heading = starts_section and not in_heading_run and tokens >= max_tokens // 2
+            if blocks and (at_heading or not fits(blocks, piece, piece_tokens)):
+                # A lone heading belongs with the text after it, not at the end of a chunk
+                carried = []
+                last = blocks[-1]
+                if len(blocks) > 1 and last[2] and not blocks[-2][2] and last[1] <= max_tokens // 2 \
+                        and fits([last], piece, piece_tokens):
+                    carried = [blocks.pop()]
+
+                yield "\n\n".join(block for block, _, _ in blocks)
+                if at_heading or carried or overlap_tokens <= 0:
+                    blocks = carried
+                else:
+                    blocks = overlap_tail()
+                    # Drop overlap that would push the next piece over the limit
+                    while blocks and not fits(blocks, piece, piece_tokens):
+                        blocks.pop(0)
+                tokens = total(blocks)
+            blocks.append((piece, piece_tokens, starts_section))
+            tokens += piece_tokens + separator_tokens
+
+    if blocks:
+        yield "\n\n".join(block for block, _, _ in blocks)
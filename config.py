@@ -0,0 +1,20 @@
+# configuration shared by the crawler, the agent and the Streamlit app
+# settings are read from environment variables; on Streamlit, values from st.secrets fill in
+# whatever the environment doesn't set, so scripts and benchmarks run without a secrets file
+
+import os
+from typing import Iterable
+
+SECRET_KEYS = ["OPENAI_API_KEY", "SUPABASE_URL", "SUPABASE_SERVICE_KEY", "LLM_MODEL"]
+
+
+def load_secrets(keys: Iterable[str] = SECRET_KEYS):
+    """Copy keys from Streamlit secrets into the environment, unless the environment already sets them."""
+    try:
+        import streamlit as st
+        secrets = {key: st.secrets[key] for key in keys if key not in os.environ and key in st.secrets}
+    except Exception:
+        # No streamlit, or no secrets.toml (scripts, benchmarks, CI): the environment is all there is
+        return
+    for key, value in secrets.items():
+        os.environ[key] = str(value)
@@ -0,0 +1,129 @@
+# durable journal of crawl progress
+# records the stage each URL of a run has reached, and keeps fetched pages until they are
+# stored, so an interrupted run can be resumed without re-crawling finished work
+
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# A URL in one of these states needs no more work
+FINAL_STAGES = {"stored", "skipped"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class CrawlJournal:
+    """
+    SQLite journal of crawl runs and the stage each URL has reached.
+
+    A URL moves through pending, fetched, cleaned, deduplicated, chunked, summarized, embedded
+    and stored, or ends up skipped (unchanged, a duplicate or a paywall stub) or failed.
+
+    Every update is committed with synchronous=full, so the journal reflects all
+    completed work even if the process is killed.
+    """
+
+    def __init__(self, path: str = "crawl_journal.sqlite"):
+        self.path = path
+        self.run_id: Optional[int] = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=full")
+        self.conn.execute("""
+            create table if not exists crawl_runs (
+                run_id integer primary key autoincrement,
+                started_at text not null,
+                finished_at text,
+                url_count integer not null
+            )
+        """)
+        self.conn.execute("""
+            create table if not exists crawl_urls (
+                run_id integer not null,
+                url text not null,
+                stage text not null,
+                error text,
+                page blob,
+                updated_at text not null,
+                primary key (run_id, url)
+            )
+        """)
+        self.conn.commit()
+
+    def start_run(self, urls: List[str]) -> int:
+        """Start a new run with every URL pending."""
+        cursor = self.conn.execute(
+            "insert into crawl_runs (started_at, url_count) values (?, ?)", (_now(), len(urls))
+        )
+        self.run_id = cursor.lastrowid
+        now = _now()
+        self.conn.executemany(
+            "insert or ignore into crawl_urls (run_id, url, stage, updated_at) values (?, ?, 'pending', ?)",
+            [(self.run_id, url, now) for url in urls]
+        )
+        self.conn.commit()
+        return self.run_id
+
+    def resume_latest_run(self) -> Optional[int]:
+        """Continue the most recent run that did not finish. Returns its id, or None if there is none."""
+        row = self.conn.execute(
+            "select run_id from crawl_runs where finished_at is null order by run_id desc limit 1"
+        ).fetchone()
+        self.run_id = row[0] if row else None
+        return self.run_id
+
+    def remaining_urls(self) -> List[str]:
+        """URLs of the current run that still need work, including ones that failed."""
+        rows = self.conn.execute(
+            f"select url from crawl_urls where run_id = ? and stage not in ({','.join('?' * len(FINAL_STAGES))}) "
+            "order by rowid",
+            (self.run_id, *FINAL_STAGES)
+        )
+        return [row[0] for row in rows]
+
+    def mark(self, url: str, stage: str, error: Optional[str] = None):
+        """Record that a URL reached a stage (or failed, or was skipped)."""
+        # Once a page is stored or skipped, its saved copy is no longer needed
+        clear_page = ", page = null" if stage in FINAL_STAGES else ""
+        self.conn.execute(
+            f"update crawl_urls set stage = ?, error = ?, updated_at = ?{clear_page} where run_id = ? and url = ?",
+            (stage, error, _now(), self.run_id, url)
+        )
+        self.conn.commit()
+
+    def save_page(self, url: str, page: Dict[str, Any]):
+        """Mark a URL as fetched and keep its crawled page, so a resumed run doesn't fetch it again."""
+        blob = zlib.compress(json.dumps(page).encode("utf-8"))
+        self.conn.execute(
+            "update crawl_urls set stage = 'fetched', error = null, page = ?, updated_at = ? "
+            "where run_id = ? and url = ?",
+            (blob, _now(), self.run_id, url)
+        )
+        self.conn.commit()
+
+    def load_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the page saved by save_page for a URL of the current run, if any."""
+        row = self.conn.execute(
+            "select page from crawl_urls where run_id = ? and url = ?", (self.run_id, url)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def finish_run(self):
+        self.conn.execute("update crawl_runs set finished_at = ? where run_id = ?", (_now(), self.run_id))
+        self.conn.commit()
+
+    def summary(self) -> Dict[str, int]:
+        """Number of URLs of the current run in each stage."""
+        rows = self.conn.execute(
+            "select stage, count(*) from crawl_urls where run_id = ? group by stage", (self.run_id,)
+        )
+        return dict(rows.fetchall())
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,92 @@
+# per-URL manifest for incremental recrawls
+# records when each URL was last crawled, its ETag/Last-Modified validators and a hash
+# of its content, so unchanged pages can be skipped on the next run
+
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+@dataclass
+class ManifestEntry:
+    url: str
+    last_crawled: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    chunk_count: int
+
+
+def content_hash(markdown: str) -> str:
+    """Hash page content to detect changes between crawls."""
+    return hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+
+
+def conditional_headers(entry: Optional[ManifestEntry]) -> Dict[str, str]:
+    """Build If-None-Match / If-Modified-Since headers from a previous crawl."""
+    headers = {}
+    if entry is None:
+        return headers
+    if entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+class CrawlManifest:
+    """SQLite-backed record of the last successful crawl of each URL."""
+
+    def __init__(self, path: str = "crawl_manifest.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists crawl_manifest (
+                url text primary key,
+                last_crawled text not null,
+                etag text,
+                last_modified text,
+                content_hash text not null,
+                chunk_count integer not null
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[ManifestEntry]:
+        """Return the manifest entry for a URL, or None if it was never indexed."""
+        row = self.conn.execute(
+            "select url, last_crawled, etag, last_modified, content_hash, chunk_count "
+            "from crawl_manifest where url = ?",
+            (url,)
+        ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record(self, url: str, content_hash: str, chunk_count: int,
+               etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Record a successful crawl and store of a URL."""
+        self.conn.execute(
+            "insert or replace into crawl_manifest "
+            "(url, last_crawled, etag, last_modified, content_hash, chunk_count) values (?, ?, ?, ?, ?, ?)",
+            (url, datetime.now(timezone.utc).isoformat(), etag, last_modified, content_hash, chunk_count)
+        )
+        self.conn.commit()
+
+    def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Mark an unchanged URL as checked, keeping its stored hash and validators."""
+        self.conn.execute(
+            "update crawl_manifest set last_crawled = ?, etag = coalesce(?, etag), "
+            "last_modified = coalesce(?, last_modified) where url = ?",
+            (datetime.now(timezone.utc).isoformat(), etag, last_modified, url)
+        )
+        self.conn.commit()
+
+    def forget(self, url: str):
+        """Drop a URL's entry so the next incremental crawl fetches it again."""
+        self.conn.execute("delete from crawl_manifest where url = ?", (url,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -2,195 +2,531 @@ import os
 import sys
 import json
 import asyncio
+import argparse
 import requests
 from xml.etree import ElementTree
-from typing import List, Dict, Any
-from dataclasses import dataclass
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 from openai import AsyncOpenAI
-from supabase import create_client, Client
+
+from boilerplate import BoilerplateStripper
+from bulk_writer import BulkUpsertWriter
+from chunking import iter_token_chunks
+from config import load_secrets
+from crawl_journal import CrawlJournal
+from crawl_manifest import CrawlManifest, content_hash, conditional_headers
+from crawl_scheduler import DomainScheduler, interleave_by_host
+from dead_letter import DeadLetterQueue
+from embedding_batcher import EmbeddingBatcher
+from ingest_cache import IngestCache
+from ingest_metrics import IngestMetrics, write_reports_periodically
+from ingest_pipeline import Stage, run_pipeline
+from near_duplicates import NearDuplicateIndex
+from openai_limiter import OpenAIRateLimiter, estimate_tokens
+from static_fetch import create_http_client, fetch_static, fetch_with_fallback, is_usable
+from storage import create_store
+from url_canonical import UrlCanonicalizer, find_canonical_link
+from url_registry import MAX_CRAWL_ATTEMPTS, PENDING, STATUS_BY_STAGE, VARIANT, UrlRegistry
 
 #load_dotenv()
 
-import streamlit as st
-OPENAI_API_KEY= st.secrets["OPENAI_API_KEY"]
-SUPABASE_URL=st.secrets["SUPABASE_URL"]
-SUPABASE_SERVICE_KEY=st.secrets["SUPABASE_SERVICE_KEY"]
-LLM_MODEL=st.secrets["LLM_MODEL"]
+load_secrets()
 
 #IL - if running from console for testing
 #load_dotenv('.venv1/ottomator-agents/crawl4AI-agent/.env')
 
 
-# Initialize OpenAI and Supabase clients
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
+# Initialize the OpenAI client and the chunk store (Supabase, or local with STORAGE_BACKEND=local)
+# (retries are handled by the rate limiters below, not by the OpenAI client)
+openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+chunk_store = create_store()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Stage latencies, queue depths, OpenAI requests/tokens and rows written, reported at the end of a run
+ingest_metrics = IngestMetrics()
+
+# All requests to each model are paced against its RPM/TPM limits (defaults are OpenAI's tier 1)
+embedding_limiter = OpenAIRateLimiter(
+    "embeddings",
+    requests_per_minute=float(os.getenv("OPENAI_EMBEDDING_RPM", "3000")),
+    tokens_per_minute=float(os.getenv("OPENAI_EMBEDDING_TPM", "1000000")),
+    metrics=ingest_metrics
+)
+chat_limiter = OpenAIRateLimiter(
+    "chat",
+    requests_per_minute=float(os.getenv("OPENAI_CHAT_RPM", "500")),
+    tokens_per_minute=float(os.getenv("OPENAI_CHAT_TPM", "200000")),
+    metrics=ingest_metrics
+)
+
+# Embedding requests from all in-flight documents are sent together in multi-input calls
+embedding_batcher = EmbeddingBatcher(openai_client, model=EMBEDDING_MODEL, rate_limiter=embedding_limiter)
+
+# Chunk rows from all in-flight documents are upserted together on (url, chunk_number)
+chunk_writer = BulkUpsertWriter(chunk_store, metrics=ingest_metrics)
+
+# Embeddings and summaries of unchanged chunks are reused across runs
+ingest_cache = IngestCache(
+    os.getenv("INGEST_CACHE_PATH", "ingest_cache.sqlite"),
+    max_bytes=int(os.getenv("INGEST_CACHE_MAX_MB", "512")) * 1024 * 1024
 )
 
+# The local SQLite stores (ingest cache, crawl manifest, crawl journal) are only used from this one thread,
+# which keeps their blocking disk I/O off the event loop
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-db")
+
+# Workers per pipeline stage; the fetch stage uses crawl_parallel's max_concurrent.
+# Clean runs its SQLite work on db_executor anyway; dedupe runs one page at a time, so two copies of a page can't both be taken as the canonical one
+STAGE_CONCURRENCY = {"clean": 2, "dedupe": 1, "chunk": 2, "summarize": 10, "embed": 10, "store": 5}
+
+# Chunk size and overlap in embedding-model tokens
+CHUNK_MAX_TOKENS = 1200
+CHUNK_OVERLAP_TOKENS = 120
+
+# Attempts per URL when a host answers with a retryable throttling status
+MAX_FETCH_ATTEMPTS = 3
+
+# Static pages whose converted markdown is shorter than this are re-crawled with the browser
+MIN_STATIC_MARKDOWN = 500
+
+# Bump SUMMARY_PROMPT_VERSION whenever the summary prompt changes, so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = "1"
+SUMMARY_SYSTEM_PROMPT = """You are an AI that extracts titles and summaries from documentation chunks.
+    Return a JSON object with 'title', 'author' and 'summary' keys.
+    For the title: If this seems like the start of a document, extract its title. If it's a middle chunk, derive a descriptive title.
+    For the author: If this seems like the start of a document, extract its author. If it's a middle chunk, 
+    For the summary: Create a concise summary of the main points in this chunk.
+    Keep both title and summary concise but informative."""
+
+# Prompts for the "document" summary mode: document metadata is extracted once from the start
+# of the page, and chunk summaries are requested several chunks at a time
+DOCUMENT_INFO_PROMPT = """You are an AI that extracts metadata from the start of an article.
+    Return a JSON object with 'title', 'author' and 'published_date' keys.
+    For the title: The article's headline.
+    For the author: The article's author or authors, or an empty string if none is shown.
+    For the published_date: The publication date as YYYY-MM-DD, or an empty string if none is shown."""
+CHUNK_BATCH_PROMPT = """You are an AI that summarizes consecutive chunks of one article.
+    You are given the article title and several numbered chunks.
+    Return a JSON object with a 'chunks' key holding a list with one object per chunk, each with 'index', 'title' and 'summary' keys.
+    For the title: Derive a short descriptive title for that chunk.
+    For the summary: Create a concise summary of the main points in that chunk."""
+
+# "chunk" makes one title/summary request per chunk; "document" extracts title/author once per
+# document and summarizes SUMMARY_BATCH_SIZE chunks per request
+SUMMARY_MODES = ["chunk", "document"]
+SUMMARY_BATCH_SIZE = 5
+
 @dataclass
 class ProcessedChunk:
     url: str
     chunk_number: int
     title: str
+    author: str
     summary: str
     content: str
     metadata: Dict[str, Any]
     embedding: List[float]
 
-def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
-    """Split text into chunks, respecting code blocks and paragraphs."""
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        # Calculate end position
-        end = start + chunk_size
-
-        # If we're at the end of the text, just take what's left
-        if end >= text_length:
-            chunks.append(text[start:].strip())
-            break
-
-        # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
-
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
-
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
-
-        # Extract chunk and clean it up
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-
-        # Move start position for next chunk
-        start = max(start + 1, end)
-
-    return chunks
+@dataclass
+class DocumentJob:
+    """A crawled page on its way through the ingest pipeline stages."""
+    url: str
+    markdown: str
+    replace_existing: bool = False
+    page_hash: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    chunks: List[str] = field(default_factory=list)
+    document_info: Dict[str, str] = field(default_factory=dict)
+    extracted: List[Dict[str, str]] = field(default_factory=list)
+    embeddings: List[List[float]] = field(default_factory=list)
+    aliases: List[str] = field(default_factory=list)
 
-async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
-    """Extract title and summary using GPT-4."""
-    system_prompt = """You are an AI that extracts titles and summaries from documentation chunks.
-    Return a JSON object with 'title', 'author' and 'summary' keys.
-    For the title: If this seems like the start of a document, extract its title. If it's a middle chunk, derive a descriptive title.
-    For the author: If this seems like the start of a document, extract its author. If it's a middle chunk, 
-    For the summary: Create a concise summary of the main points in this chunk.
-    Keep both title and summary concise but informative."""
-    
-    try:
-        response = await openai_client.chat.completions.create(
+async def run_in_db_thread(func, *args):
+    """Run a blocking call against the local SQLite stores off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+async def get_chat_json(system_prompt: str, user_content: str, max_output_tokens: int = 300) -> Dict[str, Any]:
+    """Send one JSON-mode chat request through the chat rate limiter and parse the answer."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+    def request():
+        return openai_client.chat.completions.create(
             model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"URL: {url}\n\nContent:\n{chunk[:1000]}..."}  # Send first 1000 chars for context
-            ],
+            messages=messages,
             response_format={ "type": "json_object" }
         )
-        return json.loads(response.choices[0].message.content)
-    except Exception as e:
-        print(f"Error getting title and summary: {e}")
-        return {"title": "Error processing title", "summary": "Error processing summary"}
+
+    # Budget for the prompt plus the expected answer
+    estimated_tokens = sum(estimate_tokens(message["content"]) for message in messages) + max_output_tokens
+    response = await chat_limiter.run(request, estimated_tokens)
+    return json.loads(response.choices[0].message.content)
+
+async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
+    """Extract title and summary using GPT-4. Raises if the request still fails after retries."""
+    extracted = await get_chat_json(
+        SUMMARY_SYSTEM_PROMPT,
+        f"URL: {url}\n\nContent:\n{chunk[:1000]}..."  # Send first 1000 chars for context
+    )
+    if not extracted.get('title') or 'summary' not in extracted:
+        raise ValueError(f"Incomplete title/summary for {url}: {extracted}")
+    return extracted
+
+async def get_document_info(first_chunk: str, url: str) -> Dict[str, str]:
+    """Extract the title, author and publication date of a document from its first chunk."""
+    info = await get_chat_json(DOCUMENT_INFO_PROMPT, f"URL: {url}\n\nContent:\n{first_chunk[:2000]}...")
+    if not info.get('title'):
+        raise ValueError(f"No title found for {url}: {info}")
+    return {key: info.get(key) or '' for key in ('title', 'author', 'published_date')}
+
+async def get_chunk_summaries(chunks: List[str], url: str, document_title: str) -> Dict[int, Dict[str, str]]:
+    """
+    Summarize several chunks of one document in a single request.
+
+    Returns:
+        Dict[int, Dict[str, str]]: title/summary by position in chunks; chunks the model skipped are missing
+    """
+    numbered = "\n\n".join(f"Chunk {i}:\n{chunk[:1000]}..." for i, chunk in enumerate(chunks))
+    answer = await get_chat_json(
+        CHUNK_BATCH_PROMPT,
+        f"URL: {url}\nArticle title: {document_title}\n\n{numbered}",
+        max_output_tokens=150 * len(chunks)
+    )
+    summaries = {}
+    for item in answer.get('chunks', []):
+        index = item.get('index')
+        if isinstance(index, int) and 0 <= index < len(chunks) and item.get('title') and 'summary' in item:
+            summaries[index] = {'title': item['title'], 'summary': item['summary']}
+    return summaries
+
+def unsummarized_chunk(chunk: str, title: str) -> Dict[str, str]:
+    """Title and summary for a chunk too short to be worth an LLM call: its own opening text."""
+    if not title:
+        first_line = next((line for line in chunk.splitlines() if line.strip()), chunk)
+        title = first_line.strip('# ').strip()[:100]
+    return {'title': title, 'summary': chunk[:300]}
 
 async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from OpenAI."""
-    try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error getting embedding: {e}")
-        return [0] * 1536  # Return zero vector on error
+    """Get embedding vector from OpenAI, batched with the other in-flight chunks."""
+    return await embedding_batcher.embed(text)
 
-async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
-    """Process a single chunk of text."""
-    # Get title and summary
-    extracted = await get_title_and_summary(chunk, url)
-    
-    # Get embedding
-    embedding = await get_embedding(chunk)
+async def get_cached_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
+    """Get title and summary from the ingest cache, calling OpenAI only on a miss."""
+    key = IngestCache.make_key(os.getenv("LLM_MODEL", "gpt-4o-mini"), SUMMARY_PROMPT_VERSION, f"{url}\n{chunk}")
+    extracted = await run_in_db_thread(ingest_cache.get_json, key)
+    if extracted is None:
+        extracted = await get_title_and_summary(chunk, url)
+        await run_in_db_thread(ingest_cache.put_json, key, extracted)
+    return extracted
+
+async def get_cached_embedding(chunk: str) -> List[float]:
+    """Get embedding from the ingest cache, calling OpenAI only on a miss."""
+    key = IngestCache.make_key(EMBEDDING_MODEL, "", chunk)
+    embedding = await run_in_db_thread(ingest_cache.get_embedding, key)
+    if embedding is None:
+        embedding = await get_embedding(chunk)
+        await run_in_db_thread(ingest_cache.put_embedding, key, embedding)
+    return embedding
+
+def summary_cache_key(kind: str, *parts: str) -> str:
+    """Ingest cache key for an LLM result of the given prompt kind."""
+    return IngestCache.make_key(
+        os.getenv("LLM_MODEL", "gpt-4o-mini"), f"{kind}-{SUMMARY_PROMPT_VERSION}", "\n".join(parts)
+    )
+
+async def get_cached_document_info(job: DocumentJob) -> Dict[str, str]:
+    """Get a document's title/author/date from the ingest cache, calling OpenAI only on a miss."""
+    key = summary_cache_key("document", job.url, job.chunks[0])
+    info = await run_in_db_thread(ingest_cache.get_json, key)
+    if info is None:
+        info = await get_document_info(job.chunks[0], job.url)
+        await run_in_db_thread(ingest_cache.put_json, key, info)
+    return info
+
+def build_processed_chunk(job: DocumentJob, chunk_number: int) -> ProcessedChunk:
+    """Combine a chunk with its summary and embedding."""
+    chunk = job.chunks[chunk_number]
+    extracted = job.extracted[chunk_number]
+    author = job.document_info.get('author') or extracted.get('author', '')
     
     # Create metadata
     metadata = {
         "source": "pydantic_ai_docs", #IL - to be updated, this is not the source always
         "chunk_size": len(chunk),
         "crawled_at": datetime.now(timezone.utc).isoformat(),
-        "url_path": urlparse(url).path
+        "url_path": urlparse(job.url).path
     }
+    if author:
+        metadata["author"] = author
+    if job.document_info.get('published_date'):
+        metadata["published_date"] = job.document_info['published_date']
+    if job.aliases:
+        metadata["aliases"] = job.aliases
     
     return ProcessedChunk(
-        url=url,
+        url=job.url,
         chunk_number=chunk_number,
         title=extracted['title'],
-        author=extracted['author'],
+        author=author,
         summary=extracted['summary'],
         content=chunk,  # Store the original chunk content
         metadata=metadata,
-        embedding=embedding
+        embedding=job.embeddings[chunk_number]
     )
 
-async def insert_chunk(chunk: ProcessedChunk):
-    """Insert a processed chunk into Supabase."""
+def chunk_to_row(chunk: ProcessedChunk) -> Dict[str, Any]:
+    """Convert a processed chunk into a rimon_pages row."""
+    return {
+        "url": chunk.url,
+        "chunk_number": chunk.chunk_number,
+        "title": chunk.title,
+        "summary": chunk.summary,
+        "content": chunk.content,
+        "metadata": chunk.metadata,
+        "embedding": chunk.embedding
+    }
+
+async def store_chunks(chunks: List[ProcessedChunk]) -> bool:
+    """Upsert processed chunks into the chunk store through the shared bulk writer."""
+    return await chunk_writer.write([chunk_to_row(chunk) for chunk in chunks])
+
+async def delete_stale_chunks(url: str, chunk_count: int) -> bool:
+    """Delete chunks of a URL left over from a longer previous version of the page."""
     try:
-        data = {
-            "url": chunk.url,
-            "chunk_number": chunk.chunk_number,
-            "title": chunk.title,
-            "summary": chunk.summary,
-            "content": chunk.content,
-            "metadata": chunk.metadata,
-            "embedding": chunk.embedding
-        }
-        
-        result = supabase.table("rimon_pages").insert(data).execute()
-        print(f"Inserted chunk {chunk.chunk_number} for {chunk.url}")
-        return result
+        await asyncio.to_thread(chunk_store.delete_chunks, url, chunk_count)
+        return True
     except Exception as e:
-        print(f"Error inserting chunk: {e}")
+        print(f"Error deleting stale chunks for {url}: {e}")
+        return False
+
+async def retire_variant(url: str, manifest: Optional[CrawlManifest], stored: bool) -> bool:
+    """
+    Drop what was indexed under a URL spelling that is now crawled as another URL.
+
+    Args:
+        url: The variant URL
+        manifest: Crawl manifest to remove the variant's entry from, if any
+        stored: Whether the variant has chunks in the store
+
+    Returns:
+        bool: False if its chunks could not be deleted
+    """
+    if stored:
+        if not await delete_stale_chunks(url, 0):
+            return False
+        print(f"Deleted the chunks stored under the variant URL {url}")
+    if manifest is not None:
+        await run_in_db_thread(manifest.forget, url)
+    return True
+
+async def record_aliases(url: str, aliases: List[str]) -> bool:
+    """Write the near-duplicate URLs of a stored page into the metadata of its chunks."""
+    try:
+        await asyncio.to_thread(chunk_store.update_metadata, url, {"aliases": aliases})
+        return True
+    except Exception as e:
+        print(f"Error recording aliases for {url}: {e}")
+        return False
+
+async def chunk_document(job: DocumentJob) -> DocumentJob:
+    """Pipeline stage: split the page into token-sized, overlapping chunks."""
+    job.chunks = await asyncio.to_thread(
+        lambda: [chunk for chunk in iter_token_chunks(job.markdown, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS) if chunk.strip()]
+    )
+    return job
+
+async def summarize_document(job: DocumentJob, mode: str = "chunk", min_chars: int = 0) -> DocumentJob:
+    """
+    Pipeline stage: get a title and summary for every chunk.
+
+    Args:
+        job: The document being ingested
+        mode: "chunk" for one request per chunk, or "document" to extract title/author once
+            and summarize SUMMARY_BATCH_SIZE chunks per request
+        min_chars: Chunks shorter than this are not sent to the LLM; their opening text is used instead
+    """
+    if mode == "chunk":
+        async def summarize(chunk: str) -> Dict[str, str]:
+            if len(chunk) < min_chars:
+                return unsummarized_chunk(chunk, "")
+            return await get_cached_title_and_summary(chunk, job.url)
+
+        job.extracted = await asyncio.gather(*[summarize(chunk) for chunk in job.chunks])
+        return job
+
+    job.document_info = await get_cached_document_info(job)
+    document_title = job.document_info['title']
+
+    # Short chunks and cached summaries need no request
+    extracted: List[Optional[Dict[str, str]]] = [None] * len(job.chunks)
+    keys = [summary_cache_key("chunk-batch", job.url, document_title, chunk) for chunk in job.chunks]
+    missing = []
+    for i, chunk in enumerate(job.chunks):
+        if len(chunk) < min_chars:
+            extracted[i] = unsummarized_chunk(chunk, document_title if i == 0 else "")
+        else:
+            extracted[i] = await run_in_db_thread(ingest_cache.get_json, keys[i])
+            if extracted[i] is None:
+                missing.append(i)
+
+    async def summarize_batch(indexes: List[int]):
+        summaries = await get_chunk_summaries([job.chunks[i] for i in indexes], job.url, document_title)
+        for position, i in enumerate(indexes):
+            if position in summaries:
+                extracted[i] = summaries[position]
+                await run_in_db_thread(ingest_cache.put_json, keys[i], extracted[i])
+            else:
+                # The model skipped this chunk; ask for it on its own
+                extracted[i] = await get_cached_title_and_summary(job.chunks[i], job.url)
+
+    await asyncio.gather(*[
+        summarize_batch(missing[start:start + SUMMARY_BATCH_SIZE])
+        for start in range(0, len(missing), SUMMARY_BATCH_SIZE)
+    ])
+
+    # The first chunk carries the document title; later ones are "Document title - chunk title"
+    for i, item in enumerate(extracted):
+        if i == 0:
+            item['title'] = document_title
+        elif not item['title'].startswith(document_title):
+            item['title'] = f"{document_title} - {item['title']}"
+    job.extracted = extracted
+    return job
+
+async def embed_document(job: DocumentJob) -> DocumentJob:
+    """Pipeline stage: get an embedding for every chunk."""
+    job.embeddings = await asyncio.gather(*[
+        get_cached_embedding(chunk)
+        for chunk in job.chunks
+    ])
+    return job
+
+async def store_document(job: DocumentJob, manifest: Optional[CrawlManifest] = None) -> Optional[DocumentJob]:
+    """Pipeline stage: upsert the chunks, drop stale ones and record the page in the manifest."""
+    processed_chunks = [build_processed_chunk(job, i) for i in range(len(job.chunks))]
+
+    # Upsert chunks, overwriting any earlier version of the same chunk numbers
+    if not await store_chunks(processed_chunks):
         return None
+    print(f"Stored {len(processed_chunks)} chunks for {job.url}")
 
-async def process_and_store_document(url: str, markdown: str):
-    """Process a document and store its chunks in parallel."""
-    # Split into chunks
-    chunks = chunk_text(markdown)
-    
-    # Process chunks in parallel
-    tasks = [
-        process_chunk(chunk, i, url) 
-        for i, chunk in enumerate(chunks)
-    ]
-    processed_chunks = await asyncio.gather(*tasks)
-    
-    # Store chunks in parallel
-    insert_tasks = [
-        insert_chunk(chunk) 
-        for chunk in processed_chunks
-    ]
-    await asyncio.gather(*insert_tasks)
+    # Remove stale chunks so a shorter new version doesn't leave old ones behind
+    if job.replace_existing and not await delete_stale_chunks(job.url, len(processed_chunks)):
+        return None
+
+    if manifest and job.page_hash:
+        await run_in_db_thread(
+            manifest.record, job.url, job.page_hash, len(processed_chunks), job.etag, job.last_modified
+        )
+    return job
+
+async def process_and_store_document(url: str, markdown: str, replace_existing: bool = False) -> int:
+    """
+    Process a single document through every ingest stage and store its chunks.
+
+    Args:
+        url: The URL of the document
+        markdown: The crawled page content
+        replace_existing: Delete chunks of a previous, longer version of this URL
+
+    Returns:
+        int: The number of chunks stored, or -1 if storing failed
+    """
+    job = DocumentJob(url=url, markdown=markdown, replace_existing=replace_existing)
+    for step in (chunk_document, summarize_document, embed_document, store_document):
+        job = await step(job)
+        if job is None:
+            return -1
+    return len(job.chunks)
+
+def get_header(headers: Optional[Dict[str, str]], name: str) -> Optional[str]:
+    """Case-insensitive lookup of a response header."""
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def is_unmodified(url: str, headers: Dict[str, str]) -> bool:
+    """Ask the server with a conditional request whether a previously crawled URL has changed."""
+    if not headers:
+        return False
+    try:
+        response = requests.head(url, headers=headers, timeout=10, allow_redirects=True)
+        return response.status_code == 304
+    except Exception as e:
+        print(f"Error checking {url} for changes: {e}")
+        return False
+
+async def crawl_parallel(urls: List[str], max_concurrent: int = 5, manifest: Optional[CrawlManifest] = None,
+                         static_fast_path: bool = True, scheduler: Optional[DomainScheduler] = None,
+                         journal: Optional[CrawlJournal] = None, dead_letters: Optional[DeadLetterQueue] = None,
+                         summary_mode: str = "chunk", min_summary_chars: int = 0,
+                         duplicates: Optional[NearDuplicateIndex] = None,
+                         boilerplate: Optional[BoilerplateStripper] = None,
+                         registry: Optional[UrlRegistry] = None,
+                         canonicalizer: Optional[UrlCanonicalizer] = None,
+                         variants: Optional[Dict[str, List[str]]] = None, refresh: bool = False):
+    """
+    Crawl multiple URLs and ingest them through a staged pipeline.
+
+    Pages flow fetch -> clean -> dedupe -> chunk -> summarize -> embed -> store through bounded queues,
+    each stage with its own concurrency limit (max_concurrent for fetching,
+    STAGE_CONCURRENCY for the rest).
+
+    With static_fast_path, pages are first fetched over plain HTTP and only rendered in the
+    browser when the HTML does not already contain the content. Browser renders use a pool
+    of max_concurrent independent sessions.
+
+    URLs are interleaved across hosts, and the scheduler limits concurrency and spacing per host,
+    backing off and retrying when a host throttles us.
+
+    With a manifest, the crawl is incremental: URLs the server reports as unmodified, or whose
+    content hash matches the last crawl, are skipped, and changed pages replace their old chunks.
+
+    With a journal, every stage a URL completes is recorded durably, and fetched pages are kept
+    until stored. A resumed run reuses those pages instead of crawling them again; their
+    summaries and embeddings come back from the ingest cache.
+
+    A page that still fails after retries is not stored; it is recorded in dead_letters.
+
+    summary_mode and min_summary_chars choose how chunks are summarized (see summarize_document).
+
+    With a duplicates index, a page that is a near-duplicate of one already indexed is not
+    ingested; its URL is listed in the "aliases" metadata of the canonical page's chunks instead.
+
+    With a boilerplate stripper, blocks repeated across a host's pages (menus, banners, footers)
+    are removed before chunking, and pages that are only a paywall stub are skipped.
+
+    With a registry, the outcome of each URL (crawled, skipped or failed) is recorded there, so
+    the next run from the registry doesn't pull it again.
+
+    variants maps a URL to the URLs collapsed into it. Once it is crawled or skipped, whatever an
+    earlier run indexed under them (chunks, manifest entries) is deleted and they are marked as
+    variants in the registry; if it fails, they keep their chunks and stay pending to retry it.
+
+    With a canonicalizer, the rel=canonical link of every fetched page is recorded, so later
+    runs collapse other variants of the page into it before crawling.
+
+    With refresh, pages are processed again even if unchanged, replacing their old chunks.
+    """
+    scheduler = scheduler or DomainScheduler()
+    variants = variants or {}
+    queued = set(urls)
+    # Variants with chunks from before they were collapsed, deleted once their target is in
+    stored_variants = set(await asyncio.to_thread(
+        chunk_store.page_versions, [url for spellings in variants.values() for url in spellings]))
 
-async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
-    """Crawl multiple URLs in parallel with a concurrency limit."""
     browser_config = BrowserConfig(
         headless=True,
         verbose=False,
@@ -201,27 +537,264 @@ async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
     # Create the crawler instance
     crawler = AsyncWebCrawler(config=browser_config)
     await crawler.start()
+    http_client = create_http_client(max_connections=max_concurrent * 2) if static_fast_path else None
+
+    # Each concurrent browser render gets its own session (tab) instead of all sharing one
+    session_ids = [f"session{i}" for i in range(max_concurrent)]
+    free_sessions = asyncio.Queue()
+    for session_id in session_ids:
+        free_sessions.put_nowait(session_id)
+
+    async def render_with_browser(url: str):
+        session_id = await free_sessions.get()
+        try:
+            return await crawler.arun(
+                url=url,
+                config=crawl_config,
+                session_id=session_id
+            )
+        finally:
+            free_sessions.put_nowait(session_id)
+
+    async def record_canonical_link(url: str, html: Optional[str]):
+        if canonicalizer is None or not html:
+            return
+        canonical = find_canonical_link(html, url)
+        if canonical and canonical != url:
+            await run_in_db_thread(canonicalizer.record_canonical, url, canonical)
+
+    async def fetch_without_browser(url: str) -> Tuple[Optional[int], Dict[str, str], Optional[str]]:
+        """
+        Fetch a page over HTTP and, if it is server-rendered, convert it with crawl4ai's usual
+        markdown pipeline. Returns (status code, headers, markdown or None if the browser is needed).
+        """
+        try:
+            page = await fetch_static(http_client, url)
+        except Exception as e:
+            print(f"Static fetch failed for {url}, falling back to browser: {e}")
+            return None, {}, None
+        if not is_usable(page):
+            return page.status_code, page.headers, None
+
+        await record_canonical_link(url, page.html)
+
+        # raw: input skips the browser and goes straight to crawl4ai's scraping and markdown steps
+        result = await crawler.arun(url="raw:" + page.html, config=crawl_config)
+        if not result.success or len(result.markdown_v2.raw_markdown) < MIN_STATIC_MARKDOWN:
+            return page.status_code, page.headers, None
+        return page.status_code, page.headers, result.markdown_v2.raw_markdown
+
+    async def fetch_page_without_browser(url: str) -> Tuple[Optional[int], Dict[str, str], Optional[str]]:
+        status_code, headers, markdown = await fetch_without_browser(url)
+        if markdown is not None:
+            print(f"Successfully fetched without browser: {url}")
+        return status_code, headers, markdown
+
+    async def render_page(url: str) -> Tuple[Optional[int], Dict[str, str], Optional[str]]:
+        result = await render_with_browser(url)
+        if not result.success:
+            print(f"Failed: {url} - Error: {result.error_message}")
+            return result.status_code, result.response_headers or {}, None
+        print(f"Successfully crawled: {url}")
+        await record_canonical_link(url, result.html)
+        return result.status_code, result.response_headers or {}, result.markdown_v2.raw_markdown
+
+    async def crawl_page_once(url: str) -> Tuple[Optional[int], Dict[str, str], Optional[str]]:
+        """Get a page's status, headers and markdown, skipping the browser when possible."""
+        return await fetch_with_fallback(
+            url, fetch_page_without_browser if http_client is not None else None, render_page
+        )
+
+    async def crawl_page(url: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Crawl a page within its host's limits, retrying after backoff when the host throttles us."""
+        for attempt in range(MAX_FETCH_ATTEMPTS):
+            async with scheduler.slot(url):
+                status_code, headers, markdown = await crawl_page_once(url)
+            scheduler.record(url, status_code, get_header(headers, "retry-after"))
+            if markdown is not None:
+                return markdown, headers
+            if not scheduler.should_retry(status_code):
+                return None
+            print(f"Retrying {url} after {status_code} (attempt {attempt + 2} of {MAX_FETCH_ATTEMPTS})")
+        return None
+
+    async def journal_mark(url: str, stage: str, error: Optional[str] = None):
+        if journal is not None:
+            await run_in_db_thread(journal.mark, url, stage, error)
+        if registry is not None and stage in STATUS_BY_STAGE:
+            await run_in_db_thread(registry.mark, url, STATUS_BY_STAGE[stage], error)
+        if STATUS_BY_STAGE.get(stage, "failed") != "failed":
+            for variant in variants.get(url, []):
+                if not await retire_variant(variant, manifest, variant in stored_variants):
+                    continue  # still pending, so the next run tries again
+                stored_variants.discard(variant)
+                if registry is not None:
+                    await run_in_db_thread(registry.mark, variant, VARIANT, f"crawled as {url}")
+
+    async def record_failure(url: str, stage: str, error: str):
+        """Send a URL that failed after all retries to the journal and the dead-letter queue."""
+        await journal_mark(url, "failed", error)
+        if dead_letters is not None:
+            await run_in_db_thread(dead_letters.add, url, stage, error)
+        await release_near_duplicates(url)
+
+    async def release_near_duplicates(url: str):
+        """Re-queue the pages skipped as copies of a failed page that has nothing stored to stand in for them."""
+        if duplicates is None or not duplicates.is_canonical(url):
+            return
+        if await asyncio.to_thread(chunk_store.page_versions, [url]):
+            return  # an earlier crawl of the page is still indexed
+        for copy in await run_in_db_thread(duplicates.remove, url):
+            print(f"{url} was not stored, re-queueing its near-duplicate {copy}")
+            if manifest is not None:
+                await run_in_db_thread(manifest.forget, copy)
+            await record_failure(copy, "deduplicated", f"near-duplicate of {url}, which failed to store")
+
+    async def release_variants():
+        """Stop matching near-duplicates against URLs that are now crawled as another target."""
+        if duplicates is None:
+            return
+        for target, spellings in variants.items():
+            for url in spellings:
+                for copy in await run_in_db_thread(duplicates.remove, url):
+                    if manifest is not None:
+                        await run_in_db_thread(manifest.forget, copy)
+                    if copy not in queued:
+                        await record_failure(copy, "deduplicated",
+                                             f"near-duplicate of {url}, which is now crawled as {target}")
+
+    def journaled(stage_name: str, handler, mark_dropped: bool = True):
+        """Wrap a stage handler so each document that completes it or fails is recorded."""
+        async def run(item):
+            url = item if isinstance(item, str) else item.url
+            try:
+                result = await handler(item)
+            except Exception as e:
+                await record_failure(url, stage_name, f"{type(e).__name__}: {e}")
+                raise
+            if result is not None:
+                await journal_mark(url, stage_name)
+            elif mark_dropped:
+                await record_failure(url, stage_name, f"{stage_name} stage failed")
+            return result
+        return run
+
+    async def fetch_document(url: str) -> Optional[DocumentJob]:
+        """Pipeline stage: crawl a URL, skipping it if it is unchanged since the last crawl."""
+        # A page fetched by an interrupted run is picked up where it left off
+        saved_page = await run_in_db_thread(journal.load_page, url) if journal else None
+        if saved_page is not None:
+            print(f"Resuming from journal: {url}")
+            return DocumentJob(url=url, **saved_page)
+
+        previous = await run_in_db_thread(manifest.get, url) if manifest and not refresh else None
+        if previous:
+            async with scheduler.slot(url):
+                unmodified = await asyncio.to_thread(is_unmodified, url, conditional_headers(previous))
+            if unmodified:
+                print(f"Unmodified, skipping: {url}")
+                await run_in_db_thread(manifest.touch, url)
+                await journal_mark(url, "skipped")
+                return None
+
+        page = await crawl_page(url)
+        if page is None:
+            await record_failure(url, "fetched", "crawl failed")
+            return None
+
+        markdown, headers = page
+        job = DocumentJob(
+            url=url,
+            markdown=markdown,
+            etag=get_header(headers, "etag"),
+            last_modified=get_header(headers, "last-modified"),
+            replace_existing=refresh
+        )
+        if manifest is not None:
+            job.page_hash = content_hash(job.markdown)
+            job.replace_existing = True
+            if previous and previous.content_hash == job.page_hash:
+                print(f"Content unchanged, skipping: {url}")
+                await run_in_db_thread(manifest.touch, url, job.etag, job.last_modified)
+                await journal_mark(url, "skipped")
+                return None
+
+        if journal is not None:
+            await run_in_db_thread(journal.save_page, url, {
+                "markdown": job.markdown,
+                "etag": job.etag,
+                "last_modified": job.last_modified,
+                "page_hash": job.page_hash,
+                "replace_existing": job.replace_existing,
+            })
+        return job
+
+    async def clean_document(job: DocumentJob) -> Optional[DocumentJob]:
+        """Pipeline stage: strip the host's boilerplate and skip pages that are only a paywall stub."""
+        if boilerplate is None:
+            return job
+        page = await run_in_db_thread(boilerplate.clean, job.url, job.markdown)
+        if page.paywalled or not page.markdown.strip():
+            reason = "paywall stub" if page.paywalled else "no content after removing boilerplate"
+            print(f"Skipping {job.url}: {reason}")
+            if manifest is not None and job.page_hash:
+                await run_in_db_thread(manifest.record, job.url, job.page_hash, 0, job.etag, job.last_modified)
+            await journal_mark(job.url, "skipped", reason)
+            return None
+        job.markdown = page.markdown
+        return job
+
+    async def dedupe_document(job: DocumentJob) -> Optional[DocumentJob]:
+        """Pipeline stage: drop near-duplicates of a page already indexed, keeping the first copy seen."""
+        if duplicates is None:
+            return job
+        signature = await asyncio.to_thread(duplicates.hasher.signature, job.markdown)
+        canonical = await run_in_db_thread(duplicates.add, job.url, signature)
+        if canonical is None:
+            job.aliases = await run_in_db_thread(duplicates.aliases, job.url)
+            return job
+
+        print(f"Near-duplicate of {canonical}, skipping: {job.url}")
+        # Chunks indexed for this URL before it was recognised as a copy would crowd search results
+        if not await delete_stale_chunks(job.url, 0):
+            await record_failure(job.url, "deduplicated", "could not delete chunks of duplicate page")
+            return None
+        if manifest is not None and job.page_hash:
+            await run_in_db_thread(manifest.record, job.url, job.page_hash, 0, job.etag, job.last_modified)
+        await journal_mark(job.url, "skipped")
+        return None
+
+    stages = [
+        Stage("fetch", journaled("fetched", fetch_document, mark_dropped=False), concurrency=max_concurrent),
+        Stage("clean", journaled("cleaned", clean_document, mark_dropped=False),
+              concurrency=STAGE_CONCURRENCY["clean"]),
+        Stage("dedupe", journaled("deduplicated", dedupe_document, mark_dropped=False),
+              concurrency=STAGE_CONCURRENCY["dedupe"]),
+        Stage("chunk", journaled("chunked", chunk_document), concurrency=STAGE_CONCURRENCY["chunk"]),
+        Stage("summarize",
+              journaled("summarized", functools.partial(summarize_document, mode=summary_mode,
+                                                        min_chars=min_summary_chars)),
+              concurrency=STAGE_CONCURRENCY["summarize"]),
+        Stage("embed", journaled("embedded", embed_document), concurrency=STAGE_CONCURRENCY["embed"]),
+        Stage("store", journaled("stored", functools.partial(store_document, manifest=manifest)),
+              concurrency=STAGE_CONCURRENCY["store"]),
+    ]
 
     try:
-        # Create a semaphore to limit concurrency
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
-        async def process_url(url: str):
-            async with semaphore:
-                result = await crawler.arun(
-                    url=url,
-                    config=crawl_config,
-                    session_id="session1"
-                )
-                if result.success:
-                    print(f"Successfully crawled: {url}")
-                    await process_and_store_document(url, result.markdown_v2.raw_markdown)
-                else:
-                    print(f"Failed: {url} - Error: {result.error_message}")
-        
-        # Process all URLs in parallel with limited concurrency
-        await asyncio.gather(*[process_url(url) for url in urls])
+        await release_variants()
+        await run_pipeline(interleave_by_host(urls), stages, metrics=ingest_metrics)
+
+        if duplicates is not None and duplicates.changed:
+            # Pages stored before (or in an earlier run than) their copies were found get their aliases now
+            await chunk_writer.flush()
+            for url in sorted(duplicates.changed):
+                await record_aliases(url, await run_in_db_thread(duplicates.aliases, url))
     finally:
+        print(scheduler.summary())
+        for session_id in session_ids:
+            await crawler.crawler_strategy.kill_session(session_id)
+        if http_client is not None:
+            await http_client.aclose()
         await crawler.close()
 
 def get_rimon_docs_urls() -> List[str]:
@@ -250,15 +823,207 @@ def get_rimon_docs_urls() -> List[str]:
         return []
 
 
+def canonicalize_urls(canonicalizer: UrlCanonicalizer, urls: List[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Collapse AMP, mobile and short-link variants into one crawl target each (see UrlCanonicalizer.collapse).
+
+    Returns:
+        Tuple[List[str], Dict[str, List[str]]]: The crawl targets, and the other URLs collapsed into each
+    """
+    targets, target_of = canonicalizer.collapse(urls)
+    print(f"Canonicalized {len(urls)} URLs to {len(targets)} crawl targets")
+    variants: Dict[str, List[str]] = {}
+    for url, target in target_of.items():
+        if url != target:
+            variants.setdefault(target, []).append(url)
+    return targets, variants
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Crawl article URLs and index them in the chunk store')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Skip URLs whose content is unchanged since the last crawl')
+    parser.add_argument('--manifest', default='crawl_manifest.sqlite',
+                        help='Per-URL crawl manifest used by --incremental')
+    parser.add_argument('--max-concurrent', type=int, default=5,
+                        help='Number of pages fetched at once (and size of the browser session pool)')
+    parser.add_argument('--max-per-host', type=int, default=2,
+                        help='Number of pages fetched at once from any one host')
+    parser.add_argument('--host-delay', type=float, default=1.0,
+                        help='Minimum seconds between requests to the same host')
+    parser.add_argument('--journal', default='crawl_journal.sqlite',
+                        help='Journal recording the progress of each run')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the most recent interrupted run from its journal')
+    parser.add_argument('--dead-letters', default='dead_letters.jsonl',
+                        help='File recording URLs that failed after all retries')
+    parser.add_argument('--retry-dead-letters', action='store_true',
+                        help='Crawl the URLs in the dead-letter file instead of urls.txt')
+    parser.add_argument('--summary-mode', choices=SUMMARY_MODES, default='chunk',
+                        help='chunk: one summary request per chunk; '
+                             'document: title/author once per page and several chunk summaries per request')
+    parser.add_argument('--min-summary-chars', type=int, default=0,
+                        help='Chunks shorter than this use their opening text instead of an LLM summary')
+    parser.add_argument('--duplicates', default='near_duplicates.sqlite',
+                        help='Index of page signatures used to detect near-duplicate pages')
+    parser.add_argument('--duplicate-threshold', type=float, default=0.8,
+                        help='Estimated similarity above which a page counts as a copy of another')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Ingest near-duplicate pages instead of keeping one copy')
+    parser.add_argument('--boilerplate', default='boilerplate.sqlite',
+                        help='Per-host counts of repeated blocks used to strip boilerplate')
+    parser.add_argument('--reclean', action='store_true',
+                        help='Re-crawl the pages stored before their host\'s boilerplate was learned, '
+                             'replacing their chunks with cleaned ones')
+    parser.add_argument('--no-clean', action='store_true',
+                        help='Keep boilerplate and paywall stubs instead of stripping/skipping them')
+    parser.add_argument('--metrics-json', default='ingest_metrics.json',
+                        help='Where to write the JSON metrics report of the run')
+    parser.add_argument('--metrics-prom', default='ingest_metrics.prom',
+                        help='Where to write the Prometheus text metrics report of the run')
+    parser.add_argument('--metrics-interval', type=float, default=0,
+                        help='Also rewrite the metrics reports every this many seconds while crawling')
+    parser.add_argument('--registry',
+                        help='Crawl only the URLs of this URL registry that were never processed or failed '
+                             '(see url_extraction.py --registry) instead of urls.txt, and record each outcome there')
+    parser.add_argument('--max-attempts', type=int, default=MAX_CRAWL_ATTEMPTS,
+                        help='With --registry, retry a failed URL until it has failed this many runs in a row '
+                             '(python url_registry.py requeue resets them)')
+    parser.add_argument('--canonical-index', default='url_canonical.sqlite',
+                        help='Cache of resolved short links and rel=canonical links used to collapse URL variants')
+    parser.add_argument('--no-canonicalize', action='store_true',
+                        help='Crawl every URL as listed instead of collapsing AMP/mobile/short-link variants')
+    parser.add_argument('--no-static', action='store_true',
+                        help='Render every page in the browser instead of trying plain HTTP first')
+    return parser.parse_args()
+
 async def main():
-    # Get URLs from Pydantic AI docs
-    urls = get_rimon_docs_urls()
-    if not urls:
-        print("No URLs found to crawl")
-        return
-    
-    print(f"Found {len(urls)} URLs to crawl")
-    await crawl_parallel(urls)
+    args = parse_args()
+    journal = CrawlJournal(args.journal)
+    dead_letters = DeadLetterQueue(args.dead_letters)
+    registry = UrlRegistry(args.registry) if args.registry else None
+    canonicalizer = None if args.no_canonicalize else UrlCanonicalizer(args.canonical_index)
+    # URLs collapsed into each crawl target, retired once it is crawled
+    variants: Dict[str, List[str]] = {}
+    boilerplate = None if args.no_clean else BoilerplateStripper(args.boilerplate)
+    manifest = CrawlManifest(args.manifest) if args.incremental else None
+    duplicates = None if args.no_dedupe else NearDuplicateIndex(args.duplicates, threshold=args.duplicate_threshold)
+
+    if args.resume:
+        run_id = journal.resume_latest_run()
+        if run_id is None:
+            print("No interrupted run to resume")
+            return
+        urls = journal.remaining_urls()
+        print(f"Resuming run {run_id}: {len(urls)} URLs left")
+    elif args.retry_dead_letters:
+        urls = dead_letters.urls()
+        if not urls:
+            print("No dead-lettered URLs to retry")
+            return
+        dead_letters.archive()
+        print(f"Retrying {len(urls)} dead-lettered URLs")
+        journal.start_run(urls)
+    elif args.reclean:
+        if boilerplate is None:
+            print("--reclean strips boilerplate, it can't be combined with --no-clean")
+            return
+        urls = boilerplate.early_urls()
+        if not urls:
+            print("No pages were stored before their host's boilerplate was learned")
+            return
+        print(f"Re-crawling {len(urls)} pages stored before their host's boilerplate was learned")
+        journal.start_run(urls)
+    elif registry is not None:
+        urls = registry.pending_urls(max_attempts=args.max_attempts)
+        if canonicalizer is not None:
+            urls, variants = canonicalize_urls(canonicalizer, urls)
+            # Variants indexed under their own URL by an earlier run
+            variant_urls = [url for spellings in variants.values() for url in spellings]
+            indexed = set(chunk_store.page_versions(variant_urls))
+            if duplicates is not None:
+                indexed.update(url for url in variant_urls if duplicates.is_canonical(url))
+            pending_targets = []
+            for target in urls:
+                entry = registry.get(target)
+                if entry is None or entry.status in (PENDING, "failed"):
+                    # New URLs, and a failed target retried for the new variants pointing at it
+                    pending_targets.append(target)
+                elif indexed.intersection(variants.get(target, [])):
+                    # Crawled again so the variants' own chunks can be replaced by it
+                    pending_targets.append(target)
+                else:
+                    # Already crawled (or skipped) under its own URL
+                    for url in variants.get(target, []):
+                        registry.mark(url, VARIANT, f"crawled as {target}")
+            urls = pending_targets
+        if not urls:
+            print(f"No new or retryable URLs in {args.registry}")
+            return
+        print(f"Found {len(urls)} new or retryable URLs to crawl in {args.registry}")
+        journal.start_run(urls)
+    else:
+        # Get URLs from Pydantic AI docs
+        urls = get_rimon_docs_urls()
+        if canonicalizer is not None:
+            urls, variants = canonicalize_urls(canonicalizer, urls)
+        if not urls:
+            print("No URLs found to crawl")
+            return
+        print(f"Found {len(urls)} URLs to crawl")
+        journal.start_run(urls)
+
+    live_metrics = None
+    if args.metrics_interval > 0:
+        live_metrics = asyncio.create_task(write_reports_periodically(
+            ingest_metrics, args.metrics_interval, args.metrics_json, args.metrics_prom
+        ))
+    try:
+        await crawl_parallel(urls, max_concurrent=args.max_concurrent, manifest=manifest,
+                             static_fast_path=not args.no_static,
+                             scheduler=DomainScheduler(args.max_per_host, args.host_delay),
+                             journal=journal, dead_letters=dead_letters,
+                             summary_mode=args.summary_mode, min_summary_chars=args.min_summary_chars,
+                             duplicates=duplicates, boilerplate=boilerplate, registry=registry,
+                             canonicalizer=canonicalizer, variants=variants, refresh=args.reclean)
+        await run_in_db_thread(journal.finish_run)
+    finally:
+        if live_metrics is not None:
+            live_metrics.cancel()
+        await chunk_writer.flush()
+        print(chunk_writer.summary())
+        try:
+            await asyncio.to_thread(chunk_store.refresh_catalog)
+        except Exception as e:
+            print(f"Could not refresh the document catalog: {e}")
+        print(f"Ingest cache: {ingest_cache.hits} hits, {ingest_cache.misses} misses")
+        print(f"Journal: {await run_in_db_thread(journal.summary)}")
+        print(embedding_limiter.summary())
+        print(chat_limiter.summary())
+        if dead_letters.count:
+            print(f"{dead_letters.count} URLs failed and were written to {dead_letters.path}")
+        await run_in_db_thread(ingest_cache.close)
+        await asyncio.to_thread(chunk_store.close)
+        await run_in_db_thread(journal.close)
+        if manifest:
+            await run_in_db_thread(manifest.close)
+        if boilerplate:
+            print(boilerplate.summary())
+            await run_in_db_thread(boilerplate.close)
+        if duplicates:
+            print(f"Near-duplicates: {duplicates.duplicates_found} pages skipped as copies")
+            await run_in_db_thread(duplicates.close)
+        if registry:
+            print(f"URL registry: {await run_in_db_thread(registry.summary)}")
+            await run_in_db_thread(registry.close)
+        if canonicalizer:
+            await run_in_db_thread(canonicalizer.close)
+
+        ingest_metrics.inc("ingest_cache_lookups_total", ingest_cache.hits, result="hit")
+        ingest_metrics.inc("ingest_cache_lookups_total", ingest_cache.misses, result="miss")
+        print(ingest_metrics.bottlenecks())
+        ingest_metrics.write_reports(args.metrics_json, args.metrics_prom)
+        print(f"Metrics written to {args.metrics_json} and {args.metrics_prom}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,120 @@
+# domain-aware scheduling for the crawler
+# urls.txt is dominated by a few news sites, so URLs are interleaved across hosts and each
+# host gets its own concurrency limit and request spacing, which widens when it throttles us
+
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+# Responses that mean the host wants us to slow down
+THROTTLE_STATUSES = {403, 429, 503}
+
+# Throttling responses worth retrying after backing off (403 is often a hard block)
+RETRY_STATUSES = {429, 503}
+
+# Smallest delay after a throttling response, so backoff doubles from here even with no base delay
+MIN_BACKOFF_DELAY = 1.0
+
+
+def host_of(url: str) -> str:
+    """Host used for scheduling, so www.example.com and example.com share limits."""
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def interleave_by_host(urls: List[str]) -> List[str]:
+    """Reorder URLs round-robin across hosts, keeping each host's URLs in their original order."""
+    by_host: Dict[str, List[str]] = OrderedDict()
+    for url in urls:
+        by_host.setdefault(host_of(url), []).append(url)
+
+    interleaved = []
+    queues = [list(reversed(host_urls)) for host_urls in by_host.values()]
+    while queues:
+        for queue in queues:
+            interleaved.append(queue.pop())
+        queues = [queue for queue in queues if queue]
+    return interleaved
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostState:
+    def __init__(self, max_per_host: int, delay: float):
+        self.semaphore = asyncio.Semaphore(max_per_host)
+        self.delay = delay
+        self.next_allowed = 0.0
+        self.throttled = 0
+
+
+class DomainScheduler:
+    """
+    Per-host concurrency and request spacing with adaptive backoff.
+
+    Every request to a host waits for one of max_per_host slots and for the host's
+    current delay since the previous request. A throttling response doubles the delay, to
+    at least MIN_BACKOFF_DELAY (or uses Retry-After if longer); successful responses shrink
+    it back toward base_delay.
+    """
+
+    def __init__(self, max_per_host: int = 2, base_delay: float = 1.0, max_delay: float = 120.0):
+        self.max_per_host = max_per_host
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hosts: Dict[str, _HostState] = {}
+
+    def _state(self, url: str) -> _HostState:
+        host = host_of(url)
+        if host not in self.hosts:
+            self.hosts[host] = _HostState(self.max_per_host, self.base_delay)
+        return self.hosts[host]
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Wait until a request to this URL's host is allowed, and hold a host slot while it runs."""
+        state = self._state(url)
+        async with state.semaphore:
+            # Reserve the next start time before sleeping, so waiting requests stay spaced out
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            start = max(now, state.next_allowed)
+            state.next_allowed = start + state.delay
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+    def record(self, url: str, status_code: Optional[int], retry_after: Optional[str] = None):
+        """Adapt the host's request spacing to the response it just gave."""
+        state = self._state(url)
+        if status_code in THROTTLE_STATUSES:
+            state.throttled += 1
+            wait = parse_retry_after(retry_after) or 0.0
+            state.delay = min(self.max_delay, max(state.delay * 2, self.base_delay, MIN_BACKOFF_DELAY, wait))
+            state.next_allowed = max(state.next_allowed, asyncio.get_running_loop().time() + state.delay)
+            print(f"{host_of(url)} returned {status_code}, backing off to {state.delay:.1f}s between requests")
+        elif status_code is not None and status_code < 400:
+            state.delay = max(self.base_delay, state.delay * 0.8)
+
+    def should_retry(self, status_code: Optional[int]) -> bool:
+        return status_code in RETRY_STATUSES
+
+    def summary(self) -> str:
+        throttled = {host: state.throttled for host, state in self.hosts.items() if state.throttled}
+        return f"Crawled {len(self.hosts)} hosts, throttled by {len(throttled)}: {throttled}"
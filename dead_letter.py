@@ -0,0 +1,43 @@
+# dead-letter queue for the ingest pipeline
+# URLs that still fail after retries are written here instead of being stored as
+# placeholder rows, so they can be inspected and re-driven later
+
+import json
+import os
+from datetime import datetime, timezone
+from typing import List
+
+
+class DeadLetterQueue:
+    """Append-only JSON-lines file of failed URLs with the stage and error they failed with."""
+
+    def __init__(self, path: str = "dead_letters.jsonl"):
+        self.path = path
+        self.count = 0
+
+    def add(self, url: str, stage: str, error: str):
+        record = {
+            "url": url,
+            "stage": stage,
+            "error": error,
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        self.count += 1
+
+    def urls(self) -> List[str]:
+        """Unique URLs in the queue, in the order they first failed."""
+        if not os.path.exists(self.path):
+            return []
+        urls = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    urls.setdefault(json.loads(line)["url"], None)
+        return list(urls)
+
+    def archive(self):
+        """Move the current queue aside once its URLs have been picked up for a retry."""
+        if os.path.exists(self.path):
+            os.replace(self.path, self.path + ".retried")
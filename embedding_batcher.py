@@ -0,0 +1,105 @@
+# micro-batching for OpenAI embedding requests
+# collects texts from all concurrent callers and sends them as one multi-input request,
+# then hands each vector back to the caller that asked for it
+
+import asyncio
+from typing import List, Optional, Tuple
+
+import openai
+from openai import AsyncOpenAI
+
+from openai_limiter import OpenAIRateLimiter, estimate_tokens
+
+
+class EmbeddingBatcher:
+    """
+    Collect embedding requests from concurrent callers and send them in batches.
+
+    A batch is sent when it holds max_batch_size texts, or max_wait seconds after
+    the first text of the batch was queued, whichever comes first. Requests go through
+    the rate limiter if one is given; a text whose embedding cannot be fetched raises
+    in its caller instead of returning a placeholder vector.
+    """
+
+    def __init__(self, openai_client: AsyncOpenAI, model: str = "text-embedding-3-small",
+                 max_batch_size: int = 100, max_wait: float = 0.05,
+                 rate_limiter: Optional[OpenAIRateLimiter] = None):
+        self.openai_client = openai_client
+        self.rate_limiter = rate_limiter
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = set()
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue a text for the next batch and wait for its embedding vector."""
+        # The API rejects empty inputs, and one bad input would fail the whole batch
+        if not text or not text.strip():
+            raise ValueError("Cannot embed empty text")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._send_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._send_pending)
+
+        return await future
+
+    async def flush(self):
+        """Send whatever is queued and wait for all in-flight batches to finish."""
+        self._send_pending()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def _send_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._send_batch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _request(self, texts: List[str]):
+        def request():
+            return self.openai_client.embeddings.create(model=self.model, input=texts)
+
+        if self.rate_limiter is None:
+            return await request()
+        return await self.rate_limiter.run(request, sum(estimate_tokens(text) for text in texts))
+
+    async def _send_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            response = await self._request([text for text, _ in batch])
+        except openai.BadRequestError as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # One bad input rejects the whole request, so send them one by one to isolate it
+            print(f"Embedding batch of {len(batch)} rejected, retrying inputs individually: {e}")
+            await asyncio.gather(*[self._send_batch([item]) for item in batch])
+            return
+        except Exception as e:
+            print(f"Error getting embeddings for batch of {len(batch)}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Each result carries the index of the input it belongs to
+        for item in response.data:
+            future = batch[item.index][1]
+            if not future.done():
+                future.set_result(item.embedding)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding missing from batch response"))
@@ -0,0 +1,143 @@
+# on-disk cache of OpenAI results for the crawl pipeline
+# entries are keyed by a hash of (model, prompt version, input text), so re-crawls of
+# unchanged pages reuse their embeddings and summaries instead of paying for them again
+
+import hashlib
+import json
+import sqlite3
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+# Last-used times of cache hits are written in batches of this many (and with the next put, and at close)
+TOUCH_BATCH_SIZE = 1000
+
+
+class IngestCache:
+    """
+    SQLite-backed cache of embeddings and summaries with size-based eviction.
+
+    When the stored values grow past max_bytes, the least recently used entries
+    are evicted until the cache is back under its low-water mark. Hits only note
+    their last-used time in memory; it is written out in batches.
+    """
+
+    def __init__(self, path: str = "ingest_cache.sqlite", max_bytes: int = 512 * 1024 * 1024,
+                 low_water: float = 0.9):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        # Last-used times of hits not yet written
+        self._touched: Dict[str, float] = {}
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.execute("""
+            create table if not exists cache_entries (
+                key text primary key,
+                value blob not null,
+                size integer not null,
+                last_used real not null
+            )
+        """)
+        self.conn.execute("create index if not exists idx_cache_last_used on cache_entries (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "select coalesce(sum(size), 0) from cache_entries"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, text: str) -> str:
+        """Hash (model, prompt version, text) into a cache key."""
+        digest = hashlib.sha256()
+        for part in (model, prompt_version, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_embedding(self, key: str) -> Optional[List[float]]:
+        """Return a cached embedding vector, or None on a miss."""
+        value = self._get(key)
+        if value is None:
+            return None
+        vector = array("f")
+        vector.frombytes(value)
+        return vector.tolist()
+
+    def put_embedding(self, key: str, embedding: List[float]):
+        """Store an embedding vector as packed float32."""
+        self._put(key, array("f", embedding).tobytes())
+
+    def get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached JSON value (e.g. a title/summary dict), or None on a miss."""
+        value = self._get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def put_json(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serialisable value."""
+        self._put(key, json.dumps(value).encode("utf-8"))
+
+    def flush(self):
+        """Write the last-used times of the hits since the last flush."""
+        self._write_touches()
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        row = self.conn.execute("select value from cache_entries where key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH_SIZE:
+            self.flush()
+        return row[0]
+
+    def _write_touches(self):
+        if self._touched:
+            self.conn.executemany(
+                "update cache_entries set last_used = ? where key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _put(self, key: str, value: bytes):
+        old = self.conn.execute("select size from cache_entries where key = ?", (key,)).fetchone()
+        if old is not None:
+            self.total_bytes -= old[0]
+
+        self.conn.execute(
+            "insert or replace into cache_entries (key, value, size, last_used) values (?, ?, ?, ?)",
+            (key, value, len(value), time.time())
+        )
+        self.total_bytes += len(value)
+        self._touched.pop(key, None)
+        # Eviction must see which entries were hit recently
+        self._write_touches()
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is under its low-water mark."""
+        target = int(self.max_bytes * self.low_water)
+        rows = self.conn.execute("select key, size from cache_entries order by last_used")
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+
+        self.conn.executemany("delete from cache_entries where key = ?", evicted)
+        print(f"Evicted {len(evicted)} entries from ingest cache")
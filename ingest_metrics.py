@@ -0,0 +1,215 @@
+# metrics for the ingest pipeline
+# counters, gauges and latency histograms recorded by the pipeline stages, the OpenAI rate
+# limiters and the bulk writer, reported as JSON and in the Prometheus text format at the end
+# of a run (or periodically while it runs)
+
+import asyncio
+import bisect
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+
+# HELP text and type of every metric, in report order
+METRICS = {
+    "ingest_stage_seconds": ("histogram", "Time spent in a pipeline stage handler per item"),
+    "ingest_stage_items_total": ("counter", "Items that left a pipeline stage, by outcome"),
+    "ingest_stage_failures_total": ("counter", "Exceptions raised by a pipeline stage, by error type"),
+    "ingest_queue_depth": ("gauge", "Items waiting in a stage's input queue when last sampled"),
+    "ingest_queue_depth_max": ("gauge", "Largest number of items seen waiting in a stage's input queue"),
+    "ingest_stage_busy_workers_max": ("gauge", "Largest number of a stage's workers busy at once"),
+    "openai_request_seconds": ("histogram", "Latency of successful OpenAI requests"),
+    "openai_requests_total": ("counter", "OpenAI requests sent, by outcome"),
+    "openai_tokens_total": ("counter", "Tokens sent to OpenAI (as reported in usage, else estimated)"),
+    "store_batch_seconds": ("histogram", "Latency of bulk upserts to the chunk store"),
+    "store_rows_total": ("counter", "Rows upserted to the chunk store, by outcome"),
+    "store_bytes_total": ("counter", "JSON bytes of rows upserted to the chunk store"),
+    "ingest_cache_lookups_total": ("counter", "Ingest cache lookups, by result"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = [(key, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")) for key, value in pairs]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile (the largest bound for +Inf)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [self.buckets[-1]], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class IngestMetrics:
+    """
+    In-process registry of the ingest run's metrics.
+
+    Components that are given an IngestMetrics record into it; every update is a
+    dictionary operation on the event loop thread, so recording costs next to nothing.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges[(name, _labels(labels))] = value
+
+    def max_gauge(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        self.gauges[key] = max(self.gauges.get(key, value), value)
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def to_json(self) -> Dict[str, Any]:
+        """The metrics as a JSON-serializable report."""
+        def entries(values: Dict[Tuple[str, Labels], Any]):
+            return sorted(values.items(), key=lambda item: (item[0][0], item[0][1]))
+
+        return {
+            "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in entries(self.counters)
+            ],
+            "gauges": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in entries(self.gauges)
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "mean": round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": dict(histogram.cumulative()),
+                }
+                for (name, labels), histogram in entries(self.histograms)
+            ],
+        }
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            if kind == "histogram":
+                series = sorted((labels, h) for (n, labels), h in self.histograms.items() if n == name)
+            else:
+                values = self.counters if kind == "counter" else self.gauges
+                series = sorted((labels, v) for (n, labels), v in values.items() if n == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind == "histogram":
+                    for bound, count in value.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def render_reports(self, json_path: Optional[str] = None,
+                       prometheus_path: Optional[str] = None) -> Dict[str, str]:
+        """The JSON and/or Prometheus report contents by path."""
+        reports = {}
+        if json_path:
+            reports[json_path] = json.dumps(self.to_json(), indent=2)
+        if prometheus_path:
+            reports[prometheus_path] = self.to_prometheus()
+        return reports
+
+    def write_reports(self, json_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        """Write the JSON and/or Prometheus reports."""
+        write_files(self.render_reports(json_path, prometheus_path))
+
+    def bottlenecks(self) -> str:
+        """One line per pipeline stage with its mean latency and deepest input queue."""
+        lines = []
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name != "ingest_stage_seconds" or not histogram.count:
+                continue
+            stage = dict(labels)["stage"]
+            depth = self.gauges.get(("ingest_queue_depth_max", labels), 0)
+            lines.append(f"{stage}: {histogram.count} items, mean {histogram.sum / histogram.count:.2f}s, "
+                         f"p95 <= {histogram.quantile(0.95)}s, max queue {depth:.0f}")
+        return "\n".join(lines)
+
+
+def write_files(contents: Dict[str, str]):
+    """Write each file through a temporary file, so readers never see a half-written report."""
+    for path, content in contents.items():
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+
+async def write_reports_periodically(metrics: IngestMetrics, interval: float,
+                                     json_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+    """Rewrite the reports every interval seconds until cancelled (for live monitoring)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Rendered on the event loop, where the metrics are updated, and written in a thread
+            await asyncio.to_thread(write_files, metrics.render_reports(json_path, prometheus_path))
+        except OSError as e:
+            print(f"Error writing metrics reports: {e}")
@@ -0,0 +1,102 @@
+# staged producer/consumer pipeline for the ingest job
+# each stage has its own worker pool and reads from a bounded queue, so a slow stage
+# applies backpressure upstream instead of letting work pile up in memory
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+from ingest_metrics import IngestMetrics
+
+# Marks the end of a stage's input
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline.
+
+    handler receives an item and returns the item to pass on, or None to drop it.
+    An exception drops the item and is counted as a failure of this stage.
+    """
+    name: str
+    handler: Callable[[Any], Awaitable[Optional[Any]]]
+    concurrency: int = 1
+    queue_size: int = 0
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    busy: int = 0
+
+    def __post_init__(self):
+        if self.queue_size <= 0:
+            self.queue_size = self.concurrency * 2
+
+
+async def run_pipeline(items: Iterable[Any], stages: List[Stage], metrics: Optional[IngestMetrics] = None):
+    """
+    Feed items through the stages in order and wait until every item has left the pipeline.
+
+    With metrics, each stage's handler latency, outcomes, failures by error type, input
+    queue depth and busy workers are recorded.
+    """
+    queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in stages]
+
+    async def worker(index: int):
+        stage = stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            item = await inbox.get()
+            if item is _STOP:
+                return
+            if metrics is not None:
+                metrics.set_gauge("ingest_queue_depth", inbox.qsize(), stage=stage.name)
+                metrics.max_gauge("ingest_queue_depth_max", inbox.qsize() + 1, stage=stage.name)
+                metrics.max_gauge("ingest_stage_busy_workers_max", stage.busy + 1, stage=stage.name)
+
+            stage.busy += 1
+            start = time.perf_counter()
+            try:
+                result = await stage.handler(item)
+            except Exception as e:
+                stage.failed += 1
+                print(f"Error in {stage.name} stage: {e}")
+                if metrics is not None:
+                    metrics.inc("ingest_stage_failures_total", stage=stage.name, error=type(e).__name__)
+                    metrics.inc("ingest_stage_items_total", stage=stage.name, outcome="failed")
+                continue
+            finally:
+                stage.busy -= 1
+                if metrics is not None:
+                    metrics.observe("ingest_stage_seconds", time.perf_counter() - start, stage=stage.name)
+            if result is None:
+                stage.dropped += 1
+                if metrics is not None:
+                    metrics.inc("ingest_stage_items_total", stage=stage.name, outcome="dropped")
+                continue
+            stage.processed += 1
+            if metrics is not None:
+                metrics.inc("ingest_stage_items_total", stage=stage.name, outcome="passed")
+            if outbox is not None:
+                await outbox.put(result)
+
+    async def run_stage(index: int):
+        await asyncio.gather(*[worker(index) for _ in range(stages[index].concurrency)])
+        # All workers of this stage are done, so the next stage gets no more input
+        if index + 1 < len(stages):
+            for _ in range(stages[index + 1].concurrency):
+                await queues[index + 1].put(_STOP)
+
+    async def produce():
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(stages[0].concurrency):
+            await queues[0].put(_STOP)
+
+    await asyncio.gather(produce(), *[run_stage(i) for i in range(len(stages))])
+
+    for stage in stages:
+        print(f"{stage.name}: {stage.processed} passed, {stage.dropped} skipped, {stage.failed} failed")
@@ -0,0 +1,165 @@
+# in-process caches for the agent
+# an LRU bounded by entries (and optionally bytes) with a time-to-live per entry, safe to share
+# between the threads Streamlit runs sessions on, counting hits and misses so its hit rate can be
+# reported, and an in-process copy of the store's document catalog that is reloaded only when the
+# ingest changed it
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Least-recently-used cache of at most max_entries entries, each valid for ttl seconds.
+
+    Expired entries are dropped when they are looked up; when the cache is full, the least
+    recently used entry makes room for the new one. With max_bytes, the entries' total size
+    (measured by sizeof, sys.getsizeof by default) is bounded too, and a value larger than
+    max_bytes on its own is not cached.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024, ttl: float = 3600.0,
+                 max_bytes: Optional[int] = None, sizeof: Optional[Callable[[Any], int]] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or sys.getsizeof
+        # Key -> (expiry time, value, size in bytes)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                self._discard(key)
+            self.misses += 1
+            return default
+
+    def _discard(self, key: Hashable):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (expires, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def summary(self) -> str:
+        rate = self.hit_rate
+        size = f" ({self.bytes / 1024:.0f} of {self.max_bytes / 1024:.0f} KB)" if self.max_bytes is not None else ""
+        return (f"{self.name} cache: {self.hits} hits, {self.misses} misses"
+                f"{f' ({rate:.0%} hit rate)' if rate is not None else ''}, {len(self._entries)} entries{size}")
+
+
+class DocumentCatalog:
+    """
+    In-process copy of a chunk store's document catalog, reloaded when its catalog version changes.
+
+    The version is checked at most every check_interval seconds, so most reads cost no round
+    trip to the store; a reload pages through ChunkStore.list_documents.
+    """
+
+    def __init__(self, check_interval: float = 30.0):
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._versions = TTLCache("Catalog version", max_entries=16, ttl=check_interval)
+        # Keyed by (store name, catalog version); superseded versions fall out of the LRU
+        self._documents = TTLCache("Document catalog", max_entries=4, ttl=float("inf"))
+        self._lock = threading.Lock()
+
+    def version(self, store) -> str:
+        """The store's catalog version, as checked at most check_interval seconds ago."""
+        version = self._versions.get(store.name)
+        if version is None:
+            version = store.catalog_version()
+            self._versions.set(store.name, version)
+        return version
+
+    def documents(self, store) -> List[Dict[str, Any]]:
+        """Every document in the store's catalog, in URL order."""
+        # One session reloads while the others wait for its copy
+        with self._lock:
+            version = self.version(store)
+            documents = self._documents.get((store.name, version))
+            if documents is None:
+                documents = store.list_documents()
+                self._documents.set((store.name, version), documents)
+                self.reloads += 1
+            return documents
+
+    def document(self, store, url: str) -> Optional[Dict[str, Any]]:
+        """The catalog row of url, or None if the catalog doesn't list it."""
+        return next((document for document in self.documents(store) if document["url"] == url), None)
+
+    def search(self, store, search: Optional[str] = None, limit: Optional[int] = None,
+               offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Page through the documents whose url, title or author contain search (case-insensitive).
+
+        Returns:
+            The number of matching documents, and the limit of them (all if None) from offset, in URL order.
+        """
+        documents = self.documents(store)
+        if search:
+            needle = search.casefold()
+            documents = [document for document in documents
+                         if any(needle in (document.get(column) or "").casefold()
+                                for column in ("url", "title", "author"))]
+        end = None if limit is None else offset + limit
+        return len(documents), documents[offset:end]
+
+    def clear(self):
+        self._versions.clear()
+        self._documents.clear()
+
+    def summary(self) -> str:
+        return (f"Document catalog: {len(self._documents)} cached versions, {self.reloads} reloads, "
+                f"{self._versions.summary()}")
@@ -0,0 +1,192 @@
+# near-duplicate page detection for the ingest pipeline
+# the same story is often published under several URLs (syndication partners, print views,
+# tracking parameters); MinHash signatures with LSH banding find those copies before they are
+# chunked, summarized and embedded, and the first URL seen is kept as the canonical copy
+
+import hashlib
+import re
+import sqlite3
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Large prime for the universal hash family (2^61 - 1)
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, size: int = 5) -> Set[str]:
+    """Word n-grams of the lower-cased text, ignoring markdown punctuation and whitespace."""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures of num_perm 32-bit hash permutations."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a and b below 2^32 keep a * hash + b within 64 bits
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Signature of the text's shingles, or None if it has no words."""
+        words = shingles(text)
+        if not words:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+             for word in words),
+            dtype=np.uint64, count=len(words)
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """
+    SQLite-backed index of page signatures that maps near-duplicate URLs to a canonical URL.
+
+    Signatures are bucketed by LSH bands, so only pages sharing at least one band are
+    compared. With the default 16 bands of 8 rows, pages above ~0.7 similarity are almost
+    always compared; a page counts as a duplicate at threshold estimated similarity.
+    Signatures persist across runs, so a new copy of a page indexed earlier is still caught
+    when an incremental run skips the original.
+    """
+
+    def __init__(self, path: str = "near_duplicates.sqlite", threshold: float = 0.8,
+                 num_perm: int = 128, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.duplicates_found = 0
+        # Canonical URLs that gained an alias during this run
+        self.changed: Set[str] = set()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists page_signatures (
+                url text primary key,
+                signature blob not null,
+                canonical_url text
+            )
+        """)
+        self.conn.commit()
+
+        # Band buckets of canonical pages only; duplicates are never chosen as canonical
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[bytes, Set[str]] = {}
+        for url, blob in self.conn.execute(
+                "select url, signature from page_signatures where canonical_url is null"):
+            self._add_canonical(url, np.frombuffer(blob, dtype=np.uint32))
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            bytes([band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def _add_canonical(self, url: str, signature: np.ndarray):
+        self._signatures[url] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(url)
+
+    def _remove_canonical(self, url: str):
+        signature = self._signatures.pop(url, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            self._buckets.get(key, set()).discard(url)
+
+    def find_canonical(self, url: str, signature: np.ndarray) -> Optional[str]:
+        """The most similar other canonical page above the threshold, if any."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+        candidates.discard(url)
+
+        best_url, best_score = None, self.threshold
+        for candidate in sorted(candidates):
+            score = similarity(signature, self._signatures[candidate])
+            if score >= best_score:
+                best_url, best_score = candidate, score
+        return best_url
+
+    def add(self, url: str, signature: Optional[np.ndarray]) -> Optional[str]:
+        """
+        Register a crawled page.
+
+        Args:
+            url: The page URL
+            signature: MinHasher.signature of the page markdown (None for an empty page)
+
+        Returns:
+            Optional[str]: The canonical URL if the page is a near-duplicate of one already
+                indexed, otherwise None (the page is canonical itself)
+        """
+        if signature is None:
+            return None
+
+        # Content may have changed since the page was last indexed
+        self._remove_canonical(url)
+        canonical = self.find_canonical(url, signature)
+        self.conn.execute(
+            "insert or replace into page_signatures (url, signature, canonical_url) values (?, ?, ?)",
+            (url, signature.tobytes(), canonical)
+        )
+        self.conn.commit()
+
+        if canonical is None:
+            self._add_canonical(url, signature)
+        else:
+            self.duplicates_found += 1
+            self.changed.add(canonical)
+        return canonical
+
+    def aliases(self, url: str) -> List[str]:
+        """URLs recorded as near-duplicates of a canonical URL."""
+        rows = self.conn.execute(
+            "select url from page_signatures where canonical_url = ? order by url", (url,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_canonical(self, url: str) -> bool:
+        """Whether near-duplicates of other pages are matched against this one."""
+        return url in self._signatures
+
+    def remove(self, url: str) -> List[str]:
+        """
+        Forget a page that failed before it was stored, so it no longer stands in for others.
+
+        Args:
+            url: The page URL
+
+        Returns:
+            List[str]: The URLs that were skipped as its near-duplicates; they were never
+                indexed either and must be crawled again
+        """
+        copies = self.aliases(url)
+        self._remove_canonical(url)
+        self.conn.execute("delete from page_signatures where url = ? or canonical_url = ?", (url, url))
+        self.conn.commit()
+        self.changed.discard(url)
+        return copies
+
+    def close(self):
+        self.conn.close()
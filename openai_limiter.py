@@ -0,0 +1,176 @@
+# shared pacing, concurrency control and retries for OpenAI requests
+# requests are paced against the model's RPM/TPM limits with token buckets, the number of
+# concurrent requests adapts to 429s (AIMD), and transient errors are retried with jitter
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import openai
+
+from ingest_metrics import IngestMetrics
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of English text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Token bucket refilled at rate_per_minute, holding at most capacity tokens."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        # Allow bursts of ~10 seconds' worth by default rather than a whole minute's quota
+        self.capacity = capacity or max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float):
+        """Wait until amount tokens are available and take them."""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AimdLimiter:
+    """
+    Concurrency limit that grows additively while requests succeed and halves on throttling.
+
+    Only one decrease is applied per cooldown period, so a burst of 429s from requests that
+    were already in flight counts as a single congestion signal.
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, cooldown: float = 2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, throttled: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease > self.cooldown:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait, if the error response says."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class OpenAIRateLimiter:
+    """
+    Shared wrapper that every request to one OpenAI model goes through.
+
+    Each request waits for the RPM and TPM buckets and for a slot under the AIMD
+    concurrency limit, then is retried with jittered exponential backoff on
+    transient errors. The last error is raised once retries run out.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float,
+                 initial_concurrency: int = 8, max_concurrency: int = 64,
+                 max_retries: int = 5, base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 metrics: Optional[IngestMetrics] = None):
+        self.name = name
+        self.metrics = metrics
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AimdLimiter(initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.throttled = 0
+        self.retries = 0
+
+    async def run(self, request: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Any:
+        """Send request() once the limits allow, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            await self.concurrency.acquire()
+
+            throttled = False
+            start = time.perf_counter()
+            try:
+                response = await request()
+                self._record_success(response, estimated_tokens, time.perf_counter() - start)
+                return response
+            except RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                if throttled:
+                    self.throttled += 1
+                self._record_failure("throttled" if throttled else "retryable_error")
+                if attempt == self.max_retries:
+                    raise
+                # Jitter on top of any retry-after, so requests throttled together don't all retry together
+                jitter = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                delay = (_retry_after(e) or 0) + jitter
+                self.retries += 1
+                print(f"{self.name}: {type(e).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            except Exception:
+                self._record_failure("error")
+                raise
+            finally:
+                await self.concurrency.release(throttled)
+
+            await asyncio.sleep(delay)
+
+    def _record_success(self, response: Any, estimated_tokens: int, seconds: float):
+        if self.metrics is None:
+            return
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", None) or estimated_tokens
+        self.metrics.observe("openai_request_seconds", seconds, api=self.name)
+        self.metrics.inc("openai_requests_total", api=self.name, outcome="ok")
+        self.metrics.inc("openai_tokens_total", tokens, api=self.name)
+
+    def _record_failure(self, outcome: str):
+        if self.metrics is not None:
+            self.metrics.inc("openai_requests_total", api=self.name, outcome=outcome)
+
+    def summary(self) -> str:
+        return (f"{self.name}: {self.retries} retries, {self.throttled} rate-limited, "
+                f"concurrency limit {self.concurrency.limit:.1f}")
@@ -5,35 +5,65 @@
 
 from __future__ import annotations as _annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 import logfire
 import asyncio
 import httpx
 import os
+import re
 
 from pydantic_ai import Agent, ModelRetry, RunContext
 from pydantic_ai.models.openai import OpenAIModel
 from openai import AsyncOpenAI
-from supabase import Client
-from typing import List
-import streamlit as st
+from typing import Any, Dict, List, Optional, Set
+
+from config import load_secrets
+from memory_cache import DocumentCatalog, TTLCache
+from storage import ChunkStore
 
 #load_dotenv()
-OPENAI_API_KEY= st.secrets["OPENAI_API_KEY"]
-SUPABASE_URL=st.secrets["SUPABASE_URL"]
-SUPABASE_SERVICE_KEY=st.secrets["SUPABASE_SERVICE_KEY"]
-LLM_MODEL=st.secrets["LLM_MODEL"]
+load_secrets()
 
 llm = os.getenv('LLM_MODEL', 'gpt-4o-mini')
 model = OpenAIModel(llm)
 
 logfire.configure(send_to_logfire='if-token-present')
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Query embeddings by (model, normalized query), shared by every session in the process
+query_embedding_cache = TTLCache(
+    "Query embedding",
+    max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+)
+
+# Copy of the store's document catalog, reloaded when an ingest run changes it
+document_catalog = DocumentCatalog(
+    check_interval=float(os.getenv("DOCUMENT_CATALOG_CHECK_INTERVAL", "30"))
+)
+
+def page_chunks_size(chunks: List[Dict[str, Any]]) -> int:
+    """UTF-8 size of the text of a page's chunks."""
+    return sum(len(chunk['title'].encode('utf-8')) + len(chunk['content'].encode('utf-8')) for chunk in chunks)
+
+# Chunks of the pages the agent read, by (store, catalog version, url, chunk window), shared by every
+# session; an ingest run changes the catalog version, so pages are never served stale
+page_cache = TTLCache(
+    "Page",
+    max_entries=int(os.getenv("PAGE_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("PAGE_CACHE_TTL", "3600")),
+    max_bytes=int(float(os.getenv("PAGE_CACHE_MAX_MB", "32")) * 1024 * 1024),
+    sizeof=page_chunks_size
+)
+
 @dataclass
 class PydanticAIDeps:
-    supabase: Client
+    store: ChunkStore
     openai_client: AsyncOpenAI
+    # Pages whose chunks the tools returned during the run (what the answer was drawn from)
+    source_urls: Set[str] = field(default_factory=set)
 
 system_prompt = """
 You are an expert at understanding the Pomegranate Place Facebook group documents that you have access to, which concerns Jewish life around the world, or the Israel-Palestine conflict, or US politics, or antisemitism or Zionism or racism or culture or community. 
@@ -47,6 +77,8 @@ Please extract paragraphs from each returned chunk in RAG, and add a citation fo
 The citation should appear directly below the paragraph, and should contain the article title, author, date and url which is the source of the chunk used to extract this paragraph.  
 
 Then also always check the list of available Pomegranate Place article urls and retrieve the content of page(s) if it'll help.
+Search the list by a word of the title, author or url, and page through it with offset when it has more articles than were returned.
+To read the context of a RAG chunk, retrieve only the chunks around it (its url and chunk number) rather than the whole page.
 Please extract paragraphs from each returned page content that is relevant, 
 The citation should appear directly below the paragraph, and should contain the article title, author, date and url which is the source of the chunk used to extract this paragraph.  
 
@@ -64,14 +96,43 @@ rimon_ai_expert = Agent(
     retries=2
 )
 
+def normalize_query(text: str) -> str:
+    """Case, spacing and trailing punctuation that don't change what a query asks for."""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?.!").strip().casefold()
+
+def load_page_chunks(store: ChunkStore, url: str, from_chunk: int = 0,
+                     to_chunk: Optional[int] = None) -> List[Dict[str, Any]]:
+    """A page's chunks numbered from_chunk to to_chunk, from the page cache or the store (blocking)."""
+    version = document_catalog.version(store)
+    page_key = (store.name, version, url, 0, None)
+    page = page_cache.get(page_key)
+    if page is not None:
+        return [chunk for chunk in page
+                if chunk['chunk_number'] >= from_chunk and (to_chunk is None or chunk['chunk_number'] <= to_chunk)]
+    key = (store.name, version, url, from_chunk, to_chunk)
+    if key != page_key:
+        chunks = page_cache.get(key)
+        if chunks is not None:
+            return chunks
+    chunks = store.get_page_chunks(url, from_chunk, to_chunk)
+    if chunks:
+        page_cache.set(key, chunks)
+    return chunks
+
 async def get_embedding(text: str, openai_client: AsyncOpenAI) -> List[float]:
-    """Get embedding vector from OpenAI."""
+    """Get embedding vector from OpenAI (or the query embedding cache)."""
+    key = (EMBEDDING_MODEL, normalize_query(text))
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
     try:
         response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
+            model=EMBEDDING_MODEL,
             input=text
         )
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        query_embedding_cache.set(key, embedding)
+        return embedding
     except Exception as e:
         print(f"Error getting embedding: {e}")
         return [0] * 1536  # Return zero vector on error
@@ -82,7 +143,7 @@ async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_
     Retrieve relevant documentation chunks based on the query with RAG.
     
     Args:
-        ctx: The context including the Supabase client and OpenAI client
+        ctx: The context including the chunk store and OpenAI client
         user_query: The user's question or query
         
     Returns:
@@ -92,28 +153,27 @@ async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_
         # Get the embedding for the query
         query_embedding = await get_embedding(user_query, ctx.deps.openai_client)
         
-        # Query Supabase for relevant documents
-        result = ctx.deps.supabase.rpc(
-            'match_rimon_pages',
-            {
-                'query_embedding': query_embedding,
-                'match_count': 5,
-                #'filter': {'source': 'pydantic_ai_docs'}
-            }
-        ).execute()
+        # Query the chunk store for relevant documents
+        matches = await asyncio.to_thread(
+            ctx.deps.store.match_chunks,
+            query_embedding,
+            5,
+            #{'source': 'pydantic_ai_docs'}
+        )
         
-        if not result.data:
+        if not matches:
             return "No relevant documentation found."
+        ctx.deps.source_urls.update(doc['url'] for doc in matches)
             
         # Format the results
         formatted_chunks = []
-        for doc in result.data:
+        for doc in matches:
             chunk_text = f"""
 # {doc['title']}
 
 {doc['content']}
 
-{doc['url']}
+{doc['url']} (chunk {doc['chunk_number']})
 """
             formatted_chunks.append(chunk_text)
             
@@ -125,62 +185,78 @@ async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_
         return f"Error retrieving documentation: {str(e)}"
 
 @rimon_ai_expert.tool
-async def list_documentation_pages(ctx: RunContext[PydanticAIDeps]) -> List[str]:
+async def list_documentation_pages(ctx: RunContext[PydanticAIDeps], search: Optional[str] = None,
+                                   limit: int = 20, offset: int = 0) -> Dict[str, Any]:
     """
-    Retrieve a list of all available Pomegranate Place article urls.
+    Retrieve a page of the list of available Pomegranate Place articles, in url order.
     
+    Args:
+        ctx: The context including the chunk store
+        search: Only list articles whose url, title or author contain this text
+        limit: Number of articles to return
+        offset: Number of articles to skip, to page through the list
+        
     Returns:
-        List[str]: List of unique URLs for all Pomegranate Place article urls
+        Dict[str, Any]: total (the number of matching articles), offset, and articles with the
+        url, title, author, published_date and chunk_count of each
     """
     try:
-        # Query Supabase for unique URLs where source is pydantic_ai_docs
-        result = ctx.deps.supabase.from_('rimon_pages')\
-            .select('url') \
-            .execute()
-           # .eq('metadata->>source', 'pydantic_ai_docs') \ #IL remove
-
-        
-        if not result.data:
-            return []
-            
-        # Extract unique URLs
-        urls = sorted(set(doc['url'] for doc in result.data))
-        return urls
+        # Read the in-process copy of the document catalog
+        total, documents = await asyncio.to_thread(
+            document_catalog.search, ctx.deps.store, search, max(limit, 1), max(offset, 0)
+        )
+        articles = [{key: document.get(key) for key in ("url", "title", "author", "published_date", "chunk_count")}
+                    for document in documents]
+        return {"total": total, "offset": offset, "articles": articles}
         
     except Exception as e:
         print(f"Error retrieving pages: {e}")
-        return []
+        return {"total": 0, "offset": offset, "articles": []}
 
 @rimon_ai_expert.tool
-async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str) -> str:
+async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str, around_chunk: Optional[int] = None,
+                           window: int = 1) -> str:
     """
-    Retrieve the full content of a specific documentation page by combining all its chunks.
+    Retrieve the content of a specific documentation page by combining its chunks: the full page, or
+    only the chunks around one chunk (such as a chunk returned by RAG) to read its context.
     
     Args:
-        ctx: The context including the Supabase client
+        ctx: The context including the chunk store
         url: The URL of the page to retrieve
+        around_chunk: Only retrieve the chunks numbered within window of this chunk number
+        window: Number of chunks to include on each side of around_chunk
         
     Returns:
-        str: The complete page content with all chunks combined in order
+        str: The page content with the retrieved chunks combined in order
     """
     try:
-        # Query Supabase for all chunks of this URL, ordered by chunk_number
-        result = ctx.deps.supabase.from_('rimon_pages') \
-            .select('title, content, chunk_number,url') \
-            .eq('url', url) \
-            .order('chunk_number') \
-            .execute()
-            # .eq('metadata->>source', 'pydantic_ai_docs') \ #IL rmeove
+        # Get the chunks of this URL, ordered by chunk_number, from the page cache or the chunk store
+        document = None
+        if around_chunk is None:
+            chunks = await asyncio.to_thread(load_page_chunks, ctx.deps.store, url)
+        else:
+            # Keep the window within the page's chunks, by its chunk count in the catalog
+            document = await asyncio.to_thread(document_catalog.document, ctx.deps.store, url)
+            if document and document.get('chunk_count'):
+                around_chunk = min(max(around_chunk, 0), document['chunk_count'] - 1)
+            chunks = await asyncio.to_thread(load_page_chunks, ctx.deps.store, url,
+                                             max(around_chunk - window, 0), around_chunk + window)
         
-        if not result.data:
+        if not chunks:
+            if around_chunk is not None and document:
+                return (f"No chunks around chunk {around_chunk} of {url}; "
+                        f"its chunks are numbered 0 to {document['chunk_count'] - 1}")
             return f"No content found for URL: {url}"
+        ctx.deps.source_urls.add(url)
             
         # Format the page with its title and all chunks
-        page_title = result.data[0]['title'].split(' - ')[0]  # Get the main title
+        page_title = chunks[0]['title'].split(' - ')[0]  # Get the main title
         formatted_content = [f"# {page_title}\n"]
+        if around_chunk is not None:
+            formatted_content.append(f"(chunks {chunks[0]['chunk_number']} to {chunks[-1]['chunk_number']} of {url})")
         
         # Add each chunk's content
-        for chunk in result.data:
+        for chunk in chunks:
             formatted_content.append(chunk['content'])
             
         # Join everything together
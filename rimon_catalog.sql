@@ -0,0 +1,99 @@
+-- Per-document catalog of the rimon_pages chunks, for the agent's list_documentation_pages tool,
+-- and the crawler's metadata update function.
+-- Run after the rimon_pages table exists. The crawler calls refresh_rimon_documents() at the end
+-- of each run; every refresh bumps the catalog version, which the agent uses to invalidate its copy.
+
+-- One row per document
+create materialized view rimon_documents as
+select
+    url,
+    (array_agg(title order by chunk_number))[1] as title,
+    (array_agg(metadata->>'author' order by chunk_number))[1] as author,
+    (array_agg(metadata->>'published_date' order by chunk_number))[1] as published_date,
+    count(*)::integer as chunk_count,
+    max(metadata->>'crawled_at') as crawled_at
+from rimon_pages
+group by url;
+
+-- Needed to refresh concurrently (readers are never blocked)
+create unique index rimon_documents_url on rimon_documents (url);
+
+-- Version of the catalog, bumped on every refresh
+create table rimon_catalog_state (
+    id boolean primary key default true check (id),
+    version bigint not null default 0,
+    refreshed_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+insert into rimon_catalog_state default values;
+
+create function refresh_rimon_documents() returns bigint
+language plpgsql
+security definer
+as $$
+declare
+  new_version bigint;
+begin
+  refresh materialized view concurrently rimon_documents;
+  update rimon_catalog_state
+     set version = version + 1, refreshed_at = timezone('utc'::text, now())
+   where id
+  returning version into new_version;
+  return new_version;
+end;
+$$;
+
+create function rimon_documents_version() returns bigint
+language sql stable
+as $$
+  select version from rimon_catalog_state where id;
+$$;
+
+-- A page of the catalog in url order, optionally only documents whose url, title or author
+-- contain search. Keep page_size at or below the API's max rows and page by page_offset.
+create function list_rimon_documents (
+  page_size int default 1000,
+  page_offset int default 0,
+  search text default null
+) returns table (
+  url varchar,
+  title varchar,
+  author text,
+  published_date text,
+  chunk_count integer,
+  crawled_at text
+)
+language sql stable
+as $$
+  select url, title, author, published_date, chunk_count, crawled_at
+  from rimon_documents
+  where search is null
+     or url ilike '%' || search || '%'
+     or title ilike '%' || search || '%'
+     or author ilike '%' || search || '%'
+  order by url
+  limit page_size
+  offset page_offset;
+$$;
+
+-- Merge keys into the metadata of every chunk of a page in one statement (the crawler records the
+-- aliases of near-duplicate pages this way); returns the number of chunks updated
+create function update_rimon_pages_metadata (
+  page_url text,
+  updates jsonb
+) returns integer
+language sql
+as $$
+  with updated as (
+    update rimon_pages
+       set metadata = coalesce(metadata, '{}'::jsonb) || updates
+     where url = page_url
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
+
+-- Supabase security: the catalog is as readable as rimon_pages; only the service role refreshes it
+-- or updates metadata
+grant select on rimon_documents to anon, authenticated;
+revoke execute on function refresh_rimon_documents() from public, anon, authenticated;
+revoke execute on function update_rimon_pages_metadata(text, jsonb) from public, anon, authenticated;
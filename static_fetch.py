@@ -0,0 +1,107 @@
+# plain-HTTP fast path for the crawler
+# most news articles are server-rendered, so their HTML can be fetched without a browser;
+# pages that look like they need JavaScript to render fall back to headless Chromium
+
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+)
+
+# Signs that a page only renders its content with JavaScript, or is a bot challenge
+BROWSER_REQUIRED_MARKERS = [
+    "enable javascript",
+    "javascript is disabled",
+    "please turn javascript on",
+    "just a moment...",
+    "checking your browser",
+    "cf-browser-verification",
+]
+
+# Plain-HTTP status that ends an attempt without trying the browser: the host asked us to slow
+# down, so the caller backs off first. A 403 or 503 is often a bot challenge the browser passes
+RATE_LIMITED_STATUS = 429
+
+# (status code, headers, markdown or None if the page gave no content)
+FetchResult = Tuple[Optional[int], Dict[str, str], Optional[str]]
+
+SCRIPT_STYLE_PATTERN = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@dataclass
+class StaticPage:
+    url: str
+    html: str
+    status_code: int
+    headers: Dict[str, str]
+
+
+def create_http_client(max_connections: int = 20) -> httpx.AsyncClient:
+    """Create the shared HTTP client used by the fast path."""
+    return httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+        follow_redirects=True,
+        timeout=httpx.Timeout(15.0),
+        limits=httpx.Limits(max_connections=max_connections),
+    )
+
+
+def visible_text_length(html: str) -> int:
+    """Rough length of the text a reader would see, ignoring scripts, styles and markup."""
+    text = SCRIPT_STYLE_PATTERN.sub(" ", html)
+    text = TAG_PATTERN.sub(" ", text)
+    return len(WHITESPACE_PATTERN.sub(" ", text).strip())
+
+
+def looks_static(html: str, min_text_length: int = 1500) -> bool:
+    """Decide whether server-rendered HTML already contains the page content."""
+    lowered = html.lower()
+    if any(marker in lowered for marker in BROWSER_REQUIRED_MARKERS):
+        return False
+    return visible_text_length(html) >= min_text_length
+
+
+async def fetch_static(client: httpx.AsyncClient, url: str) -> StaticPage:
+    """Fetch a page over plain HTTP without rendering it."""
+    response = await client.get(url)
+    return StaticPage(
+        url=str(response.url),
+        html=response.text,
+        status_code=response.status_code,
+        headers=dict(response.headers),
+    )
+
+
+def is_usable(page: StaticPage) -> bool:
+    """A fetched page can skip the browser if it is a successful, server-rendered HTML page."""
+    content_type = page.headers.get("content-type", "")
+    return page.status_code == 200 and "html" in content_type and looks_static(page.html)
+
+
+async def fetch_with_fallback(url: str,
+                              fetch_without_browser: Optional[Callable[[str], Awaitable[FetchResult]]],
+                              render_with_browser: Callable[[str], Awaitable[FetchResult]]) -> FetchResult:
+    """
+    Fetch a page over plain HTTP first, and render it in the browser if that gave no content.
+
+    Args:
+        url: The page URL
+        fetch_without_browser: The plain-HTTP fetch, or None to always use the browser
+        render_with_browser: The browser render
+
+    Returns:
+        FetchResult: Of the plain-HTTP fetch if it had the content or was rate limited,
+        otherwise of the browser render.
+    """
+    if fetch_without_browser is not None:
+        status_code, headers, markdown = await fetch_without_browser(url)
+        if markdown is not None or status_code == RATE_LIMITED_STATUS:
+            return status_code, headers, markdown
+    return await render_with_browser(url)
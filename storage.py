@@ -0,0 +1,465 @@
+# storage backends for indexed chunks
+# the crawler and the agent only talk to a ChunkStore; SupabaseStore keeps the rimon_pages table
+# and match_rimon_pages RPC, LocalStore keeps rows in SQLite and vectors in a memory-mapped
+# NumPy matrix, so small deployments and offline runs need no database server
+# both also keep a per-document catalog (url, title, author, date, chunk count) for listing pages
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+
+# Columns returned by match_chunks, as in the match_rimon_pages RPC
+MATCH_COLUMNS = ["id", "url", "chunk_number", "title", "summary", "content", "metadata"]
+
+# Columns of a document catalog row, as in the list_rimon_documents RPC
+CATALOG_COLUMNS = ["url", "title", "author", "published_date", "chunk_count", "crawled_at"]
+
+# Rows per catalog RPC call, at most PostgREST's default max rows
+CATALOG_PAGE_SIZE = 1000
+
+
+class ChunkStore(ABC):
+    """
+    Interface of a store of rimon_pages rows.
+
+    Rows are dicts with url, chunk_number, title, summary, content, metadata and embedding,
+    unique on (url, chunk_number). Methods are blocking; async callers run them in a thread.
+    A backend missing one of the abstract methods fails when it is created.
+    """
+
+    name = "store"
+
+    @abstractmethod
+    def upsert_chunks(self, rows: List[Dict[str, Any]]):
+        """Insert rows, replacing existing rows with the same (url, chunk_number)."""
+
+    @abstractmethod
+    def delete_chunks(self, url: str, from_chunk: int = 0):
+        """Delete the chunks of a URL numbered from_chunk and up."""
+
+    @abstractmethod
+    def update_metadata(self, url: str, updates: Dict[str, Any]):
+        """Merge updates into the metadata of every chunk of a URL."""
+
+    @abstractmethod
+    def match_chunks(self, query_embedding: List[float], match_count: int = 5,
+                     filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most similar to a query embedding.
+
+        Args:
+            query_embedding: Embedding of the query
+            match_count: Number of chunks to return
+            filter: Only match chunks whose metadata contains these key/value pairs
+
+        Returns:
+            List[Dict[str, Any]]: MATCH_COLUMNS plus a cosine similarity, most similar first
+        """
+
+    @abstractmethod
+    def list_urls(self) -> List[str]:
+        """Sorted unique URLs of all stored chunks."""
+
+    @abstractmethod
+    def list_documents(self, limit: Optional[int] = None, offset: int = 0,
+                       search: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Read the document catalog: one row per stored URL, in URL order.
+
+        Args:
+            limit: Number of documents to return (all if None)
+            offset: Number of documents to skip
+            search: Only documents whose url, title or author contain this (case-insensitive)
+
+        Returns:
+            List[Dict[str, Any]]: CATALOG_COLUMNS of each document
+        """
+
+    @abstractmethod
+    def catalog_version(self) -> str:
+        """Version of the document catalog, which changes whenever list_documents would return something new."""
+
+    def refresh_catalog(self):
+        """Bring the document catalog up to date with the stored chunks (called after an ingest run)."""
+        pass
+
+    @abstractmethod
+    def get_page_chunks(self, url: str, from_chunk: int = 0,
+                        to_chunk: Optional[int] = None) -> List[Dict[str, Any]]:
+        """title, content, chunk_number and url of a URL's chunks numbered from_chunk to to_chunk, in chunk order."""
+
+    @abstractmethod
+    def page_versions(self, urls: List[str]) -> Dict[str, str]:
+        """
+        A fingerprint of each URL's chunks, which changes whenever they are re-stored or deleted.
+
+        URLs without chunks are left out.
+        """
+
+    def close(self):
+        pass
+
+
+class SupabaseStore(ChunkStore):
+    """
+    Chunks in a Supabase table, searched with a pgvector match function.
+
+    The document catalog is the materialized view of rimon_catalog.sql, read through its
+    list, version and refresh RPCs. Metadata updates go through its update_{table}_metadata RPC.
+    """
+
+    def __init__(self, client, table: str = "rimon_pages", match_function: str = "match_rimon_pages",
+                 catalog: str = "rimon_documents"):
+        self.client = client
+        self.table = table
+        self.match_function = match_function
+        self.metadata_function = f"update_{table}_metadata"
+        self.catalog = catalog
+        self.name = f"supabase:{table}"
+
+    def upsert_chunks(self, rows: List[Dict[str, Any]]):
+        self.client.table(self.table).upsert(rows, on_conflict="url,chunk_number").execute()
+
+    def delete_chunks(self, url: str, from_chunk: int = 0):
+        self.client.table(self.table).delete().eq("url", url).gte("chunk_number", from_chunk).execute()
+
+    def update_metadata(self, url: str, updates: Dict[str, Any]):
+        # Merged into every chunk of the page in one statement (jsonb ||), not read and written back per row
+        self.client.rpc(self.metadata_function, {"page_url": url, "updates": updates}).execute()
+
+    def match_chunks(self, query_embedding: List[float], match_count: int = 5,
+                     filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        params = {"query_embedding": query_embedding, "match_count": match_count}
+        if filter:
+            params["filter"] = filter
+        return self.client.rpc(self.match_function, params).execute().data or []
+
+    def list_urls(self) -> List[str]:
+        # Selecting the url of every chunk row is cut off at the API's max rows; the catalog is paged
+        return [document["url"] for document in self.list_documents()]
+
+    def list_documents(self, limit: Optional[int] = None, offset: int = 0,
+                       search: Optional[str] = None) -> List[Dict[str, Any]]:
+        documents: List[Dict[str, Any]] = []
+        while limit is None or len(documents) < limit:
+            page_size = CATALOG_PAGE_SIZE if limit is None else min(CATALOG_PAGE_SIZE, limit - len(documents))
+            params = {"page_size": page_size, "page_offset": offset + len(documents), "search": search}
+            rows = self.client.rpc(f"list_{self.catalog}", params).execute().data or []
+            # Stop on an empty page rather than a short one: the server may cap pages below page_size
+            if not rows:
+                break
+            documents.extend(rows)
+        return documents
+
+    def catalog_version(self) -> str:
+        return str(self.client.rpc(f"{self.catalog}_version").execute().data)
+
+    def refresh_catalog(self):
+        self.client.rpc(f"refresh_{self.catalog}").execute()
+
+    def get_page_chunks(self, url: str, from_chunk: int = 0,
+                        to_chunk: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = self.client.from_(self.table) \
+            .select("title, content, chunk_number, url") \
+            .eq("url", url)
+        if from_chunk > 0:
+            query = query.gte("chunk_number", from_chunk)
+        if to_chunk is not None:
+            query = query.lte("chunk_number", to_chunk)
+        result = query.order("chunk_number").execute()
+        return result.data or []
+
+    def page_versions(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        result = self.client.from_(self.table) \
+            .select("url, chunk_number, crawled_at:metadata->>crawled_at") \
+            .in_("url", list(urls)) \
+            .execute()
+        return page_versions(result.data or [])
+
+
+class LocalStore(ChunkStore):
+    """
+    Chunks in a local SQLite file, with their embeddings in a memory-mapped float32 matrix.
+
+    Each row owns one row of the matrix (vector_row). Vectors are stored normalized, so
+    cosine similarity of every chunk with a query is one matrix-vector product. The matrix
+    file grows by doubling, and rows freed by deletes are reused. Every write bumps the
+    catalog version, and a store that sees the version changed by another process (the
+    crawler writing while the agent reads) reloads its row map before the next search.
+    """
+
+    def __init__(self, path: str = "rimon_pages.sqlite", dimensions: int = EMBEDDING_DIMENSIONS):
+        self.path = path
+        self.vectors_path = path + ".vectors"
+        self.dimensions = dimensions
+        self.name = f"local:{path}"
+        self._lock = threading.RLock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists rimon_pages (
+                id integer primary key autoincrement,
+                url text not null,
+                chunk_number integer not null,
+                title text not null,
+                summary text not null,
+                content text not null,
+                metadata text not null default '{}',
+                vector_row integer not null unique,
+                created_at text not null default (datetime('now')),
+                unique (url, chunk_number)
+            )
+        """)
+        # Bumped by every write, so readers in other processes can tell the catalog changed
+        self.conn.execute(
+            "create table if not exists catalog_state (id integer primary key check (id = 1), version integer not null)"
+        )
+        self.conn.execute("insert or ignore into catalog_state (id, version) values (1, 0)")
+        self.conn.commit()
+        self._load_rows()
+
+    def _read_version(self) -> int:
+        return self.conn.execute("select version from catalog_state").fetchone()[0]
+
+    def _load_rows(self):
+        """Build the map of used vector rows from the table, and map the vector file."""
+        self._version = self._read_version()
+        used = [row[0] for row in self.conn.execute("select vector_row from rimon_pages")]
+        self._size = max(used, default=-1) + 1
+        self._free = sorted(set(range(self._size)) - set(used), reverse=True)
+        self._live = np.zeros(max(self._size, 1024), dtype=bool)
+        self._live[used] = True
+        self._open_vectors(max(self._size, 1024))
+
+    def _sync(self):
+        """Reload the row map if another process (the crawler) wrote since it was built."""
+        if self._read_version() != self._version:
+            self._vectors.flush()
+            self._load_rows()
+
+    def _bump_version(self):
+        """Record a write in catalog_state, keeping the row map current if it was current before."""
+        before = self._read_version()
+        self.conn.execute("update catalog_state set version = version + 1")
+        if before == self._version:
+            self._version = before + 1
+
+    def _open_vectors(self, capacity: int):
+        """Map the vector file, growing it to hold capacity rows."""
+        row_bytes = self.dimensions * 4
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < capacity * row_bytes:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        capacity = os.path.getsize(self.vectors_path) // row_bytes
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(capacity, self.dimensions))
+        if len(self._live) < capacity:
+            self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+
+    def _allocate_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self._vectors):
+            self._vectors.flush()
+            self._open_vectors(len(self._vectors) * 2)
+        self._size += 1
+        return self._size - 1
+
+    def _normalized(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if vector.shape != (self.dimensions,):
+            raise ValueError(f"Expected an embedding of {self.dimensions} dimensions, got {vector.shape}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def upsert_chunks(self, rows: List[Dict[str, Any]]):
+        with self._lock:
+            self._sync()
+            for row in rows:
+                existing = self.conn.execute(
+                    "select vector_row from rimon_pages where url = ? and chunk_number = ?",
+                    (row["url"], row["chunk_number"])
+                ).fetchone()
+                vector_row = existing[0] if existing else self._allocate_row()
+                self._vectors[vector_row] = self._normalized(row["embedding"])
+                self._live[vector_row] = True
+                self.conn.execute(
+                    "insert into rimon_pages (url, chunk_number, title, summary, content, metadata, vector_row) "
+                    "values (?, ?, ?, ?, ?, ?, ?) "
+                    "on conflict (url, chunk_number) do update set title = excluded.title, "
+                    "summary = excluded.summary, content = excluded.content, metadata = excluded.metadata",
+                    (row["url"], row["chunk_number"], row["title"], row["summary"], row["content"],
+                     json.dumps(row.get("metadata") or {}), vector_row)
+                )
+            # Vectors reach the disk before the rows that point at them
+            self._vectors.flush()
+            self._bump_version()
+            self.conn.commit()
+
+    def delete_chunks(self, url: str, from_chunk: int = 0):
+        with self._lock:
+            self._sync()
+            rows = self.conn.execute(
+                "select vector_row from rimon_pages where url = ? and chunk_number >= ?", (url, from_chunk)
+            ).fetchall()
+            self.conn.execute("delete from rimon_pages where url = ? and chunk_number >= ?", (url, from_chunk))
+            self._bump_version()
+            self.conn.commit()
+            for (vector_row,) in rows:
+                self._live[vector_row] = False
+                self._free.append(vector_row)
+
+    def update_metadata(self, url: str, updates: Dict[str, Any]):
+        with self._lock:
+            rows = self.conn.execute("select id, metadata from rimon_pages where url = ?", (url,)).fetchall()
+            self.conn.executemany(
+                "update rimon_pages set metadata = ? where id = ?",
+                [(json.dumps({**json.loads(metadata), **updates}), row_id) for row_id, metadata in rows]
+            )
+            self._bump_version()
+            self.conn.commit()
+
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Vector rows whose chunk metadata contains every key/value pair of filter."""
+        conditions, params = [], []
+        for key, value in filter.items():
+            if isinstance(value, (dict, list)):
+                conditions.append("json(json_extract(metadata, ?)) = json(?)")
+                params.extend([f'$."{key}"', json.dumps(value)])
+            else:
+                conditions.append("json_extract(metadata, ?) = ?")
+                params.extend([f'$."{key}"', value])
+        rows = self.conn.execute(
+            f"select vector_row from rimon_pages where {' and '.join(conditions)}", params
+        ).fetchall()
+        mask = np.zeros(len(self._live), dtype=bool)
+        mask[[row[0] for row in rows]] = True
+        return mask
+
+    def match_chunks(self, query_embedding: List[float], match_count: int = 5,
+                     filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            live = self._live[:self._size]
+            if filter:
+                live = live & self._filter_mask(filter)[:self._size]
+            candidates = np.flatnonzero(live)
+            if not len(candidates) or match_count <= 0:
+                return []
+
+            scores = self._vectors[candidates] @ self._normalized(query_embedding)
+            if len(candidates) > match_count:
+                top = np.argpartition(-scores, match_count - 1)[:match_count]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-scores[top])]
+            similarity = {int(candidates[i]): float(scores[i]) for i in top}
+
+            rows = self.conn.execute(
+                f"select {', '.join(MATCH_COLUMNS)}, vector_row from rimon_pages "
+                f"where vector_row in ({','.join('?' * len(similarity))})",
+                list(similarity)
+            ).fetchall()
+
+        matches = []
+        for row in rows:
+            match = dict(zip(MATCH_COLUMNS, row[:-1]))
+            match["metadata"] = json.loads(match["metadata"])
+            match["similarity"] = similarity[row[-1]]
+            matches.append(match)
+        matches.sort(key=lambda match: match["similarity"], reverse=True)
+        return matches
+
+    def list_urls(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self.conn.execute("select distinct url from rimon_pages order by url")]
+
+    def list_documents(self, limit: Optional[int] = None, offset: int = 0,
+                       search: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Title, author and date come from each document's first chunk
+        query = """
+            select p.url, p.title, json_extract(p.metadata, '$.author'),
+                   json_extract(p.metadata, '$.published_date'), d.chunk_count, d.crawled_at
+            from rimon_pages p
+            join (select url, min(chunk_number) as first_chunk, count(*) as chunk_count,
+                         max(json_extract(metadata, '$.crawled_at')) as crawled_at
+                  from rimon_pages group by url) d
+              on p.url = d.url and p.chunk_number = d.first_chunk
+        """
+        params: List[Any] = []
+        if search:
+            query += " where p.url like ? or p.title like ? or json_extract(p.metadata, '$.author') like ?"
+            params.extend([f"%{search}%"] * 3)
+        query += " order by p.url limit ? offset ?"
+        params.extend([-1 if limit is None else limit, offset])
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [dict(zip(CATALOG_COLUMNS, row)) for row in rows]
+
+    def catalog_version(self) -> str:
+        with self._lock:
+            return str(self._read_version())
+
+    def get_page_chunks(self, url: str, from_chunk: int = 0,
+                        to_chunk: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.conn.execute(
+                "select title, content, chunk_number, url from rimon_pages "
+                "where url = ? and chunk_number >= ? and (? is null or chunk_number <= ?) order by chunk_number",
+                (url, from_chunk, to_chunk, to_chunk)
+            ).fetchall()
+        return [dict(zip(["title", "content", "chunk_number", "url"], row)) for row in rows]
+
+    def page_versions(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        with self._lock:
+            rows = self.conn.execute(
+                "select url, chunk_number, json_extract(metadata, '$.crawled_at') from rimon_pages "
+                f"where url in ({','.join('?' * len(urls))})",
+                list(urls)
+            ).fetchall()
+        return page_versions([dict(zip(["url", "chunk_number", "crawled_at"], row)) for row in rows])
+
+    def close(self):
+        with self._lock:
+            self._vectors.flush()
+            self.conn.close()
+
+
+def page_versions(rows: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Fingerprint per URL of its chunk numbers and crawl times (rows with url, chunk_number, crawled_at)."""
+    chunks: Dict[str, List[tuple]] = {}
+    for row in rows:
+        chunks.setdefault(row["url"], []).append((row["chunk_number"], row.get("crawled_at") or ""))
+    return {
+        url: hashlib.sha256(json.dumps(sorted(pairs)).encode("utf-8")).hexdigest()[:16]
+        for url, pairs in chunks.items()
+    }
+
+
+def create_store(backend: Optional[str] = None) -> ChunkStore:
+    """
+    Create the chunk store selected by backend or the STORAGE_BACKEND environment variable.
+
+    "supabase" (the default) uses SUPABASE_URL and SUPABASE_SERVICE_KEY; "local" uses the
+    SQLite file at LOCAL_STORE_PATH (default rimon_pages.sqlite).
+    """
+    backend = backend or os.getenv("STORAGE_BACKEND", "supabase")
+    if backend == "local":
+        return LocalStore(os.getenv("LOCAL_STORE_PATH", "rimon_pages.sqlite"))
+    if backend == "supabase":
+        from supabase import create_client
+        return SupabaseStore(create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY")))
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -6,7 +6,6 @@ import os
 
 import json
 import logfire
-from supabase import Client
 from openai import AsyncOpenAI
 import streamlit as st
 
@@ -23,21 +22,36 @@ from pydantic_ai.messages import (
     RetryPromptPart,
     ModelMessagesTypeAdapter
 )
-from rimon_ai_expert import rimon_ai_expert, PydanticAIDeps
+from answer_cache import SemanticAnswerCache
+from config import load_secrets
+from rimon_ai_expert import (rimon_ai_expert, PydanticAIDeps, document_catalog, get_embedding, page_cache,
+                             query_embedding_cache)
+from storage import create_store
 
 # Load environment variables - replacing with streamlit
 #from dotenv import load_dotenv
 #load_dotenv()
-OPENAI_API_KEY= st.secrets["OPENAI_API_KEY"]
-SUPABASE_URL=st.secrets["SUPABASE_URL"]
-SUPABASE_SERVICE_KEY=st.secrets["SUPABASE_SERVICE_KEY"]
-LLM_MODEL=st.secrets["LLM_MODEL"]
+load_secrets()
 
 openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-supabase: Client = Client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+# Supabase, or the local SQLite/NumPy store with STORAGE_BACKEND=local
+# (opened once per server process rather than on every Streamlit rerun)
+@st.cache_resource
+def get_store():
+    return create_store()
+
+store = get_store()
+
+# Answers to earlier questions, shared by all sessions (see answer_cache.py)
+@st.cache_resource
+def get_answer_cache():
+    return SemanticAnswerCache(
+        os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite"),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168")) * 3600
+    )
+
+answer_cache = get_answer_cache()
 
 # Configure logfire to suppress warnings (optional)
 logfire.configure(send_to_logfire='never')
@@ -75,9 +89,24 @@ async def run_agent_with_streaming(user_input: str):
     Run the agent with streaming text for the user_input prompt,
     while maintaining the entire conversation in `st.session_state.messages`.
     """
+    history = st.session_state.messages[:-1]
+
+    # Only opening questions go through the answer cache: a follow-up depends on the conversation before it
+    question_embedding = None
+    if not history:
+        question_embedding = await get_embedding(user_input, openai_client)
+        cached = await asyncio.to_thread(answer_cache.lookup, question_embedding, store)
+        if cached is not None:
+            st.empty().markdown(cached.answer)
+            st.caption(f"Answered from earlier answers to a similar question: \"{cached.question}\"")
+            st.session_state.messages.append(
+                ModelResponse(parts=[TextPart(content=cached.answer)])
+            )
+            return
+
     # Prepare dependencies
     deps = PydanticAIDeps(
-        supabase=supabase,
+        store=store,
         openai_client=openai_client
     )
 
@@ -85,7 +114,7 @@ async def run_agent_with_streaming(user_input: str):
     async with rimon_ai_expert.run_stream(
         user_input,
         deps=deps,
-        message_history= st.session_state.messages[:-1],  # pass entire conversation so far
+        message_history=history,  # pass entire conversation so far
     ) as result:
         # We'll gather partial text to show incrementally
         partial_text = ""
@@ -108,6 +137,12 @@ async def run_agent_with_streaming(user_input: str):
             ModelResponse(parts=[TextPart(content=partial_text)])
         )
 
+    # Cache answers drawn from the documents, with the versions of the pages they came from
+    if question_embedding is not None and any(question_embedding) and deps.source_urls and partial_text:
+        source_versions = await asyncio.to_thread(store.page_versions, sorted(deps.source_urls))
+        if source_versions:
+            await asyncio.to_thread(answer_cache.add, user_input, question_embedding, partial_text, source_versions)
+
 
 async def main():
     st.title("Pomegranate Place Agentic RAG")
@@ -143,6 +178,12 @@ async def main():
             # Actually run the agent now, streaming the text
             await run_agent_with_streaming(user_input)
 
+    # Shared by all sessions of this server process
+    st.sidebar.caption(query_embedding_cache.summary())
+    st.sidebar.caption(answer_cache.summary())
+    st.sidebar.caption(document_catalog.summary())
+    st.sidebar.caption(page_cache.summary())
+
 
 if __name__ == "__main__":
     asyncio.run(main())
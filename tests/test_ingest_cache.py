@@ -0,0 +1,35 @@
+import sqlite3
+
+from ingest_cache import IngestCache
+
+
+def last_used(path, key):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("select last_used from cache_entries where key = ?", (key,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_hits_are_written_on_flush(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = IngestCache(path)
+    cache.put_json("a", {"title": "A"})
+    stored = last_used(path, "a")
+
+    assert cache.get_json("a") == {"title": "A"}
+    assert last_used(path, "a") == stored
+    cache.close()
+    assert last_used(path, "a") > stored
+
+
+def test_eviction_keeps_recently_hit_entries(tmp_path):
+    cache = IngestCache(str(tmp_path / "cache.sqlite"), max_bytes=3000, low_water=0.8)
+    for key in ("a", "b", "c"):
+        cache.put_json(key, {"text": key * 900})
+    cache.get_json("a")
+    cache.put_json("d", {"text": "d" * 900})
+
+    assert cache.get_json("a") is not None
+    assert cache.get_json("b") is None
+    cache.close()
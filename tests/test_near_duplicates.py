@@ -0,0 +1,30 @@
+from near_duplicates import NearDuplicateIndex
+
+PAGE = " ".join(f"word{i}" for i in range(200))
+COPY = PAGE + " trailing"
+
+
+def test_copy_is_matched_to_canonical(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dupes.sqlite"))
+    assert index.add("https://a", index.hasher.signature(PAGE)) is None
+    assert index.add("https://b", index.hasher.signature(COPY)) == "https://a"
+    assert index.aliases("https://a") == ["https://b"]
+
+
+def test_removing_failed_canonical_releases_its_copies(tmp_path):
+    path = str(tmp_path / "dupes.sqlite")
+    index = NearDuplicateIndex(path)
+    index.add("https://a", index.hasher.signature(PAGE))
+    index.add("https://b", index.hasher.signature(COPY))
+
+    assert index.remove("https://a") == ["https://b"]
+    assert not index.is_canonical("https://a")
+    assert "https://a" not in index.changed
+
+    # The retried copy is now canonical itself, also after a restart
+    assert index.add("https://b", index.hasher.signature(COPY)) is None
+    index.close()
+    reopened = NearDuplicateIndex(path)
+    assert reopened.is_canonical("https://b")
+    assert not reopened.is_canonical("https://a")
+    reopened.close()
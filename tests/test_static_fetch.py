@@ -0,0 +1,63 @@
+import asyncio
+
+from static_fetch import fetch_with_fallback
+
+
+def fetcher(result, calls, name):
+    async def fetch(url):
+        calls.append(name)
+        return result
+    return fetch
+
+
+def test_static_403_falls_back_to_browser():
+    calls = []
+    result = asyncio.run(fetch_with_fallback(
+        "https://news.example.com/a",
+        fetcher((403, {}, None), calls, "static"),
+        fetcher((200, {"content-type": "text/html"}, "# Article"), calls, "browser"),
+    ))
+    assert result == (200, {"content-type": "text/html"}, "# Article")
+    assert calls == ["static", "browser"]
+
+
+def test_static_503_challenge_falls_back_to_browser():
+    calls = []
+    result = asyncio.run(fetch_with_fallback(
+        "https://news.example.com/a",
+        fetcher((503, {}, None), calls, "static"),
+        fetcher((200, {}, "# Article"), calls, "browser"),
+    ))
+    assert result[2] == "# Article"
+    assert calls == ["static", "browser"]
+
+
+def test_static_429_returns_without_browser():
+    calls = []
+    result = asyncio.run(fetch_with_fallback(
+        "https://news.example.com/a",
+        fetcher((429, {"retry-after": "5"}, None), calls, "static"),
+        fetcher((200, {}, "# Article"), calls, "browser"),
+    ))
+    assert result == (429, {"retry-after": "5"}, None)
+    assert calls == ["static"]
+
+
+def test_static_content_skips_browser():
+    calls = []
+    result = asyncio.run(fetch_with_fallback(
+        "https://news.example.com/a",
+        fetcher((200, {}, "# Static"), calls, "static"),
+        fetcher((200, {}, "# Article"), calls, "browser"),
+    ))
+    assert result[2] == "# Static"
+    assert calls == ["static"]
+
+
+def test_without_static_client_uses_browser():
+    calls = []
+    result = asyncio.run(fetch_with_fallback(
+        "https://news.example.com/a", None, fetcher((200, {}, "# Article"), calls, "browser"),
+    ))
+    assert result[2] == "# Article"
+    assert calls == ["browser"]
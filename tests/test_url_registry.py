@@ -0,0 +1,26 @@
+from url_registry import PENDING, UrlRegistry
+
+
+def test_failed_urls_are_retried_until_the_cap(tmp_path):
+    registry = UrlRegistry(str(tmp_path / "registry.sqlite"))
+    registry.merge([{"url": "https://a"}, {"url": "https://b"}])
+    registry.mark("https://a", "crawled")
+
+    for attempt in range(1, 4):
+        assert registry.pending_urls(max_attempts=3) == ["https://b"]
+        registry.mark("https://b", "failed", "timeout")
+        assert registry.get("https://b").attempts == attempt
+    assert registry.pending_urls(max_attempts=3) == []
+
+    assert registry.requeue_failed() == 1
+    assert registry.get("https://b").status == PENDING
+    assert registry.pending_urls(max_attempts=3) == ["https://b"]
+    registry.close()
+
+
+def test_success_resets_the_attempt_count(tmp_path):
+    registry = UrlRegistry(str(tmp_path / "registry.sqlite"))
+    registry.mark("https://a", "failed", "timeout")
+    registry.mark("https://a", "crawled")
+    assert registry.get("https://a").attempts == 0
+    registry.close()
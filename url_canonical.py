@@ -0,0 +1,271 @@
+# canonical crawl targets for the URLs extracted from the exports
+# the same article is linked as AMP, mobile, www/non-www, trailing-slash and short-link variants;
+# per-domain rules, short links resolved once (and cached) and the rel=canonical links of pages
+# crawled before collapse the variants into one URL, so each article is crawled and embedded once
+
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+import requests
+
+
+@dataclass
+class DomainRule:
+    # Host the site serves its canonical pages from (mobile and AMP hosts map to it)
+    host: Optional[str] = None
+    # True: paths always end with a slash, False: never, None: leave them alone
+    trailing_slash: Optional[bool] = None
+    # Query parameters that identify a page (all others are dropped); None keeps all but tracking ones
+    keep_params: Optional[Tuple[str, ...]] = None
+
+
+# Per-domain rules, keyed by host without "www."
+DOMAIN_RULES: Dict[str, DomainRule] = {
+    "theguardian.com": DomainRule(host="www.theguardian.com", trailing_slash=False),
+    "abc.net.au": DomainRule(host="www.abc.net.au", trailing_slash=False),
+    "cnn.com": DomainRule(host="www.cnn.com"),
+    "jpost.com": DomainRule(host="www.jpost.com", trailing_slash=False),
+    "haaretz.com": DomainRule(host="www.haaretz.com", trailing_slash=False),
+    "nytimes.com": DomainRule(host="www.nytimes.com", trailing_slash=False),
+    "washingtonpost.com": DomainRule(host="www.washingtonpost.com"),
+    "timesofisrael.com": DomainRule(host="www.timesofisrael.com", trailing_slash=True),
+    "youtube.com": DomainRule(host="www.youtube.com", trailing_slash=False, keep_params=("v", "list")),
+    "twitter.com": DomainRule(host="x.com", trailing_slash=False, keep_params=()),
+    "x.com": DomainRule(host="x.com", trailing_slash=False, keep_params=()),
+    "facebook.com": DomainRule(host="www.facebook.com", keep_params=("id", "story_fbid", "fbid", "v")),
+}
+
+# Hosts that only redirect to the real page, resolved with one request and cached
+SHORT_LINK_HOSTS = {
+    "bit.ly", "t.co", "tinyurl.com", "ow.ly", "buff.ly", "dlvr.it", "trib.al", "lnkd.in", "fb.me",
+    "is.gd", "rebrand.ly", "cutt.ly", "tiny.cc", "shorturl.at", "wapo.st", "aje.io", "reut.rs",
+    "econ.st", "f24.my", "nif.li", "omdi.me", "nyti.ms", "bbc.in", "cnn.it", "apne.ws", "ab.co",
+    "s2.washingtonpost.com",  # newsletter tracking links
+}
+
+# Host prefixes of mobile and AMP editions, served by the same site under www.
+VARIANT_HOST_PREFIXES = ("amp.", "m.", "mobile.")
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "smid", "ocid", "cmpid"}
+
+CANONICAL_LINK_PATTERN = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+REL_CANONICAL_PATTERN = re.compile(r"""\brel\s*=\s*["']?canonical\b""", re.IGNORECASE)
+HREF_PATTERN = re.compile(r"""\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def domain_rule(host: str) -> Optional[DomainRule]:
+    return DOMAIN_RULES.get(host[4:] if host.startswith("www.") else host)
+
+
+def identifying_query(host: str, query: str) -> str:
+    """The part of a query string that identifies the page, by the host's rule, without tracking parameters."""
+    rule = domain_rule(host)
+    params = parse_qsl(query, keep_blank_values=True)
+    if rule and rule.keep_params is not None:
+        params = [(key, value) for key, value in params if key in rule.keep_params]
+    else:
+        params = [(key, value) for key, value in params
+                  if key not in TRACKING_PARAMS and not key.startswith("utm_")]
+    return urlencode(params)
+
+
+def _strip_amp_path(path: str) -> str:
+    if path.endswith("/amp") or path.endswith("/amp/"):
+        path = path[:path.rindex("/amp")] + ("/" if path.endswith("/") else "")
+    if path.startswith("/amp/"):
+        path = path[len("/amp"):]
+    if path.endswith(".amp.html"):
+        path = path[:-len(".amp.html")] + ".html"
+    return path or "/"
+
+
+def normalize_url(url: str) -> str:
+    """
+    Rewrite a URL to the form its site canonically serves the page at, without any request.
+
+    Unwraps Google's AMP viewer, maps AMP and mobile hosts and paths to the regular
+    site, applies the host's DomainRule, and drops fragments, default ports and
+    tracking parameters.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    path = parsed.path or "/"
+
+    # Google's AMP viewer: https://www.google.com/amp/s/<host>/<path>
+    if host in ("google.com", "www.google.com") and path.startswith("/amp/"):
+        inner = path[len("/amp/"):]
+        inner_scheme = "http"
+        if inner.startswith("s/"):
+            inner, inner_scheme = inner[2:], "https"
+        if inner:
+            return normalize_url(f"{inner_scheme}://{inner}")
+
+    # youtu.be short links carry the video id in the path
+    if host == "youtu.be" and path.strip("/"):
+        return normalize_url(f"https://www.youtube.com/watch?v={path.strip('/')}")
+
+    if host.startswith(VARIANT_HOST_PREFIXES) and host.count(".") >= 2:
+        host = "www." + host.split(".", 1)[1]
+    elif ".m." in host:  # en.m.wikipedia.org
+        host = host.replace(".m.", ".", 1)
+
+    rule = domain_rule(host)
+    if rule and rule.host:
+        host = rule.host
+    query = identifying_query(host, parsed.query)
+    if parsed.port and parsed.port != {"http": 80, "https": 443}.get(scheme):
+        host = f"{host}:{parsed.port}"
+
+    path = _strip_amp_path(path)
+    if rule and rule.trailing_slash is not None and path != "/":
+        path = path.rstrip("/") + ("/" if rule.trailing_slash else "")
+
+    return urlunparse((scheme, host, path, "", query, ""))
+
+
+def canonical_key(url: str) -> str:
+    """Key shared by the variants of a page: the normalized URL without scheme, www. and trailing slash."""
+    parsed = urlparse(normalize_url(url))
+    host = parsed.netloc[4:] if parsed.netloc.startswith("www.") else parsed.netloc
+    key = host + (parsed.path.rstrip("/") or "/")
+    return key + ("?" + parsed.query if parsed.query else "")
+
+
+def is_short_link(url: str) -> bool:
+    return (urlparse(url).hostname or "").lower() in SHORT_LINK_HOSTS
+
+
+def find_canonical_link(html: str, base_url: str) -> Optional[str]:
+    """The page's <link rel="canonical"> URL, made absolute, or None if it has none."""
+    for tag in CANONICAL_LINK_PATTERN.finditer(html):
+        if not REL_CANONICAL_PATTERN.search(tag.group(0)):
+            continue
+        href = HREF_PATTERN.search(tag.group(0))
+        if href:
+            url = urljoin(base_url, next(group for group in href.groups() if group is not None).strip())
+            return url if url.startswith("http") else None
+    return None
+
+
+class UrlCanonicalizer:
+    """
+    Maps extracted URLs to canonical crawl targets, with a SQLite cache of what it learned.
+
+    Short links are resolved with one request each and the result is kept, so they are never
+    resolved again. rel=canonical links recorded from crawled pages override the rules for
+    every variant of those pages.
+    """
+
+    def __init__(self, path: str = "url_canonical.sqlite", timeout: float = 10.0, max_workers: int = 8):
+        self.path = path
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists resolved_links (
+                url text primary key,
+                resolved_url text not null,
+                error text,
+                resolved_at text not null
+            )
+        """)
+        self.conn.execute("""
+            create table if not exists canonical_links (
+                key text primary key,
+                canonical_url text not null,
+                recorded_at text not null
+            )
+        """)
+        self.conn.commit()
+
+    def _fetch_redirect(self, url: str) -> Tuple[str, str, Optional[str]]:
+        """Follow a short link's redirects. Returns (url, final URL, error)."""
+        try:
+            response = requests.head(url, timeout=self.timeout, allow_redirects=True)
+            if response.status_code in (403, 405) or response.status_code >= 500:
+                # Some shorteners only answer GET
+                response = requests.get(url, timeout=self.timeout, allow_redirects=True, stream=True)
+                response.close()
+            return url, response.url, None
+        except Exception as e:
+            return url, url, f"{type(e).__name__}: {e}"
+
+    def resolve_short_links(self, urls: Iterable[str]) -> Dict[str, str]:
+        """Final URLs of the short links among urls, resolving the ones not seen before in parallel."""
+        short_links = list(dict.fromkeys(url for url in urls if is_short_link(url)))
+        resolved = {}
+        for url in short_links:
+            # Links that failed to resolve are tried again
+            row = self.conn.execute(
+                "select resolved_url from resolved_links where url = ? and error is null", (url,)
+            ).fetchone()
+            if row:
+                resolved[url] = row[0]
+
+        unresolved = [url for url in short_links if url not in resolved]
+        if unresolved:
+            print(f"Resolving {len(unresolved)} short links")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(self._fetch_redirect, unresolved))
+            self.conn.executemany(
+                "insert or replace into resolved_links (url, resolved_url, error, resolved_at) values (?, ?, ?, ?)",
+                [(url, final_url, error, _now()) for url, final_url, error in results]
+            )
+            self.conn.commit()
+            for url, final_url, error in results:
+                if error:
+                    print(f"Could not resolve {url}: {error}")
+                resolved[url] = final_url
+        return resolved
+
+    def record_canonical(self, url: str, canonical_url: str):
+        """Record the rel=canonical link of a crawled page, for every variant of the page."""
+        if urlparse(canonical_url).path in ("", "/"):
+            # Sites that point every page at their home page
+            return
+        canonical_url = normalize_url(canonical_url)
+        now = _now()
+        self.conn.executemany(
+            "insert or replace into canonical_links (key, canonical_url, recorded_at) values (?, ?, ?)",
+            [(canonical_key(url), canonical_url, now), (canonical_key(canonical_url), canonical_url, now)]
+        )
+        self.conn.commit()
+
+    def crawl_target(self, url: str, resolved: Optional[Dict[str, str]] = None) -> str:
+        """The URL to crawl for url (resolved holds the final URLs of short links)."""
+        url = normalize_url((resolved or {}).get(url, url))
+        row = self.conn.execute(
+            "select canonical_url from canonical_links where key = ?", (canonical_key(url),)
+        ).fetchone()
+        return row[0] if row else url
+
+    def collapse(self, urls: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Collapse the variants among urls.
+
+        Returns:
+            The crawl targets, once each, in the order their first variant appears, and
+            the crawl target of every URL.
+        """
+        resolved = self.resolve_short_links(urls)
+        targets_by_key: Dict[str, str] = {}
+        targets = {}
+        for url in urls:
+            target = self.crawl_target(url, resolved)
+            targets[url] = targets_by_key.setdefault(canonical_key(target), target)
+        return list(targets_by_key.values()), targets
+
+    def close(self):
+        self.conn.close()
@@ -4,10 +4,31 @@
 import json
 from datetime import datetime
 import argparse
-from typing import Dict, List, Any, Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Set, TextIO, Tuple, Union
 import os
+import sqlite3
+import tempfile
 from urllib.parse import urlparse, unquote
 
+from extract_url_from_md import is_valid_url
+from url_canonical import domain_rule, identifying_query
+from url_registry import UrlRegistry
+
+# Keys whose values may hold URLs, in the order their URLs are listed
+URL_KEYS = ['url', 'link', 'uri', 'href', 'profileUrl']
+
+# Keys holding free text and post metadata
+METADATA_KEYS = ['text', 'title', 'previewDescription']
+
+# Characters of JSON input read at a time in streaming mode
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Items per unit of work for the extraction process pool
+EXTRACT_BATCH_SIZE = 500
+
 
 def clean_url(url: str) -> str:
     """Clean URL by removing query parameters and unescaping characters."""
@@ -21,9 +42,14 @@ def clean_url(url: str) -> str:
     # Unescape URL-encoded characters
     url = unquote(url)
 
-    # Parse URL and remove query parameters
+    # Parse URL and remove query parameters, except those that identify the page (YouTube's v=)
     parsed = urlparse(url)
     cleaned = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    rule = domain_rule(parsed.netloc.lower())
+    if rule and rule.keep_params and parsed.query:
+        query = identifying_query(parsed.netloc.lower(), parsed.query)
+        if query:
+            cleaned += f"?{query}"
 
     return cleaned.strip()
 
@@ -130,6 +156,25 @@ def find_value_in_dict(obj: Union[Dict, List, Any], key: str) -> List[Any]:
     return results
 
 
+def collect_values(obj: Union[Dict, List, Any], keys: Set[str], found: Dict[str, List[Any]]):
+    """
+    Collect the values of several keys in one walk of a nested structure.
+
+    Appends each value stored under a key in keys to found[key], in the same order
+    find_value_in_dict would return them for that key.
+    """
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if k in keys:
+                found[k].append(v)
+            if isinstance(v, (dict, list)):
+                collect_values(v, keys, found)
+    elif isinstance(obj, list):
+        for item in obj:
+            if isinstance(item, (dict, list)):
+                collect_values(item, keys, found)
+
+
 def find_urls_in_text(text: str) -> List[str]:
     """Extract URLs from text content."""
     if not isinstance(text, str):
@@ -153,26 +198,24 @@ def extract_all_urls(item: Dict[str, Any]) -> tuple[List[Dict[str, Any]], List[D
     # Get post date
     post_date = get_post_date(item)
 
-    # Find all possible URL-containing keys
-    url_keys = ['url', 'link', 'uri', 'href', 'profileUrl']
+    # Walk the item once, collecting every key we need
+    found = {key: [] for key in URL_KEYS + METADATA_KEYS}
+    collect_values(item, set(found), found)
 
     # Collect all URLs from all possible keys
     all_urls = []
-    for key in url_keys:
-        found_urls = find_value_in_dict(item, key)
-        all_urls.extend(found_urls)
+    for key in URL_KEYS:
+        all_urls.extend(found[key])
 
     # Find URLs in text content
-    text_contents = find_value_in_dict(item, 'text')
-    for text in text_contents:
+    for text in found['text']:
         all_urls.extend(find_urls_in_text(text))
 
     # Get metadata
     metadata = {
         'date': post_date,
-        'title': find_value_in_dict(item, 'title')[0] if find_value_in_dict(item, 'title') else None,
-        'description': find_value_in_dict(item, 'previewDescription')[0] if find_value_in_dict(item,
-                                                                                               'previewDescription') else None
+        'title': found['title'][0] if found['title'] else None,
+        'description': found['previewDescription'][0] if found['previewDescription'] else None
     }
 
     # Add profile information to metadata
@@ -202,6 +245,94 @@ def extract_all_urls(item: Dict[str, Any]) -> tuple[List[Dict[str, Any]], List[D
     return facebook_urls, external_urls
 
 
+def image_key(img: Dict[str, Any]) -> Any:
+    """Hashable key that is equal for equal image dicts, for set-based dedup."""
+    try:
+        key = tuple(sorted(img.items()))
+        hash(key)
+        return key
+    except TypeError:
+        # Unhashable values (nested objects in odd exports)
+        return json.dumps(img, sort_keys=True, default=str)
+
+
+def extract_batch(items: List[Any]) -> Tuple[int, Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Extract the URLs of a batch of items, deduplicated within the batch.
+
+    Returns:
+        The number of items and the Facebook and external URLs by URL. Like main()'s dedupe,
+        a URL keeps the position of its first occurrence and the data of its last, so
+        updating one dict with the batches in order gives the serial result.
+    """
+    facebook_urls = {}
+    external_urls = {}
+    for item in items:
+        fb_urls, ext_urls = extract_all_urls(item)
+        for url in fb_urls:
+            facebook_urls[url['url']] = url
+        for url in ext_urls:
+            external_urls[url['url']] = url
+    return len(items), facebook_urls, external_urls
+
+
+def iter_batches(items: Iterable[Any], size: int = EXTRACT_BATCH_SIZE) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def extract_batches(items: Iterable[Any], workers: int = 1) -> Iterator[Tuple[int, Dict, Dict]]:
+    """
+    extract_batch over the items in batches, in order.
+
+    With more than one worker the batches are shared out to a process pool; only a few
+    batches per worker are in flight at a time, so a streamed export is never read
+    further ahead than that.
+    """
+    if workers <= 1:
+        yield from map(extract_batch, iter_batches(items))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in iter_batches(items):
+            pending.append(pool.submit(extract_batch, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def merge_group(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge the items of one post (same timestamp) into one, keeping the cleanest URL."""
+    if len(items) == 1:
+        return items[0]
+
+    # Find the cleanest URL among the items
+    clean_urls = [item for item in items if is_clean_url(item['url'])]
+    if clean_urls:
+        base_item = clean_urls[0]  # Use the first clean URL item as base
+    else:
+        base_item = items[0]  # If no clean URLs, use the first item
+
+    # Merge image information from all items
+    all_images = []
+    seen_images = set()
+    for item in items:
+        if 'images' in item:
+            for img in item['images']:
+                key = image_key(img)
+                if key not in seen_images:  # Avoid duplicate images
+                    seen_images.add(key)
+                    all_images.append(img)
+
+    if all_images:
+        base_item['images'] = all_images
+
+    return base_item
+
+
 def merge_url_items(urls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Merge items that belong to the same post based on timestamp and select the cleanest URL."""
     # Group items by timestamp
@@ -213,33 +344,8 @@ def merge_url_items(urls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                 timestamp_groups[timestamp] = []
             timestamp_groups[timestamp].append(item)
 
-    merged_items = []
-
     # Process each group of items with the same timestamp
-    for timestamp, items in timestamp_groups.items():
-        if len(items) == 1:
-            merged_items.append(items[0])
-            continue
-
-        # Find the cleanest URL among the items
-        clean_urls = [item for item in items if is_clean_url(item['url'])]
-        if clean_urls:
-            base_item = clean_urls[0]  # Use the first clean URL item as base
-        else:
-            base_item = items[0]  # If no clean URLs, use the first item
-
-        # Merge image information from all items
-        all_images = []
-        for item in items:
-            if 'images' in item:
-                for img in item['images']:
-                    if img not in all_images:  # Avoid duplicate images
-                        all_images.append(img)
-
-        if all_images:
-            base_item['images'] = all_images
-
-        merged_items.append(base_item)
+    merged_items = [merge_group(items) for items in timestamp_groups.values()]
 
     # Add any items without timestamps
     undated_items = [item for item in urls if not item.get('date')]
@@ -248,6 +354,46 @@ def merge_url_items(urls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return merged_items
 
 
+def write_header(f: TextIO, is_facebook: bool):
+    if is_facebook:
+        f.write("# Facebook Links (Newest First)\n\n")
+    else:
+        f.write("# External Links (Newest First)\n\n")
+
+
+def write_dated_item(f: TextIO, i: int, item: Dict[str, Any]):
+    f.write(f"{i}. Date: {item['date']}\n")
+    f.write(f"   - URL: {item['url']}\n")
+    if 'Profile' in item:
+        f.write(f"   - Profile: {item['Profile']}\n")
+    if 'ProfileShared' in item:
+        f.write(f"   - ProfileShared: {item['ProfileShared']}\n")
+    if item.get('title'):
+        f.write(f"   - Title: \"{item['title']}\"\n")
+    if item.get('description'):
+        f.write(f"   - Description: \"{item['description']}\"\n")
+
+    # Add image information if present
+    if 'images' in item and item['images']:
+        f.write("   - Images:\n")
+        for img in item['images']:
+            f.write(f"     * Facebook URL: {img['facebook_url']}\n")
+            if img.get('description'):
+                f.write(f"       Description: {img['description']}\n")
+            if img.get('width') and img.get('height'):
+                f.write(f"       Dimensions: {img['width']}x{img['height']}\n")
+    f.write("\n")
+
+
+def write_undated_item(f: TextIO, item: Dict[str, Any]):
+    f.write(f"- {item['url']}")
+    if 'Profile' in item:
+        f.write(f" (Profile: {item['Profile']})")
+    if 'ProfileShared' in item:
+        f.write(f" (ProfileShared: {item['ProfileShared']})")
+    f.write("\n")
+
+
 def write_markdown_file(filename: str, urls: List[Dict[str, Any]], is_facebook: bool):
     """Write extracted URLs to a markdown file."""
     print(f"\nWriting {'Facebook' if is_facebook else 'external'} links to {filename}")
@@ -258,10 +404,7 @@ def write_markdown_file(filename: str, urls: List[Dict[str, Any]], is_facebook:
     print(f"Number of URLs after merging: {len(merged_urls)}")
 
     with open(filename, 'w', encoding='utf-8') as f:
-        if is_facebook:
-            f.write("# Facebook Links (Newest First)\n\n")
-        else:
-            f.write("# External Links (Newest First)\n\n")
+        write_header(f, is_facebook)
 
         # Sort URLs by date (newest first)
         dated_urls = [u for u in merged_urls if u['date']]
@@ -271,46 +414,227 @@ def write_markdown_file(filename: str, urls: List[Dict[str, Any]], is_facebook:
 
         # Write dated URLs
         for i, item in enumerate(dated_urls, 1):
-            f.write(f"{i}. Date: {item['date']}\n")
-            f.write(f"   - URL: {item['url']}\n")
-            if 'Profile' in item:
-                f.write(f"   - Profile: {item['Profile']}\n")
-            if 'ProfileShared' in item:
-                f.write(f"   - ProfileShared: {item['ProfileShared']}\n")
-            if item.get('title'):
-                f.write(f"   - Title: \"{item['title']}\"\n")
-            if item.get('description'):
-                f.write(f"   - Description: \"{item['description']}\"\n")
-
-            # Add image information if present
-            if 'images' in item and item['images']:
-                f.write("   - Images:\n")
-                for img in item['images']:
-                    f.write(f"     * Facebook URL: {img['facebook_url']}\n")
-                    if img.get('description'):
-                        f.write(f"       Description: {img['description']}\n")
-                    if img.get('width') and img.get('height'):
-                        f.write(f"       Dimensions: {img['width']}x{img['height']}\n")
-            f.write("\n")
+            write_dated_item(f, i, item)
 
         # Write undated URLs if any
         if undated_urls:
             f.write("\nAdditional URLs (No Date):\n")
             for item in undated_urls:
-                f.write(f"- {item['url']}")
-                if 'Profile' in item:
-                    f.write(f" (Profile: {item['Profile']})")
-                if 'ProfileShared' in item:
-                    f.write(f" (ProfileShared: {item['ProfileShared']})")
-                f.write("\n")
+                write_undated_item(f, item)
+
+
+def iter_json_items(f: TextIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Yield the items of a top-level JSON array one at a time.
+
+    Only the current item and about one chunk of text are held in memory. A document
+    that isn't an array is yielded as a single item, the way main() treats it.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+
+    def read_more() -> bool:
+        nonlocal buffer, pos
+        chunk = f.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return bool(chunk)
+
+    def skip_whitespace() -> bool:
+        """Advance to the next significant character; False at the end of the input."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+                pos += 1
+            if pos < len(buffer):
+                return True
+            if not read_more():
+                return False
+
+    if not skip_whitespace():
+        raise json.JSONDecodeError("Expecting value", buffer, pos)
+    if buffer[pos] != '[':
+        yield json.loads(buffer[pos:] + f.read())
+        return
+    pos += 1
+
+    expecting_item = True  # after '[' or ','
+    first = True
+    while True:
+        if not skip_whitespace():
+            raise json.JSONDecodeError("Unterminated array", buffer, pos)
+        char = buffer[pos]
+        if char == ']' and (first or not expecting_item):
+            return
+        if not expecting_item:
+            if char != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
+            expecting_item = True
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely the item continues in the next chunk
+            if read_more():
+                continue
+            raise
+        if (type(item) in (int, float) and (end == len(buffer) or buffer[end] in '.eE+-0123456789')
+                and read_more()):
+            # A number cut off at the chunk boundary ("3." of "3.25") decodes cleanly; decode it again whole
+            continue
+        pos = end
+        first = False
+        expecting_item = False
+        yield item
+
+
+class UrlSpool:
+    """
+    On-disk stand-in for main()'s URL lists in streaming mode.
+
+    A URL keeps the position of its first occurrence and the data of its last, like the
+    dict main() deduplicates with, and posts come back grouped by date, newest first, so
+    the markdown written from the spool matches the in-memory path.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        # A scratch file that is deleted afterwards: no journal, no fsync
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                seq INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                date,
+                data TEXT NOT NULL,
+                UNIQUE (kind, url)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS urls_by_date ON urls (kind, date, seq)")
+
+    def add(self, kind: str, urls: List[Dict[str, Any]]):
+        self.conn.executemany(
+            """
+            INSERT INTO urls (kind, url, date, data) VALUES (?, ?, ?, ?)
+            ON CONFLICT (kind, url) DO UPDATE SET date = excluded.date, data = excluded.data
+            """,
+            [(kind, url['url'], url['date'] or None, json.dumps(url)) for url in urls]
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def count(self, kind: str) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM urls WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def merged_count(self, kind: str) -> int:
+        """Number of items after merging: one per distinct date, plus every undated URL."""
+        return self.conn.execute(
+            "SELECT COUNT(DISTINCT date) + COUNT(*) - COUNT(date) FROM urls WHERE kind = ?", (kind,)
+        ).fetchone()[0]
+
+    def iter_dated(self, kind: str) -> Iterator[Dict[str, Any]]:
+        """Merged posts, newest first."""
+        rows = self.conn.execute(
+            "SELECT date, data FROM urls WHERE kind = ? AND date IS NOT NULL ORDER BY date DESC, seq",
+            (kind,)
+        )
+        for _, group in groupby(rows, key=lambda row: row[0]):
+            yield merge_group([json.loads(data) for _, data in group])
+
+    def iter_urls(self, kind: str) -> Iterator[Dict[str, Any]]:
+        """Every URL, unmerged, in order of first occurrence."""
+        for (data,) in self.conn.execute("SELECT data FROM urls WHERE kind = ? ORDER BY seq", (kind,)):
+            yield json.loads(data)
+
+    def iter_undated(self, kind: str) -> Iterator[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT data FROM urls WHERE kind = ? AND date IS NULL ORDER BY seq", (kind,))
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def close(self):
+        self.conn.close()
+
+
+def write_markdown_from_spool(filename: str, spool: UrlSpool, is_facebook: bool):
+    """write_markdown_file for streaming mode: items are read from the spool as they are written."""
+    kind = 'facebook' if is_facebook else 'external'
+    print(f"\nWriting {'Facebook' if is_facebook else 'external'} links to {filename}")
+    print(f"Number of URLs before merging: {spool.count(kind)}")
+    print(f"Number of URLs after merging: {spool.merged_count(kind)}")
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        write_header(f, is_facebook)
+
+        for i, item in enumerate(spool.iter_dated(kind), 1):
+            write_dated_item(f, i, item)
+
+        for i, item in enumerate(spool.iter_undated(kind)):
+            if i == 0:
+                f.write("\nAdditional URLs (No Date):\n")
+            write_undated_item(f, item)
+
+
+def register_urls(registry_path: str, urls: Iterable[Dict[str, Any]], source: str):
+    """Merge the crawlable external URLs of an export into the URL registry."""
+    registry = UrlRegistry(registry_path)
+    try:
+        new = registry.merge((url for url in urls if is_valid_url(url['url'])), source=os.path.basename(source))
+        print(f"\nAdded {new} new URLs to {registry_path}: {registry.summary()}")
+    finally:
+        registry.close()
+
+
+def extract_streaming(input_file: str, output_dir: str, workers: int = 1, registry_path: Optional[str] = None):
+    """
+    Extract the links of a large export without loading it.
+
+    Items are parsed one at a time and their URLs spooled to a scratch SQLite file in
+    output_dir, so memory stays flat however large the export is.
+    """
+    fd, spool_path = tempfile.mkstemp(prefix='.url_extraction_', suffix='.sqlite', dir=output_dir)
+    os.close(fd)
+    spool = UrlSpool(spool_path)
+    try:
+        items = 0
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for count, fb_urls, ext_urls in extract_batches(iter_json_items(f), workers):
+                spool.add('facebook', list(fb_urls.values()))
+                spool.add('external', list(ext_urls.values()))
+                if (items + count) // 10000 > items // 10000:
+                    spool.commit()
+                    print(f"Processed {items + count} items")
+                items += count
+        spool.commit()
+        print(f"Processed {items} items")
+
+        write_markdown_from_spool(os.path.join(output_dir, 'facebook_links.md'), spool, True)
+        write_markdown_from_spool(os.path.join(output_dir, 'external_links.md'), spool, False)
+        if registry_path:
+            register_urls(registry_path, spool.iter_urls('external'), input_file)
+    finally:
+        spool.close()
+        os.remove(spool_path)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Extract Facebook and external links from JSON data')
     parser.add_argument('input_file', help='Input JSON file path')
     parser.add_argument('--output-dir', default='.', help='Output directory for markdown files')
+    parser.add_argument('--stream', action='store_true',
+                        help='Parse the export item by item and spool URLs to disk (for exports of hundreds of MB)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes to extract URLs with (0: one per CPU core)')
+    parser.add_argument('--registry', help='Also merge the crawlable external URLs into this URL registry '
+                                           '(e.g. url_registry.sqlite), for crawl_rimon_docs.py --registry')
 
     args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
 
     try:
         if not os.path.exists(args.input_file):
@@ -318,23 +642,27 @@ def main():
 
         os.makedirs(args.output_dir, exist_ok=True)
 
+        if args.stream:
+            extract_streaming(args.input_file, args.output_dir, workers, args.registry)
+            print("\nProcessing completed successfully!")
+            return
+
         with open(args.input_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
 
         if not isinstance(data, list):
             data = [data]
 
-        facebook_urls = []
-        external_urls = []
+        # Remove duplicates while preserving order
+        facebook_urls = {}
+        external_urls = {}
 
-        for item in data:
-            fb_urls, ext_urls = extract_all_urls(item)
-            facebook_urls.extend(fb_urls)
-            external_urls.extend(ext_urls)
+        for _, fb_urls, ext_urls in extract_batches(data, workers):
+            facebook_urls.update(fb_urls)
+            external_urls.update(ext_urls)
 
-        # Remove duplicates while preserving order
-        facebook_urls = list({url['url']: url for url in facebook_urls}.values())
-        external_urls = list({url['url']: url for url in external_urls}.values())
+        facebook_urls = list(facebook_urls.values())
+        external_urls = list(external_urls.values())
 
         write_markdown_file(
             os.path.join(args.output_dir, 'facebook_links.md'),
@@ -346,6 +674,8 @@ def main():
             external_urls,
             False
         )
+        if args.registry:
+            register_urls(args.registry, external_urls, args.input_file)
 
         print("\nProcessing completed successfully!")
 
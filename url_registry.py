@@ -0,0 +1,225 @@
+# persistent registry of the article URLs found in the Apify exports
+# each new export is merged in (url_extraction.py --registry), recording when a URL was first and
+# last seen and the post that linked to it; the crawler (crawl_rimon_docs.py --registry) records
+# each URL's crawl status here and only pulls URLs it has never processed, or that failed fewer
+# than MAX_CRAWL_ATTEMPTS times
+#
+# usage: python url_registry.py status
+#        python url_registry.py import urls.txt [--status crawled]
+#        python url_registry.py requeue
+
+import argparse
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+# A URL is pending until the crawler has processed it once
+PENDING = "pending"
+# A URL that is crawled under another URL (an AMP, mobile or short-link variant of it)
+VARIANT = "variant"
+STATUSES = [PENDING, "crawled", "skipped", "failed", VARIANT]
+
+# Registry status for the crawl journal stages that end a URL's processing
+STATUS_BY_STAGE = {"stored": "crawled", "skipped": "skipped", "failed": "failed"}
+
+# A failed URL is pulled again until it has failed this many crawls in a row
+MAX_CRAWL_ATTEMPTS = 3
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass
+class RegistryEntry:
+    url: str
+    first_seen: str
+    last_seen: str
+    times_seen: int
+    post_date: Optional[str]
+    title: Optional[str]
+    description: Optional[str]
+    profile: Optional[str]
+    profile_shared: Optional[str]
+    source: Optional[str]
+    status: str
+    status_updated: Optional[str]
+    error: Optional[str]
+    attempts: int
+
+
+class UrlRegistry:
+    """
+    SQLite-backed registry of every URL extracted from the exports and its crawl status.
+
+    Merging an export adds its new URLs as pending and refreshes the last-seen date and post
+    metadata of known ones, without touching their crawl status, so only new URLs are crawled.
+    Failed URLs count their consecutive failures in attempts and are crawled again until they
+    reach the retry cap.
+    """
+
+    def __init__(self, path: str = "url_registry.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("""
+            create table if not exists url_registry (
+                url text primary key,
+                first_seen text not null,
+                last_seen text not null,
+                times_seen integer not null default 1,
+                post_date text,
+                title text,
+                description text,
+                profile text,
+                profile_shared text,
+                source text,
+                status text not null default 'pending',
+                status_updated text,
+                error text,
+                attempts integer not null default 0
+            )
+        """)
+        # Registries created before failed URLs were retried
+        columns = [row[1] for row in self.conn.execute("pragma table_info(url_registry)")]
+        if "attempts" not in columns:
+            self.conn.execute("alter table url_registry add column attempts integer not null default 0")
+            self.conn.execute("update url_registry set attempts = 1 where status = 'failed'")
+        self.conn.execute("create index if not exists url_registry_status on url_registry (status, first_seen)")
+        self.conn.commit()
+
+    def count(self) -> int:
+        return self.conn.execute("select count(*) from url_registry").fetchone()[0]
+
+    def merge(self, urls: Iterable[Dict[str, Any]], source: Optional[str] = None) -> int:
+        """
+        Merge the URLs of an export into the registry.
+
+        Args:
+            urls: URL dicts as produced by url_extraction (url, date, title, description,
+                Profile, ProfileShared), each URL at most once
+            source: Name of the export the URLs came from
+
+        Returns:
+            The number of URLs that were not in the registry before.
+        """
+        before = self.count()
+        now = _now()
+        self.conn.executemany(
+            """
+            insert into url_registry
+                (url, first_seen, last_seen, post_date, title, description, profile, profile_shared, source)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            on conflict (url) do update set
+                last_seen = excluded.last_seen,
+                times_seen = times_seen + 1,
+                post_date = case when excluded.post_date > coalesce(post_date, '')
+                                 then excluded.post_date else post_date end,
+                title = coalesce(excluded.title, title),
+                description = coalesce(excluded.description, description),
+                profile = coalesce(excluded.profile, profile),
+                profile_shared = coalesce(excluded.profile_shared, profile_shared),
+                source = coalesce(excluded.source, source)
+            """,
+            ((item['url'], now, now, item.get('date') or None, item.get('title'), item.get('description'),
+              item.get('Profile'), item.get('ProfileShared'), source) for item in urls)
+        )
+        self.conn.commit()
+        return self.count() - before
+
+    def pending_urls(self, limit: Optional[int] = None, max_attempts: int = MAX_CRAWL_ATTEMPTS) -> List[str]:
+        """
+        URLs to crawl next, oldest first.
+
+        Args:
+            limit: Maximum number of URLs to return
+            max_attempts: Failed URLs are included until they have failed this many times
+
+        Returns:
+            The URLs the crawler has never processed, and the failed URLs still below the retry cap.
+        """
+        rows = self.conn.execute(
+            "select url from url_registry where status = ? or (status = 'failed' and attempts < ?) "
+            "order by first_seen, rowid limit ?",
+            (PENDING, max_attempts, -1 if limit is None else limit)
+        )
+        return [row[0] for row in rows]
+
+    def requeue_failed(self) -> int:
+        """Make every failed URL pending again with a fresh retry budget; returns how many there were."""
+        cursor = self.conn.execute(
+            "update url_registry set status = ?, attempts = 0, status_updated = ? where status = 'failed'",
+            (PENDING, _now())
+        )
+        self.conn.commit()
+        return cursor.rowcount
+
+    def mark(self, url: str, status: str, error: Optional[str] = None):
+        """Record the outcome of crawling a URL (added to the registry if it isn't there yet)."""
+        now = _now()
+        self.conn.execute(
+            """
+            insert into url_registry (url, first_seen, last_seen, status, status_updated, error, attempts)
+            values (?, ?, ?, ?, ?, ?, ?)
+            on conflict (url) do update set
+                status = excluded.status, status_updated = excluded.status_updated, error = excluded.error,
+                attempts = case when excluded.status = 'failed' then attempts + 1 else 0 end
+            """,
+            (url, now, now, status, now, error, 1 if status == "failed" else 0)
+        )
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[RegistryEntry]:
+        row = self.conn.execute(
+            "select url, first_seen, last_seen, times_seen, post_date, title, description, profile, "
+            "profile_shared, source, status, status_updated, error, attempts from url_registry where url = ?",
+            (url,)
+        ).fetchone()
+        return RegistryEntry(*row) if row else None
+
+    def summary(self) -> Dict[str, int]:
+        """Number of URLs in each status."""
+        rows = self.conn.execute("select status, count(*) from url_registry group by status")
+        return dict(rows.fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def read_url_file(path: str) -> List[str]:
+    """URLs of a urls.txt file (one per line, optionally quoted)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip().strip('"') for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or seed the URL registry')
+    parser.add_argument('--registry', default='url_registry.sqlite', help='Registry database path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Number of URLs in each crawl status')
+    import_parser = subparsers.add_parser('import', help='Add the URLs of a urls.txt file')
+    import_parser.add_argument('url_file', help='File with one URL per line')
+    import_parser.add_argument('--status', choices=STATUSES, default=PENDING,
+                               help='Status to give the imported URLs (crawled: they are already indexed)')
+    subparsers.add_parser('requeue', help='Make failed URLs pending again, including those past the retry cap')
+    args = parser.parse_args()
+
+    registry = UrlRegistry(args.registry)
+    try:
+        if args.command == 'import':
+            urls = read_url_file(args.url_file)
+            new = registry.merge(({'url': url} for url in urls), source=args.url_file)
+            if args.status != PENDING:
+                for url in urls:
+                    registry.mark(url, args.status)
+            print(f"Imported {len(urls)} URLs from {args.url_file} ({new} new)")
+        elif args.command == 'requeue':
+            print(f"Re-queued {registry.requeue_failed()} failed URLs")
+        print(f"{registry.count()} URLs: {registry.summary()}")
+    finally:
+        registry.close()
+
+
+if __name__ == "__main__":
+    main()